@@ -101,6 +101,27 @@ DATABASES = {
     }
 }
 
+REDIS_HOST = os.getenv('REDIS_HOST')
+REDIS_PORT = os.getenv('REDIS_PORT', '6379')
+
+# Общий кэш нужен, когда процессов несколько: версии данных и счётчики живут в нём.
+if REDIS_HOST:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}',
+        }
+    }
+
+# События чатов и уведомлений для WebSocket (services/realtime.py): с Redis доходят
+# до соединений во всех процессах, без него — только внутри процесса.
+REALTIME_BROKER = {'BACKEND': 'services.realtime.InMemoryBroker'}
+if REDIS_HOST:
+    REALTIME_BROKER = {
+        'BACKEND': 'services.realtime.RedisBroker',
+        'OPTIONS': {'url': f'redis://{REDIS_HOST}:{REDIS_PORT}'},
+    }
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.postgresql',
@@ -178,6 +199,11 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+
+    'DEFAULT_THROTTLE_RATES': {
+        # Нажатия «связаться» (ServiceViewSet.contact) с одного пользователя или IP.
+        'service_contact': '60/hour',
+    },
 }
 
 
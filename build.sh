@@ -4,6 +4,11 @@ pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
 python manage.py migrate
+# Если НБКР недоступен, остаются курсы из базы (стартовые задаёт миграция 0021).
+python manage.py update_exchange_rates --all || echo 'Курсы не обновлены'
+python manage.py rebuild_search_index --only-missing
+python manage.py build_similar_services
+python manage.py build_recommendations
 if [[ $CREATE_SUPERUSER ]];
 then
   python manage.py createsuperuser --no-input --email "$DJANGO_SUPERUSER_EMAIL"
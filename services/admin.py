@@ -10,4 +10,5 @@ admin.site.register(UserSettings)
 admin.site.register(Message)
 admin.site.register(Chat)
 admin.site.register(ServicePhoto)
-admin.site.register(SearchHistory)
\ No newline at end of file
+admin.site.register(SearchHistory)
+admin.site.register(ExchangeRate)
@@ -0,0 +1,73 @@
+import atexit
+import logging
+import threading
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessBuffer:
+    """
+    Накопитель записей в памяти процесса. add() только меняет словарь под
+    замком, запись в базу делает flush(items) в фоновом потоке: раз в interval
+    секунд, сразу после max_size добавлений и при выходе процесса.
+    Повторный ключ сливается с накопленным значением функцией merge.
+    Если flush упал, записи возвращаются в буфер до следующей попытки.
+    """
+
+    def __init__(self, flush, interval, max_size, merge):
+        self._flush = flush
+        self.interval = interval
+        self.max_size = max_size
+        self._merge = merge
+        self._items = {}
+        self._added = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, key, value):
+        with self._lock:
+            if key in self._items:
+                self._items[key] = self._merge(self._items[key], value)
+            else:
+                self._items[key] = value
+            self._added += 1
+            full = self._added >= self.max_size
+            if self._thread is None:
+                self._start()
+        if full:
+            self._wake.set()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+    def take(self):
+        with self._lock:
+            items, self._items, self._added = self._items, {}, 0
+        return items
+
+    def flush(self):
+        items = self.take()
+        if not items:
+            return
+        try:
+            self._flush(items)
+        except Exception:
+            logger.exception('Не удалось записать буфер, записи вернутся в следующую попытку')
+            with self._lock:
+                for key, value in items.items():
+                    current = self._items.get(key)
+                    self._items[key] = value if current is None else self._merge(value, current)
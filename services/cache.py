@@ -0,0 +1,50 @@
+"""
+Версии данных в общем кэше.
+
+Версия — число, которое увеличивается при каждом изменении набора данных
+(например, всех услуг). Ключи производных кэшей включают версию, поэтому
+инвалидация — это один incr, а старые записи просто истекают по таймауту.
+Если версия пропала из кэша (вытеснение, рестарт), она заново
+инициализируется текущим временем и гарантированно не совпадёт с прежней.
+"""
+import time
+
+from django.core.cache import cache
+
+VERSION_TIMEOUT = None
+
+# Растёт при любом изменении услуг, их подкатегорий и таксономии.
+CATALOG_VERSION = 'services'
+
+# Растёт при изменении категорий и подкатегорий (дерево /categories/tree/).
+TAXONOMY_VERSION = 'taxonomy'
+
+# Растёт после каждого пересчёта рекомендаций (build_recommendations).
+RECOMMENDATIONS_VERSION = 'recommendations'
+
+# Растёт после каждого шага почасовой свёртки поиска (популярные запросы).
+TRENDING_VERSION = 'trending'
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def _initial():
+    return time.time_ns() // 1000
+
+
+def get_version(name):
+    version = cache.get(_key(name))
+    if version is None:
+        cache.add(_key(name), _initial(), VERSION_TIMEOUT)
+        version = cache.get(_key(name))
+    return version
+
+
+def bump_version(name):
+    try:
+        return cache.incr(_key(name))
+    except ValueError:
+        cache.set(_key(name), _initial(), VERSION_TIMEOUT)
+        return get_version(name)
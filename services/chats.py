@@ -0,0 +1,58 @@
+"""
+Денормализованное состояние чатов для «Входящих».
+
+Chat.last_message — последнее сообщение (превью), ChatParticipant.last_message_at —
+время последней активности чата в строке каждого участника: так список чатов
+пользователя читается по индексу (user, -last_message_at, -id) страницей,
+без сообщений и сортировки всех чатов. Поддерживается сигналами Message.
+
+Сообщения чата отдаются страницами по id (индекс (chat, id)): after_id —
+новее известного, before_id — старее (подгрузка истории). changed_chats —
+какие чаты изменились с момента since, одним запросом по тому же индексу
+«Входящих»: клиент после возврата в приложение догружает только их.
+"""
+from .models import Chat, ChatParticipant, Message
+
+PREVIEW_LENGTH = 100
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_PAGE_SIZE_MAX = 100
+UPDATES_LIMIT = 200
+
+
+def message_posted(message):
+    Chat.objects.filter(pk=message.chat_id).update(last_message=message)
+    ChatParticipant.objects.filter(chat_id=message.chat_id, last_message_at__lt=message.created_at).update(
+        last_message_at=message.created_at,
+    )
+
+
+def message_removed(chat_id):
+    # Время активности не откатываем: чат остаётся на своём месте во «Входящих».
+    latest = Message.objects.filter(chat_id=chat_id).order_by('-id').values_list('pk', flat=True).first()
+    Chat.objects.filter(pk=chat_id).update(last_message=latest)
+
+
+def message_page(chat_id, after_id=None, before_id=None, limit=MESSAGES_PAGE_SIZE):
+    """(сообщения по возрастанию id, есть ли ещё) — после after_id, до before_id или последние."""
+    messages = Message.objects.filter(chat_id=chat_id).select_related('sender')
+    if after_id is not None:
+        rows = list(messages.filter(pk__gt=after_id).order_by('id')[:limit + 1])
+        return rows[:limit], len(rows) > limit
+    if before_id is not None:
+        messages = messages.filter(pk__lt=before_id)
+    rows = list(messages.order_by('-id')[:limit + 1])
+    return rows[:limit][::-1], len(rows) > limit
+
+
+def changed_chats(user, since, limit=UPDATES_LIMIT):
+    """(чаты пользователя с активностью после since, есть ли ещё) — новые первыми."""
+    rows = list(
+        ChatParticipant.objects.filter(user=user, last_message_at__gt=since)
+        .order_by('-last_message_at', '-id')
+        .values('chat_id', 'chat__last_message_id', 'last_message_at')[:limit + 1]
+    )
+    chats = [
+        {'id': row['chat_id'], 'last_message_id': row['chat__last_message_id'], 'last_message_at': row['last_message_at']}
+        for row in rows[:limit]
+    ]
+    return chats, len(rows) > limit
@@ -0,0 +1,90 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для ViewSet.
+
+Валидатор считается одним лёгким запросом, без сериализации ответа:
+для списка — max(updated_at) и count по отфильтрованной выборке,
+для объекта — значения conditional_fields этой строки. В ETag входит и
+полный адрес запроса (страница, ?fields=, хост для абсолютных ссылок на фото).
+Если клиент прислал совпадающий If-None-Match (или If-Modified-Since без
+него), отвечаем 304 и тело не собираем вовсе.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+class ConditionalGetMixin:
+    # Действия, для которых отдаются валидаторы.
+    conditional_actions = ('list', 'retrieve')
+    # Поле, max() которого даёт Last-Modified.
+    last_modified_field = 'updated_at'
+    # Поля объекта, от которых зависит его представление (для retrieve).
+    conditional_fields = ('updated_at',)
+    # Ответ зависит от пользователя: ETag учитывает его, Cache-Control — private.
+    conditional_per_user = False
+
+    def get_etag_extra(self, request):
+        """Дополнительные части ETag, например состояние, зависящее от пользователя."""
+        return ()
+
+    def get_validators(self, request):
+        """(etag, last_modified) или None, если объекта нет — тогда ответит обычный обработчик."""
+        queryset = self.get_queryset()
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                row = (
+                    queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+                    .values(*self.conditional_fields).first()
+                )
+            except (TypeError, ValueError, ValidationError):
+                row = None
+            if row is None:
+                return None
+            last_modified = row[self.last_modified_field]
+            parts = tuple(row.values())
+        else:
+            row = self.filter_queryset(queryset).aggregate(
+                last_modified=Max(self.last_modified_field), count=Count('pk'),
+            )
+            last_modified = row['last_modified']
+            parts = (last_modified, row['count'])
+        user = request.user.pk if self.conditional_per_user else None
+        etag = make_etag(request.build_absolute_uri(), user, *parts, *self.get_etag_extra(request))
+        return etag, (last_modified.timestamp() if last_modified else None)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+        validators = self.get_validators(request)
+        if validators is None:
+            return handler(request, *args, **kwargs)
+        etag, last_modified = validators
+        response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Без no-cache браузер по Last-Modified сам решит, что ответ свежий, и не спросит сервер.
+        if self.conditional_per_user:
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization', 'Cookie'])
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
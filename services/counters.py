@@ -0,0 +1,105 @@
+"""
+Счётчики просмотров и контактов услуг и популярность на их основе.
+
+Запрос карточки только увеличивает счётчик в памяти процесса (ProcessBuffer);
+фоновый поток раз в FLUSH_INTERVAL секунд прибавляет накопленное к строкам
+ServiceStat за день через F(), одна UPDATE на услугу.
+
+Популярность — сумма дневных событий с экспоненциальным затуханием:
+popularity = Σ (views + CONTACT_WEIGHT · contacts) · 0.5 ^ (возраст в днях / HALF_LIFE_DAYS).
+Её пересчитывает команда recompute_popularity (по расписанию) и пишет
+в индексированное поле Service.popularity — по нему сортируется каталог.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .buffers import ProcessBuffer
+from .models import Service, ServiceStat
+
+VIEWS = 'views'
+CONTACTS = 'contacts'
+
+FLUSH_INTERVAL = 30
+FLUSH_SIZE = 1000
+# Повторный контакт того же посетителя с услугой в этом окне не засчитывается.
+CONTACT_WINDOW = 60 * 60
+
+CONTACT_WEIGHT = 5.0
+HALF_LIFE_DAYS = 7.0
+WINDOW_DAYS = 90
+
+
+def write_counts(items):
+    """items: {(service_id, date, поле): приращение}"""
+    rows = defaultdict(dict)
+    for (service_id, date, field), amount in items.items():
+        rows[service_id, date][field] = amount
+    existing = set(Service.objects.filter(pk__in={service_id for service_id, _ in rows}).values_list('pk', flat=True))
+    with transaction.atomic():
+        for (service_id, date), counts in rows.items():
+            if service_id not in existing:
+                continue
+            increments = {field: F(field) + amount for field, amount in counts.items()}
+            if ServiceStat.objects.filter(service_id=service_id, date=date).update(**increments):
+                continue
+            try:
+                with transaction.atomic():
+                    ServiceStat.objects.create(service_id=service_id, date=date, **counts)
+            except IntegrityError:
+                # Строку за этот день только что создал другой процесс.
+                ServiceStat.objects.filter(service_id=service_id, date=date).update(**increments)
+
+
+_buffer = ProcessBuffer(write_counts, FLUSH_INTERVAL, FLUSH_SIZE, merge=lambda a, b: a + b)
+
+
+def record(service_id, field):
+    _buffer.add((service_id, timezone.localdate(), field), 1)
+
+
+def record_once(service_id, field, visitor, window=CONTACT_WINDOW):
+    """Засчитывает событие посетителя (пользователь или IP) не чаще раза в window секунд; True, если засчитано."""
+    if not cache.add(f'counted:{field}:{service_id}:{visitor}', 1, window):
+        return False
+    record(service_id, field)
+    return True
+
+
+def flush():
+    _buffer.flush()
+
+
+def decayed_score(views, contacts, age_days, half_life_days=HALF_LIFE_DAYS):
+    return (views + CONTACT_WEIGHT * contacts) * math.pow(0.5, age_days / half_life_days)
+
+
+def recompute_popularity(half_life_days=HALF_LIFE_DAYS, window_days=WINDOW_DAYS):
+    """
+    Пересчитывает Service.popularity по ServiceStat за window_days и удаляет
+    более старую статистику. Возвращает число изменённых услуг.
+    """
+    today = timezone.localdate()
+    since = today - timedelta(days=window_days)
+    scores = defaultdict(float)
+    rows = ServiceStat.objects.filter(date__gt=since).values_list('service_id', 'date', 'views', 'contacts')
+    for service_id, date, views, contacts in rows.iterator():
+        scores[service_id] += decayed_score(views, contacts, (today - date).days, half_life_days)
+
+    now = timezone.now()
+    changed = []
+    for service in Service.objects.only('pk', 'popularity', 'updated_at').iterator():
+        popularity = round(scores.get(service.pk, 0.0))
+        if popularity != service.popularity:
+            # updated_at сдвигаем, чтобы устарели кэшированные фрагменты и ETag карточки.
+            service.popularity, service.updated_at = popularity, now
+            changed.append(service)
+    with transaction.atomic():
+        Service.objects.bulk_update(changed, ['popularity', 'updated_at'], batch_size=500)
+        ServiceStat.objects.filter(date__lte=since).delete()
+    return len(changed)
@@ -0,0 +1,98 @@
+"""
+Цена услуги в сомах для фильтров и сортировки по цене.
+
+Курсы валют хранятся в таблице ExchangeRate (сомов за единицу валюты) и
+обновляются командой update_exchange_rates — с сайта НБКР или вручную.
+Service.price_som = price × курс валюты услуги считается при сохранении
+услуги, а при смене курса — пересчитывается для всех услуг в этой валюте
+пачками UPDATE по диапазонам id (renormalize), без пересчёта в запросах;
+updated_at при этом сдвигается, чтобы сбросить ETag и кэш фрагментов услуги.
+Стартовые курсы задаёт миграция 0021, при деплое они обновляются с сайта НБКР.
+Если курса валюты нет, price_som пустой и услуга не попадает в фильтр цены.
+"""
+import xml.etree.ElementTree as ElementTree
+from decimal import Decimal, InvalidOperation
+from urllib.request import urlopen
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Min, Value
+from django.db.models.functions import Now
+
+from .cache import CATALOG_VERSION, bump_version
+from .models import ExchangeRate, Service
+
+BASE_CURRENCY = 'SOM'
+RENORMALIZE_BATCH_SIZE = 5000
+PRICE_SOM_PLACES = Decimal('0.01')
+RATE_PLACES = Decimal('0.000001')
+
+NBKR_DAILY_URL = 'https://www.nbkr.kg/XML/daily.xml'
+FETCH_TIMEOUT = 10
+
+
+def get_rates():
+    rates = dict(ExchangeRate.objects.values_list('currency', 'rate'))
+    rates[BASE_CURRENCY] = Decimal(1)
+    return rates
+
+
+def to_som(price, currency, rates):
+    rate = rates.get(currency)
+    if price is None or rate is None:
+        return None
+    return (Decimal(price) * rate).quantize(PRICE_SOM_PLACES)
+
+
+def renormalize(currencies=None, batch_size=RENORMALIZE_BATCH_SIZE):
+    """Пересчитывает price_som услуг в currencies (по умолчанию во всех валютах). Возвращает число строк."""
+    rates = get_rates()
+    services = Service.objects.all()
+    if currencies is not None:
+        services = services.filter(currency__in=currencies)
+    bounds = services.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    updated = 0
+    for currency in currencies if currencies is not None else [code for code, _ in Service.CURRENCY_CHOICES]:
+        rate = rates.get(currency)
+        price_som = None if rate is None else ExpressionWrapper(
+            F('price') * Value(rate), output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            updated += Service.objects.filter(
+                currency=currency, pk__gte=start, pk__lt=start + batch_size,
+            ).update(price_som=price_som, updated_at=Now())
+    bump_version(CATALOG_VERSION)
+    return updated
+
+
+def fetch_rates(url=NBKR_DAILY_URL):
+    """Официальные курсы НБКР: {код валюты: сомов за единицу}."""
+    with urlopen(url, timeout=FETCH_TIMEOUT) as response:
+        root = ElementTree.fromstring(response.read())
+    rates = {}
+    for node in root.iter('Currency'):
+        try:
+            nominal = Decimal(node.findtext('Nominal', '1').replace(',', '.'))
+            value = Decimal(node.findtext('Value', '').replace(',', '.'))
+        except InvalidOperation:
+            continue
+        rates[node.get('ISOCode')] = value / nominal
+    return rates
+
+
+def set_rates(rates):
+    """Сохраняет курсы известных валют; изменённые пересчитываются сигналом. Возвращает изменённые коды."""
+    changed = []
+    for currency, _ in Service.CURRENCY_CHOICES:
+        rate = rates.get(currency)
+        if currency == BASE_CURRENCY or rate is None:
+            continue
+        rate = Decimal(rate).quantize(RATE_PLACES)
+        current = ExchangeRate.objects.filter(currency=currency).first()
+        if current is not None and current.rate == rate:
+            continue
+        current = current or ExchangeRate(currency=currency)
+        current.rate = rate
+        current.save()
+        changed.append(currency)
+    return changed
@@ -0,0 +1,143 @@
+"""
+Счётчики для экрана фильтров каталога.
+
+Каждый фасет считается одним GROUP BY-запросом по выборке со всеми фильтрами,
+кроме его собственного: так в списке категорий видно, сколько услуг найдётся
+при выборе соседней категории. Фильтры те же, что у списка услуг, включая
+геофильтр (?lat=&lon=&radius_km=) и поиск с исправлением опечаток, как
+в ServiceSearchFilter. Результат кэшируется по нормализованному набору
+параметров и версии каталога, которая растёт при любом изменении услуг.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django_filters.utils import translate_validation
+
+from .cache import CATALOG_VERSION, get_version
+from .filters import ServiceFilter, ServiceGeoFilter, ServiceSearchFilter
+from .models import Service
+from .search import fold, search_services
+
+FACETS_CACHE_TIMEOUT = 10 * 60
+
+# Диапазоны цен в сомах для фильтра: (от, до), верхняя граница не включается.
+PRICE_RANGES = [
+    (0, 500),
+    (500, 1000),
+    (1000, 3000),
+    (3000, 10000),
+    (10000, None),
+]
+
+GEO_PARAMS = ('lat', 'lon', 'radius_km')
+
+
+def normalize_params(query_params):
+    params = {}
+    for name in [*ServiceFilter.base_filters, *GEO_PARAMS]:
+        value = query_params.get(name, '').strip()
+        if value:
+            params[name] = value
+    search = ' '.join(fold(query_params.get('search', '')).split())
+    if search:
+        params['search'] = search
+    return params
+
+
+def _filtered(request, view, params, *exclude):
+    data = {name: value for name, value in params.items() if name not in exclude and name in ServiceFilter.base_filters}
+    filterset = ServiceFilter(data, queryset=Service.objects.all())
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    # Геофильтр читает lat/lon/radius_km из запроса; собственного фасета у него нет.
+    queryset = ServiceGeoFilter().filter_queryset(request, filterset.qs, view)
+    if params.get('search'):
+        queryset = search_services(queryset, params['search'])
+    return queryset
+
+
+def _search_query(request, view, params):
+    """Запрос, по которому ищет список: исправленный, если по исходному ничего не нашлось."""
+    without_search = {name: value for name, value in params.items() if name != 'search'}
+    ServiceSearchFilter().filter_queryset(request, _filtered(request, view, without_search), view)
+    return getattr(request, 'search_suggestion', None) or params['search']
+
+
+def _price_condition(low, high):
+    condition = Q(price_som__gte=low)
+    if high is not None:
+        condition &= Q(price_som__lt=high)
+    return condition
+
+
+def compute_facets(request, view, params):
+    total = _filtered(request, view, params).aggregate(total=Count('id', distinct=True))['total']
+
+    categories = (
+        _filtered(request, view, params, 'category')
+        .filter(category__isnull=False)
+        .values('category', 'category__name')
+        .annotate(count=Count('id', distinct=True))
+        .order_by('-count', 'category')
+    )
+    subcategories = (
+        _filtered(request, view, params, 'subcategory')
+        .filter(subcategories__isnull=False)
+        .values('subcategories', 'subcategories__name', 'subcategories__category')
+        .annotate(count=Count('id', distinct=True))
+        .order_by('-count', 'subcategories')
+    )
+    experience_labels = dict(Service.EXPERIENCE_CHOICES)
+    experience = (
+        _filtered(request, view, params, 'experience')
+        .values('experience')
+        .annotate(count=Count('id', distinct=True))
+        .order_by('experience')
+    )
+    price_counts = _filtered(request, view, params, 'min_price', 'max_price').aggregate(
+        negotiable=Count('id', filter=Q(price__isnull=True), distinct=True),
+        **{
+            f'range_{index}': Count('id', filter=_price_condition(low, high), distinct=True)
+            for index, (low, high) in enumerate(PRICE_RANGES)
+        },
+    )
+
+    return {
+        'total': total,
+        'categories': [
+            {'id': row['category'], 'name': row['category__name'], 'count': row['count']}
+            for row in categories
+        ],
+        'subcategories': [
+            {
+                'id': row['subcategories'],
+                'name': row['subcategories__name'],
+                'category': row['subcategories__category'],
+                'count': row['count'],
+            }
+            for row in subcategories
+        ],
+        'experience': [
+            {'value': row['experience'], 'label': experience_labels.get(row['experience']), 'count': row['count']}
+            for row in experience
+        ],
+        'price_ranges': [
+            {'min': low, 'max': high, 'count': price_counts[f'range_{index}']}
+            for index, (low, high) in enumerate(PRICE_RANGES)
+        ] + [{'min': None, 'max': None, 'count': price_counts['negotiable']}],
+    }
+
+
+def get_facets(request, view):
+    params = normalize_params(request.query_params)
+    digest = hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    key = f'facets:{get_version(CATALOG_VERSION)}:{digest}'
+    facets = cache.get(key)
+    if facets is None:
+        if params.get('search'):
+            params['search'] = _search_query(request, view, params)
+        facets = compute_facets(request, view, params)
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
@@ -0,0 +1,140 @@
+"""
+Быстрое чтение для ServiceListSerializer и FavoriteListSerializer.
+
+Собирает то же представление, что и DRF, но без обхода полей сериализатора:
+колонки услуги берутся из строки (values() или __dict__ модели), а исполнители,
+фото и подкатегории подгружаются тремя пакетными values()-запросами на всю
+страницу. Скалярные значения (цена, даты) приводятся теми же полями DRF,
+поэтому JSON совпадает байт в байт — это проверяют тесты в services/tests.py.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from rest_framework import serializers
+
+from .models import Service, ServicePhoto, SubCategory
+
+User = get_user_model()
+
+_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+_datetime = serializers.DateTimeField()
+_photo_storage = ServicePhoto._meta.get_field('photo').storage
+
+# Атрибуты, которые get_executor берёт через getattr(user, ..., None).
+_EXECUTOR_OPTIONAL = [name for name in ('role', 'avatar', 'phone_number', 'email') if hasattr(User, name)]
+
+
+def service_row(obj):
+    """Строка услуги в формате values(): имена колонок, без связанных объектов."""
+    return obj.__dict__
+
+
+def _executors(executor_ids):
+    rows = User.objects.filter(pk__in=executor_ids).values('id', 'username', 'first_name', 'last_name', *_EXECUTOR_OPTIONAL)
+    executors = {}
+    for row in rows:
+        full_name = f"{row['first_name']} {row['last_name']}".strip() or None
+        executors[row['id']] = {
+            'id': row['id'],
+            'username': row['username'],
+            'full_name': full_name,
+            'role': row.get('role'),
+            'avatar': row.get('avatar'),
+            'phone_number': row.get('phone_number'),
+            'email': row.get('email'),
+        }
+    return executors
+
+
+def _photos(service_ids, request):
+    photos = {pk: [] for pk in service_ids}
+    for row in ServicePhoto.objects.filter(service__in=service_ids).values('id', 'service_id', 'photo'):
+        url = None
+        if row['photo']:
+            url = _photo_storage.url(row['photo'])
+            if request is not None:
+                url = request.build_absolute_uri(url)
+        photos[row['service_id']].append({'id': row['id'], 'photo': url})
+    return photos
+
+
+def _subcategories(service_ids):
+    subcategories = {pk: [] for pk in service_ids}
+    rows = (
+        SubCategory.objects.filter(services__in=service_ids)
+        .annotate(service_id=F('services__id'))
+        .values('service_id', 'id', 'category_id', 'name', 'description', 'created_at')
+    )
+    for row in rows:
+        subcategories[row['service_id']].append({
+            'id': row['id'],
+            'category': row['category_id'],
+            'name': row['name'],
+            'description': row['description'],
+            'created_at': _datetime.to_representation(row['created_at']),
+        })
+    return subcategories
+
+
+# Связи, за которыми render_services ходит отдельными запросами.
+RELATIONS = ('executor', 'subcategories', 'photos')
+
+
+def render_services(rows, request=None, relations=RELATIONS):
+    """
+    Список представлений услуг в формате ServiceListSerializer (без полей, зависящих от пользователя).
+    Связи не из relations не запрашиваются, и их ключей в представлении нет.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    service_ids = [row['id'] for row in rows]
+    related = {}
+    if 'executor' in relations:
+        executors = _executors({row['executor_id'] for row in rows})
+        related['executor'] = {row['id']: executors.get(row['executor_id']) for row in rows}
+    if 'subcategories' in relations:
+        related['subcategories'] = _subcategories(service_ids)
+    if 'photos' in relations:
+        related['photos'] = _photos(service_ids, request)
+    rendered = []
+    for row in rows:
+        fragment = {
+            'id': row['id'],
+            'executor': None,
+            'title': row['title'],
+            'category': row['category_id'],
+            'subcategories': None,
+            'price': _price.to_representation(row['price']) if row['price'] is not None else None,
+            'experience': row['experience'],
+            'phone_number': row['phone_number'],
+            'popularity': int(row['popularity']),
+            'created_at': _datetime.to_representation(row['created_at']),
+            'photos': None,
+            'currency': row['currency'],
+            'average_rating': float(row['average_rating']),
+            'review_count': int(row['review_count']),
+        }
+        for name in RELATIONS:
+            if name in related:
+                fragment[name] = related[name][row['id']]
+            else:
+                del fragment[name]
+        rendered.append(fragment)
+    return rendered
+
+
+def service_rows(queryset):
+    """values()-строки услуг для render_services."""
+    return queryset.values(*(field.attname for field in Service._meta.concrete_fields))
+
+
+def render_favorites(favorites, services):
+    """Представления FavoriteListSerializer; services — уже готовые представления услуг по порядку."""
+    return [
+        {
+            'id': favorite.pk,
+            'service': service,
+            'created_at': _datetime.to_representation(favorite.created_at),
+        }
+        for favorite, service in zip(favorites, services)
+    ]
@@ -0,0 +1,47 @@
+"""
+Признак is_favorited для сериализаторов услуг.
+
+Избранное хранится в двух местах: user.favorites (кнопка на карточке,
+ServiceViewSet.add_favorite) и модель Favorite (/api/favorites/); услуга
+в избранном, если она есть хотя бы в одном из них.
+
+FavoriteResolver живёт в пределах запроса: prime() одним запросом узнаёт
+состояние для всех услуг страницы, дальше is_favorited() — поиск в множестве.
+"""
+from django.contrib.auth import get_user_model
+
+from .models import Favorite
+
+
+class FavoriteResolver:
+    def __init__(self, user):
+        self.user = user
+        self.checked = set()
+        self.favorited = set()
+
+    def prime(self, service_ids):
+        service_ids = set(service_ids) - self.checked
+        if not service_ids or self.user.is_anonymous:
+            return
+        through = get_user_model().favorites.through
+        marked = through.objects.filter(user=self.user, service_id__in=service_ids).values_list('service_id')
+        saved = Favorite.objects.filter(user=self.user, service_id__in=service_ids).values_list('service_id')
+        self.favorited.update(service_id for service_id, in marked.union(saved))
+        self.checked |= service_ids
+
+    def is_favorited(self, service_id):
+        if self.user.is_anonymous:
+            return False
+        if service_id not in self.checked:
+            self.prime([service_id])
+        return service_id in self.favorited
+
+
+def get_favorite_resolver(request):
+    """Резолвер текущего запроса (создаётся при первом обращении); None вне запроса."""
+    if getattr(request, 'user', None) is None:
+        return None
+    resolver = getattr(request, '_favorite_resolver', None)
+    if resolver is None:
+        resolver = request._favorite_resolver = FavoriteResolver(request.user)
+    return resolver
@@ -0,0 +1,135 @@
+"""
+Выборочные поля и раскрытие связей: ?fields= и ?expand=.
+
+?fields=id,title,price,photos — оставить в ответе только перечисленные поля;
+вложенные поля задаются через точку: ?fields=id,service.title,service.price.
+?expand=category — отдать связь объектом вместо id (только поля из
+expandable_fields сериализатора), тоже с точкой: ?expand=service.category.
+
+Неизвестные имена в ?fields= — ошибка 400 с их списком.
+Без параметров ответ не меняется. Представление по тем же деревьям решает,
+какие связи вообще подгружать (is_requested / is_expanded), так что
+ненужные select_related/prefetch_related не выполняются.
+"""
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+
+
+def parse_paths(value):
+    """'id,service.title,service.price' -> {'id': {}, 'service': {'title': {}, 'price': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if not part:
+                break
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _unknown_paths(field, tree, prefix):
+    """Пути из tree, которых нет у поля без выбора полей (вложенное дерево ему не сужается)."""
+    known = getattr(field, 'fields', {})
+    invalid = []
+    for name, subtree in tree.items():
+        if name not in known:
+            invalid.append(prefix + name)
+        elif subtree:
+            invalid += _unknown_paths(getattr(known[name], 'child', known[name]), subtree, f'{prefix}{name}.')
+    return invalid
+
+
+class DynamicFieldsMixin:
+    """
+    Сериализатор принимает fields (дерево полей или None — все поля) и expand
+    (дерево раскрываемых связей). Вложенным сериализаторам с этим же миксином
+    передаются соответствующие поддеревья.
+    """
+    # имя поля -> класс сериализатора, которым связь отдаётся при раскрытии
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.restricted = False
+        self.expanded = set()
+        if fields is not None or expand:
+            invalid = self.apply_fieldset(fields, expand)
+            if invalid:
+                raise ValidationError({'fields': [f'Неизвестные поля: {", ".join(invalid)}']})
+
+    def apply_fieldset(self, fields=None, expand=None, prefix=''):
+        """Оставляет и раскрывает поля по деревьям; возвращает неизвестные пути из fields."""
+        expand = expand or {}
+        invalid = []
+        if fields is not None:
+            invalid += [prefix + name for name in fields if name not in self.fields]
+            for name in [name for name in self.fields if name not in fields]:
+                self.fields.pop(name)
+            self.restricted = True
+        for name in list(self.fields):
+            nested_fields = (fields or {}).get(name) or None
+            nested_expand = expand.get(name)
+            if name in expand and name in self.expandable_fields:
+                self.fields[name], nested_invalid = self.expand_field(
+                    name, nested_fields, nested_expand, f'{prefix}{name}.',
+                )
+                invalid += nested_invalid
+                self.expanded.add(name)
+            elif nested_fields or nested_expand:
+                nested = self.fields[name]
+                nested = getattr(nested, 'child', nested)
+                if isinstance(nested, DynamicFieldsMixin):
+                    invalid += nested.apply_fieldset(nested_fields, nested_expand, f'{prefix}{name}.')
+                elif nested_fields:
+                    invalid += _unknown_paths(nested, nested_fields, f'{prefix}{name}.')
+        return invalid
+
+    def expand_field(self, name, fields, expand, prefix=''):
+        """(сериализатор раскрытой связи, неизвестные пути из fields)"""
+        serializer_class = self.expandable_fields[name]
+        if issubclass(serializer_class, DynamicFieldsMixin):
+            serializer = serializer_class(read_only=True)
+            return serializer, serializer.apply_fieldset(fields, expand, prefix)
+        serializer = serializer_class(read_only=True)
+        return serializer, _unknown_paths(serializer, fields or {}, prefix)
+
+
+class SparseFieldsetMixin:
+    """Для ViewSet: разбирает ?fields= и ?expand= и передаёт их сериализатору."""
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    @cached_property
+    def fieldset(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return None, {}
+        fields = request.query_params.get(self.fields_query_param)
+        expand = request.query_params.get(self.expand_query_param)
+        return (parse_paths(fields) if fields else None), (parse_paths(expand) if expand else {})
+
+    def is_requested(self, path):
+        """Попадёт ли поле (можно через точку) в ответ."""
+        node = self.fieldset[0]
+        for part in path.split('.'):
+            if not node:
+                return True
+            if part not in node:
+                return False
+            node = node[part]
+        return True
+
+    def is_expanded(self, path):
+        node = self.fieldset[1]
+        for part in path.split('.'):
+            if part not in node:
+                return False
+            node = node[part]
+        return self.is_requested(path)
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), DynamicFieldsMixin):
+            fields, expand = self.fieldset
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
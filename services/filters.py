@@ -1,9 +1,17 @@
 import django_filters
+from rest_framework import filters as drf_filters
+from rest_framework.exceptions import ValidationError
+
+from .geo import DEFAULT_RADIUS_KM, MAX_RADIUS_KM, filter_nearby
 from .models import Service
+from .pagination import order_expression
+from .search import search_services, order_by_rank
+from .spelling import correct_query
 
 class ServiceFilter(django_filters.FilterSet):
-    min_price = django_filters.NumberFilter(field_name="price", lookup_expr='gte')
-    max_price = django_filters.NumberFilter(field_name="price", lookup_expr='lte')
+    # Границы цены — в сомах, сравниваются с price_som (см. exchange.py).
+    min_price = django_filters.NumberFilter(field_name="price_som", lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name="price_som", lookup_expr='lte')
     category = django_filters.NumberFilter(field_name="category__id")
     subcategory = django_filters.NumberFilter(field_name="subcategories__id")
     experience = django_filters.CharFilter(field_name="experience")
@@ -11,3 +19,100 @@ class ServiceFilter(django_filters.FilterSet):
     class Meta:
         model = Service
         fields = ['category', 'subcategory', 'experience', 'min_price', 'max_price']
+
+
+class ServiceSearchFilter(drf_filters.SearchFilter):
+    """
+    Полнотекстовый поиск по ?search= через индекс services.search.
+    Без явного ?ordering= результаты сортируются по релевантности.
+    Если по запросу ничего не нашлось, запрос исправляется по словарю опечаток;
+    исправленный вариант, по которому есть результаты, отдаётся вместо них
+    и сохраняется в request.search_suggestion.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        found = search_services(queryset, query)
+        if not found.exists():
+            suggestion = correct_query(query)
+            if suggestion:
+                corrected = search_services(queryset, suggestion)
+                if corrected.exists():
+                    request.search_suggestion = suggestion
+                    found = corrected
+        if 'search_rank' in found.query.annotations:
+            found = order_by_rank(found)
+        return found
+
+
+class ServiceGeoFilter(drf_filters.BaseFilterBackend):
+    """
+    Услуги рядом с точкой: ?lat=&lon=&radius_km= (по умолчанию DEFAULT_RADIUS_KM).
+    Добавляет аннотацию distance (км), по ней работает ?ordering=distance.
+    """
+    def _number(self, request, name, low, high, default=None):
+        value = request.query_params.get(name)
+        if value in (None, ''):
+            return default
+        try:
+            number = float(value)
+        except ValueError:
+            number = None
+        if number is None or not low <= number <= high:
+            raise ValidationError({name: f'Ожидается число от {low} до {high}'})
+        return number
+
+    def filter_queryset(self, request, queryset, view):
+        latitude = self._number(request, 'lat', -90, 90)
+        longitude = self._number(request, 'lon', -180, 180)
+        if latitude is None and longitude is None:
+            return queryset
+        if latitude is None or longitude is None:
+            raise ValidationError({'lat': 'Нужно указать и lat, и lon'})
+        radius_km = self._number(request, 'radius_km', 0, MAX_RADIUS_KM, DEFAULT_RADIUS_KM)
+        return filter_nearby(queryset, latitude, longitude, radius_km)
+
+    def get_schema_operation_parameters(self, view):
+        descriptions = {
+            'lat': 'Широта точки',
+            'lon': 'Долгота точки',
+            'radius_km': f'Радиус в км (по умолчанию {DEFAULT_RADIUS_KM}, не больше {MAX_RADIUS_KM})',
+        }
+        return [
+            {'name': name, 'required': False, 'in': 'query', 'description': description, 'schema': {'type': 'number'}}
+            for name, description in descriptions.items()
+        ]
+
+
+class ServiceOrderingFilter(drf_filters.OrderingFilter):
+    """
+    При поиске сортировка по умолчанию — релевантность, а не view.ordering.
+    Сортировка distance доступна только вместе с ?lat=&lon= (иначе игнорируется),
+    price сортирует по цене в сомах (price_som); услуги без цены считаются дороже
+    любых (в конце при price, в начале при -price) — так же, как с курсором.
+    """
+    aliases = {'price': 'price_som'}
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        # NULL и добивка по id — так же, как при пагинации по курсору (KeysetPagination),
+        # иначе страницы с курсором и без шли бы в разном порядке.
+        terms = [(self.aliases.get(term.lstrip('-'), term.lstrip('-')), term.startswith('-')) for term in ordering]
+        if not any(name in ('id', 'pk') for name, _ in terms):
+            terms.append(('id', terms[0][1]))
+        return [order_expression(queryset.model, name, descending) for name, descending in terms]
+
+    def get_default_ordering(self, view):
+        if view.request.query_params.get(drf_filters.SearchFilter.search_param, '').strip():
+            return None
+        return super().get_default_ordering(view)
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        fields = super().remove_invalid_fields(queryset, fields, view, request)
+        if 'distance' not in queryset.query.annotations:
+            fields = [term for term in fields if term.lstrip('-') != 'distance']
+        return fields
@@ -0,0 +1,103 @@
+"""
+Поиск услуг рядом с точкой без PostGIS.
+
+Координаты исполнителя (users.Location) копируются в услугу: latitude,
+longitude и geo_cell — номер ячейки сетки CELL_DEGREES × CELL_DEGREES
+градусов, ячейки нумеруются по строкам (широта), внутри строки — по долготе.
+Запрос ?lat=&lon=&radius_km= выполняется в три шага:
+  1. ячейки, покрывающие описанный вокруг круга прямоугольник; в каждой
+     строке сетки их номера идут подряд, поэтому это несколько диапазонов
+     geo_cell, которые читаются по индексу;
+  2. точная проверка прямоугольника по latitude/longitude;
+  3. расстояние по формуле гаверсинуса — только для оставшихся строк,
+     оно же аннотация distance для ?ordering=distance.
+"""
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+from users.models import Location
+
+EARTH_RADIUS_KM = 6371.0
+CELL_DEGREES = 0.1
+CELLS_PER_ROW = round(360 / CELL_DEGREES)
+ROWS = round(180 / CELL_DEGREES)
+
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 300
+
+
+def cell_of(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    row = min(int((latitude + 90) // CELL_DEGREES), ROWS - 1)
+    column = int((longitude + 180) // CELL_DEGREES) % CELLS_PER_ROW
+    return row * CELLS_PER_ROW + column
+
+
+def coordinates(latitude, longitude):
+    """Значения полей услуги для точки (или пустые, если координат нет)."""
+    if latitude is None or longitude is None:
+        latitude = longitude = None
+    return {'latitude': latitude, 'longitude': longitude, 'geo_cell': cell_of(latitude, longitude)}
+
+
+def executor_coordinates(executor_ids):
+    """{id исполнителя: значения полей услуги} по его Location, одним запросом."""
+    rows = Location.objects.filter(user__in=executor_ids).values_list('user', 'latitude', 'longitude')
+    found = {user_id: coordinates(latitude, longitude) for user_id, latitude, longitude in rows}
+    return {executor_id: found.get(executor_id, coordinates(None, None)) for executor_id in executor_ids}
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(мин. широта, макс. широта, [(мин. долгота, макс. долгота), ...]) — через 180-й меридиан двумя отрезками."""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0)
+    widest = max(abs(south), abs(north))
+    if widest >= 90.0:
+        return south, north, [(-180.0, 180.0)]
+    delta_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(widest))))
+    if delta_lon >= 180.0:
+        return south, north, [(-180.0, 180.0)]
+    west, east = longitude - delta_lon, longitude + delta_lon
+    if west < -180.0:
+        return south, north, [(west + 360.0, 180.0), (-180.0, east)]
+    if east > 180.0:
+        return south, north, [(west, 180.0), (-180.0, east - 360.0)]
+    return south, north, [(west, east)]
+
+
+def box_filter(south, north, spans):
+    first_row, last_row = cell_of(south, 0.0) // CELLS_PER_ROW, cell_of(north, 0.0) // CELLS_PER_ROW
+    columns = [
+        (cell_of(0.0, west) % CELLS_PER_ROW, cell_of(0.0, min(east, 180.0 - 1e-9)) % CELLS_PER_ROW)
+        for west, east in spans
+    ]
+    cells = Q()
+    for row in range(first_row, last_row + 1):
+        for first, last in columns:
+            cells |= Q(geo_cell__range=(row * CELLS_PER_ROW + first, row * CELLS_PER_ROW + last))
+    longitude = Q()
+    for west, east in spans:
+        longitude |= Q(longitude__range=(west, east))
+    return cells & Q(latitude__range=(south, north)) & longitude
+
+
+def distance_expression(latitude, longitude):
+    """Расстояние в км от точки до (latitude, longitude) услуги по формуле гаверсинуса."""
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    half_dlat = Sin((Radians(F('latitude')) - Value(lat)) / 2)
+    half_dlon = Sin((Radians(F('longitude')) - Value(lon)) / 2)
+    haversine = Power(half_dlat, 2) + Value(math.cos(lat)) * Cos(Radians(F('latitude'))) * Power(half_dlon, 2)
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(haversine), output_field=FloatField())
+
+
+def filter_nearby(queryset, latitude, longitude, radius_km):
+    """Услуги не дальше radius_km от точки с аннотацией distance (км)."""
+    south, north, spans = bounding_box(latitude, longitude, radius_km)
+    return (
+        queryset.filter(box_filter(south, north, spans))
+        .annotate(distance=distance_expression(latitude, longitude))
+        .filter(distance__lte=radius_km)
+    )
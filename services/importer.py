@@ -0,0 +1,382 @@
+"""
+Массовый импорт услуг, фото и отзывов (перенос с другой площадки).
+
+Вход — поток NDJSON (по объекту на строку, тип в поле "type") или CSV
+(тип задаётся для всего файла, подкатегории через ";"). Записи копятся
+пачками по CHUNK_SIZE и пишутся через bulk_create, связи услуг с
+подкатегориями — пачкой строк в промежуточную таблицу. bulk_create не
+вызывает сигналов, поэтому поштучные пересчёты (рейтинг, поисковый индекс,
+похожие услуги, кэши) не выполняются; вместо них refresh() один раз
+пересчитывает производные данные по всем затронутым услугам — в конце
+импорта, а при сбое на середине — по уже закоммиченным пачкам.
+
+Форматы записей (лишние поля игнорируются):
+  service: external_id, executor | executor_email, title, description,
+           category, subcategories, price, currency, experience, phone_number, created_at
+  photo:   service | service_external_id, photo (путь в хранилище)
+  review:  service | service_external_id, author | author_email, rating, text, created_at
+
+Ошибочные записи пропускаются и попадают в отчёт с номером строки.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import exchange, geo, similar, suggest
+from .cache import CATALOG_VERSION, bump_version
+from .models import Category, Review, Service, ServicePhoto, SubCategory
+from .ratings import reconcile
+from .search import index_services
+
+User = get_user_model()
+
+CHUNK_SIZE = 1000
+# Ограничение на число id в одном IN (...) при пересчётах.
+ID_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+# Если импорт добавил больше услуг, похожие пересчитываются целиком, а не по одной.
+SIMILAR_FULL_REBUILD = 500
+
+TYPES = ('service', 'photo', 'review')
+FORMATS = ('ndjson', 'csv')
+
+
+class RecordError(ValueError):
+    pass
+
+
+def iter_records(stream, format, record_type=None):
+    """(номер строки, запись) из бинарного или текстового потока."""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            if record_type and not record.get('type'):
+                record['type'] = record_type
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        if isinstance(record, dict) and record_type and not record.get('type'):
+            record['type'] = record_type
+        yield line_number, record
+
+
+def _id(value):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RecordError(f'некорректный id: {value!r}')
+
+
+def _required(record, name):
+    value = record.get(name)
+    if value in (None, ''):
+        raise RecordError(f'не заполнено поле {name}')
+    return str(value)
+
+
+def _datetime(value):
+    if value in (None, ''):
+        return None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise RecordError(f'некорректная дата: {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _choice(value, choices, name, default=None):
+    value = value or default
+    if value not in {choice for choice, _ in choices}:
+        raise RecordError(f'недопустимое значение {name}: {value!r}')
+    return value
+
+
+def _subcategory_ids(value):
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = [part for part in value.replace(',', ';').split(';') if part.strip()]
+    return [_id(item) for item in value]
+
+
+class Importer:
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.pending = {record_type: [] for record_type in TYPES}
+        self.counts = {record_type: 0 for record_type in TYPES}
+        self.errors = []
+        self.error_count = 0
+        self.service_keys = {}  # external_id -> id услуги
+        self.created_services = {}  # id -> заголовок, для подсказок поиска
+        self.photo_services = set()
+        self.review_services = set()
+        self.category_ids = set(Category.objects.values_list('pk', flat=True))
+        self.subcategory_ids = set(SubCategory.objects.values_list('pk', flat=True))
+        self.rates = exchange.get_rates()
+
+    # --- чтение ---
+
+    def add(self, line_number, record):
+        if not isinstance(record, dict):
+            self.error(line_number, 'строка не является JSON-объектом')
+            return
+        record_type = record.get('type')
+        if record_type not in TYPES:
+            self.error(line_number, f'неизвестный тип записи: {record_type!r}')
+            return
+        self.pending[record_type].append((line_number, record))
+        if len(self.pending[record_type]) >= self.chunk_size:
+            self.flush(record_type)
+
+    def run(self, records):
+        try:
+            for line_number, record in records:
+                self.add(line_number, record)
+        except BaseException:
+            # Записанные пачки уже закоммичены — производные данные для них нужны и при сбое.
+            self.refresh()
+            raise
+        return self.finish()
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    # --- запись ---
+
+    def flush(self, record_type):
+        if record_type != 'service':
+            # Фото и отзывы могут ссылаться на услуги из ещё не записанной пачки.
+            self.flush('service')
+        chunk, self.pending[record_type] = self.pending[record_type], []
+        if chunk:
+            with transaction.atomic():
+                getattr(self, f'write_{record_type}s')(chunk)
+
+    def _users(self, chunk, id_field, email_field):
+        """Пользователи пачки одним запросом на id и одним на email: {id или email: id}."""
+        ids = {str(record.get(id_field)) for _, record in chunk}
+        ids = {int(value) for value in ids if value.isdigit()}
+        emails = {record.get(email_field) for _, record in chunk if record.get(email_field)}
+        users = {}
+        if ids:
+            users.update((pk, pk) for pk in User.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if emails:
+            users.update(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+        return users
+
+    def _user(self, users, record, id_field, email_field):
+        key = _id(record.get(id_field)) if record.get(id_field) not in (None, '') else record.get(email_field)
+        if key is None:
+            raise RecordError(f'не указан {id_field} или {email_field}')
+        if key not in users:
+            raise RecordError(f'пользователь не найден: {key!r}')
+        return users[key]
+
+    def _resolve_services(self, chunk):
+        """Подгружает id услуг по external_id, которых нет среди импортированных в этом запуске."""
+        keys = {
+            str(record['service_external_id']) for _, record in chunk
+            if record.get('service_external_id') not in (None, '')
+        } - set(self.service_keys)
+        if keys:
+            self.service_keys.update(Service.objects.filter(external_id__in=keys).values_list('external_id', 'pk'))
+        ids = {
+            _id(record['service']) for _, record in chunk
+            if record.get('service') not in (None, '') and str(record['service']).isdigit()
+        }
+        return set(Service.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+    def _service(self, existing, record):
+        if record.get('service_external_id') not in (None, ''):
+            key = str(record['service_external_id'])
+            if key not in self.service_keys:
+                raise RecordError(f'услуга не найдена: external_id {key!r}')
+            return self.service_keys[key]
+        service_id = _id(record.get('service'))
+        if service_id is None or service_id not in existing:
+            raise RecordError(f'услуга не найдена: {record.get("service")!r}')
+        return service_id
+
+    def write_services(self, chunk):
+        executors = self._users(chunk, 'executor', 'executor_email')
+        keys = {str(record['external_id']) for _, record in chunk if record.get('external_id') not in (None, '')}
+        taken = set(Service.objects.filter(external_id__in=keys).values_list('external_id', flat=True)) if keys else set()
+        services, subcategories, created_at = [], [], []
+        for line_number, record in chunk:
+            try:
+                external_id = str(record['external_id']) if record.get('external_id') not in (None, '') else None
+                if external_id is not None and (external_id in taken or external_id in self.service_keys):
+                    raise RecordError(f'услуга с external_id {external_id!r} уже импортирована')
+                category = _id(record.get('category'))
+                if category is not None and category not in self.category_ids:
+                    raise RecordError(f'категория не найдена: {category}')
+                subcategory_ids = _subcategory_ids(record.get('subcategories'))
+                unknown = [pk for pk in subcategory_ids if pk not in self.subcategory_ids]
+                if unknown:
+                    raise RecordError(f'подкатегории не найдены: {unknown}')
+                price = record.get('price')
+                try:
+                    price = Decimal(str(price)) if price not in (None, '') else None
+                except InvalidOperation:
+                    raise RecordError(f'некорректная цена: {price!r}')
+                service = Service(
+                    executor_id=self._user(executors, record, 'executor', 'executor_email'),
+                    category_id=category,
+                    title=_required(record, 'title')[:255],
+                    description=str(record.get('description') or ''),
+                    price=price,
+                    currency=_choice(record.get('currency'), Service.CURRENCY_CHOICES, 'currency', 'SOM'),
+                    experience=_choice(record.get('experience'), Service.EXPERIENCE_CHOICES, 'experience'),
+                    phone_number=_required(record, 'phone_number')[:20],
+                    external_id=external_id,
+                )
+                created = _datetime(record.get('created_at'))
+            except RecordError as exc:
+                self.error(line_number, str(exc))
+                continue
+            if external_id is not None:
+                taken.add(external_id)
+            services.append(service)
+            subcategories.append(subcategory_ids)
+            created_at.append(created)
+
+        # pre_save при bulk_create не вызывается — цену в сомах и координаты исполнителей заполняем сами.
+        located = geo.executor_coordinates({service.executor_id for service in services})
+        for service in services:
+            service.price_som = exchange.to_som(service.price, service.currency, self.rates)
+            service.__dict__.update(located[service.executor_id])
+        Service.objects.bulk_create(services)
+        through = Service.subcategories.through
+        through.objects.bulk_create(
+            [
+                through(service_id=service.pk, subcategory_id=subcategory_id)
+                for service, subcategory_ids in zip(services, subcategories)
+                for subcategory_id in dict.fromkeys(subcategory_ids)
+            ],
+            batch_size=self.chunk_size,
+        )
+        self._restore_created_at(Service, services, created_at)
+        for service in services:
+            if service.external_id is not None:
+                self.service_keys[service.external_id] = service.pk
+            self.created_services[service.pk] = service.title
+        self.counts['service'] += len(services)
+
+    def write_photos(self, chunk):
+        existing = self._resolve_services(chunk)
+        photos = []
+        for line_number, record in chunk:
+            try:
+                photos.append(ServicePhoto(
+                    service_id=self._service(existing, record),
+                    photo=_required(record, 'photo'),
+                ))
+            except RecordError as exc:
+                self.error(line_number, str(exc))
+        ServicePhoto.objects.bulk_create(photos)
+        self.photo_services.update(photo.service_id for photo in photos)
+        self.counts['photo'] += len(photos)
+
+    def write_reviews(self, chunk):
+        existing = self._resolve_services(chunk)
+        authors = self._users(chunk, 'author', 'author_email')
+        reviews, created_at = [], []
+        for line_number, record in chunk:
+            try:
+                rating = _id(record.get('rating'))
+                if rating not in dict(Review.RATING_CHOICES):
+                    raise RecordError(f'оценка должна быть от 1 до 5: {record.get("rating")!r}')
+                reviews.append(Review(
+                    service_id=self._service(existing, record),
+                    author_id=self._user(authors, record, 'author', 'author_email'),
+                    rating=rating,
+                    text=str(record.get('text') or ''),
+                ))
+                created_at.append(_datetime(record.get('created_at')))
+            except RecordError as exc:
+                self.error(line_number, str(exc))
+        Review.objects.bulk_create(reviews)
+        self._restore_created_at(Review, reviews, created_at)
+        self.review_services.update(review.service_id for review in reviews)
+        self.counts['review'] += len(reviews)
+
+    @staticmethod
+    def _restore_created_at(model, objects, created_at):
+        # auto_now_add при вставке ставит текущее время; даты с прежней площадки пишем вторым запросом.
+        dated = []
+        for obj, value in zip(objects, created_at):
+            if value is not None:
+                obj.created_at = value
+                dated.append(obj)
+        if dated:
+            model.objects.bulk_update(dated, ['created_at'], batch_size=500)
+
+    # --- пересчёт производных данных ---
+
+    def finish(self):
+        try:
+            for record_type in TYPES:
+                self.flush(record_type)
+        finally:
+            self.refresh()
+        return {
+            'services': self.counts['service'],
+            'photos': self.counts['photo'],
+            'reviews': self.counts['review'],
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    def refresh(self):
+        """Пересчитывает производные данные по услугам из записанных пачек; повторный вызов ничего не делает."""
+        created_services, self.created_services = self.created_services, {}
+        photo_services, self.photo_services = self.photo_services, set()
+        review_services, self.review_services = self.review_services, set()
+
+        created = list(created_services)
+        for start in range(0, len(created), ID_BATCH_SIZE):
+            index_services(created[start:start + ID_BATCH_SIZE])
+        touched = sorted(photo_services - set(created))
+        for start in range(0, len(touched), ID_BATCH_SIZE):
+            Service.objects.filter(pk__in=touched[start:start + ID_BATCH_SIZE]).update(updated_at=timezone.now())
+        rated = sorted(review_services)
+        for start in range(0, len(rated), ID_BATCH_SIZE):
+            reconcile(Service, Review, service_ids=rated[start:start + ID_BATCH_SIZE])
+        if created:
+            if len(created) > SIMILAR_FULL_REBUILD:
+                similar.build_similar()
+            else:
+                similar.update_similar(created)
+            for service_id, title in created_services.items():
+                suggest.service_changed(service_id, title)
+        if created or touched or rated:
+            bump_version(CATALOG_VERSION)
+
+
+def import_stream(stream, format='ndjson', record_type=None, chunk_size=CHUNK_SIZE):
+    if format not in FORMATS:
+        raise ValueError(f'Неизвестный формат: {format}')
+    if format == 'csv' and record_type not in TYPES:
+        raise ValueError('Для CSV нужно указать тип записей: service, photo или review')
+    return Importer(chunk_size).run(iter_records(stream, format, record_type))
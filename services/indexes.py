@@ -0,0 +1,65 @@
+import threading
+import time
+
+from django.db import connection
+
+
+class ProcessIndex:
+    """
+    Структура в памяти процесса, построенная из базы функцией build.
+    Первый вызов get() строит её синхронно; устаревшая (старше interval секунд)
+    пересобирается в фоновом потоке, пока запросы обслуживает старая версия.
+
+    Точечные изменения идут через update(): они применяются к текущей версии,
+    а пришедшие во время сборки запоминаются и повторяются на новой версии
+    до подмены — иначе сборка, прочитавшая базу раньше, их бы потеряла.
+    """
+
+    def __init__(self, build, interval):
+        self._build = build
+        self.interval = interval
+        self.current = None
+        self._built_at = 0.0
+        self._rebuilding = threading.Lock()
+        self._changes_lock = threading.Lock()
+        self._changes = None
+
+    def _rebuild(self):
+        try:
+            with self._changes_lock:
+                self._changes = []
+            index = self._build()
+            with self._changes_lock:
+                for change in self._changes:
+                    change(index)
+                self.current = index
+            self._built_at = time.monotonic()
+        finally:
+            with self._changes_lock:
+                self._changes = None
+            self._rebuilding.release()
+
+    def _rebuild_in_background(self):
+        try:
+            self._rebuild()
+        finally:
+            connection.close()
+
+    def update(self, change):
+        """Применяет change(index) к текущей версии и к собираемой, если идёт сборка."""
+        with self._changes_lock:
+            if self.current is not None:
+                change(self.current)
+            if self._changes is not None:
+                self._changes.append(change)
+
+    def get(self):
+        if self.current is None:
+            self._rebuilding.acquire()
+            if self.current is None:
+                self._rebuild()
+            else:
+                self._rebuilding.release()
+        elif time.monotonic() - self._built_at > self.interval and self._rebuilding.acquire(blocking=False):
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+        return self.current
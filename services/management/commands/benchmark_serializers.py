@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework import serializers
+
+from services.fast_serializers import render_services, service_rows
+from services.models import Service
+from services.serializers import ServiceListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость ServiceListSerializer через поля DRF и через быстрый путь'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=12, help='Услуг на странице')
+        parser.add_argument('--repeat', type=int, default=50, help='Повторов каждого варианта')
+
+    def _measure(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        return timings[len(timings) // 2] * 1000
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        request = RequestFactory().get('/api/services/')
+        queryset = Service.objects.order_by('-popularity', '-id')[:rows]
+        count = queryset.count()
+        if not count:
+            self.stdout.write('Нет услуг для замера')
+            return
+
+        def drf():
+            page = queryset.select_related('executor').prefetch_related('photos', 'subcategories')
+            child = ServiceListSerializer(context={'request': request})
+            return [serializers.ModelSerializer.to_representation(child, obj) for obj in page]
+
+        def fast():
+            return render_services(service_rows(queryset), request)
+
+        drf_ms = self._measure(drf, repeat)
+        fast_ms = self._measure(fast, repeat)
+        self.stdout.write(f'Услуг на странице: {count}, повторов: {repeat}')
+        self.stdout.write(f'DRF:          {drf_ms:.2f} мс (медиана)')
+        self.stdout.write(f'Быстрый путь: {fast_ms:.2f} мс (медиана)')
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: {drf_ms / fast_ms:.1f}x'))
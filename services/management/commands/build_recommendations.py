@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from services.recommendations import SERVICE_TOP_N, USER_TOP_N, build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рекомендации услуг по избранному, отзывам и истории поиска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-top', type=int, default=USER_TOP_N, help='Кандидатов на пользователя')
+        parser.add_argument('--service-top', type=int, default=SERVICE_TOP_N, help='Кандидатов на услугу')
+
+    def handle(self, *args, **options):
+        users, services = build_recommendations(options['user_top'], options['service_top'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендаций для пользователей: {users}, для услуг: {services}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from services.similar import TOP_K, build_similar
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие услуги (подкатегории и TF-IDF по тексту)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_K, help='Соседей на услугу')
+
+    def handle(self, *args, **options):
+        rows = build_similar(options['top'])
+        self.stdout.write(self.style.SUCCESS(f'Сохранено пар похожих услуг: {rows}'))
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.importer import CHUNK_SIZE, FORMATS, TYPES, import_stream
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт услуг, фото и отзывов из NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу или "-" для чтения из stdin')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--type', choices=TYPES, help='Тип записей без поля type (обязателен для CSV)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                report = import_stream(sys.stdin.buffer, options['format'], options['type'], options['chunk_size'])
+            else:
+                with open(options['path'], 'rb') as stream:
+                    report = import_stream(stream, options['format'], options['type'], options['chunk_size'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        for error in report['errors']:
+            self.stderr.write(f'Строка {error["line"]}: {error["error"]}')
+        if report['error_count'] > len(report['errors']):
+            self.stderr.write(f'… и ещё {report["error_count"] - len(report["errors"])} ошибок')
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано: услуг {report["services"]}, фото {report["photos"]}, отзывов {report["reviews"]}; '
+            f'пропущено записей: {report["error_count"]}'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from services.models import Service
+from services.search import index_services
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс услуг'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only-missing', action='store_true',
+            help='Индексировать только услуги без поискового документа',
+        )
+
+    def handle(self, *args, **options):
+        services = Service.objects.all()
+        if options['only_missing']:
+            services = services.filter(search_document__isnull=True)
+        service_ids = list(services.values_list('pk', flat=True))
+        index_services(service_ids)
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано услуг: {len(service_ids)}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from services import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает популярность услуг по просмотрам и контактам с затуханием (запускать по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--half-life-days', type=float, default=counters.HALF_LIFE_DAYS,
+                            help='За сколько дней вклад события уменьшается вдвое')
+        parser.add_argument('--window-days', type=int, default=counters.WINDOW_DAYS,
+                            help='Сколько дней статистики учитывать и хранить')
+
+    def handle(self, *args, **options):
+        changed = counters.recompute_popularity(options['half_life_days'], options['window_days'])
+        self.stdout.write(self.style.SUCCESS(f'Обновлена популярность услуг: {changed}'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from services.models import Review, Service
+from services.ratings import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги услуг по отзывам и сообщает о расхождениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения, не исправлять')
+
+    def handle(self, *args, **options):
+        drift = reconcile(Service, Review, fix=not options['dry_run'])
+        for service_id, stored, expected in drift:
+            changes = ', '.join(
+                f'{name}: {stored[name]} → {expected[name]}' for name in expected if stored[name] != expected[name]
+            )
+            self.stdout.write(f'Услуга {service_id}: {changes}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Расхождений: {len(drift)} (не исправлены)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено услуг: {len(drift)}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from services import search_stats
+
+
+class Command(BaseCommand):
+    help = ('Сворачивает историю поиска по часам (популярные запросы) и по дням, удаляет старые сырые записи. '
+            'Запускать по расписанию раз в несколько минут')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=search_stats.RAW_RETENTION_DAYS,
+                            help='Сколько дней хранить сырые записи SearchHistory')
+
+    def handle(self, *args, **options):
+        searches = search_stats.rollup_hourly()
+        rolled = search_stats.rollup(options['retention_days'])
+        self.stdout.write(self.style.SUCCESS(f'Новых запросов в почасовой свёртке: {searches}; свёрнуто дней: {rolled}'))
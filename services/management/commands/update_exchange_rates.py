@@ -0,0 +1,35 @@
+from decimal import Decimal, InvalidOperation
+from urllib.error import URLError
+from xml.etree.ElementTree import ParseError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.exchange import NBKR_DAILY_URL, fetch_rates, renormalize, set_rates
+
+
+class Command(BaseCommand):
+    help = 'Обновляет курсы валют (по умолчанию с сайта НБКР) и пересчитывает цены услуг в сомах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('rates', nargs='*', metavar='КОД=КУРС', help='Задать курсы вручную, например USD=87.45')
+        parser.add_argument('--url', default=NBKR_DAILY_URL, help='Адрес XML с курсами НБКР')
+        parser.add_argument('--all', action='store_true', help='Пересчитать цены всех услуг, даже если курсы не изменились')
+
+    def handle(self, *args, **options):
+        if options['rates']:
+            rates = {}
+            for item in options['rates']:
+                currency, _, value = item.partition('=')
+                try:
+                    rates[currency.upper()] = Decimal(value.replace(',', '.'))
+                except InvalidOperation:
+                    raise CommandError(f'Некорректный курс: {item}')
+        else:
+            try:
+                rates = fetch_rates(options['url'])
+            except (URLError, OSError, ValueError, ParseError) as exc:
+                raise CommandError(f'Не удалось получить курсы: {exc}')
+        changed = set_rates(rates)
+        self.stdout.write(f'Изменились курсы: {", ".join(changed) or "нет"}')
+        if options['all']:
+            self.stdout.write(self.style.SUCCESS(f'Пересчитано услуг: {renormalize()}'))
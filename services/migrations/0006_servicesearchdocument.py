@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FTS_TABLE = 'services_servicesearch_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"title, body, tokenize = 'unicode61 remove_diacritics 0', prefix = '2 3')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE services_servicesearchdocument ADD COLUMN search_vector tsvector')
+        schema_editor.execute(
+            'CREATE INDEX services_servicesearch_vector_gin '
+            'ON services_servicesearchdocument USING gin (search_vector)'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS services_servicesearch_vector_gin')
+        schema_editor.execute('ALTER TABLE services_servicesearchdocument DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0005_alter_review_options_review_rating_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceSearchDocument',
+            fields=[
+                ('service', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='services.service')),
+                ('title', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ услуги',
+                'verbose_name_plural': 'Поисковые документы услуг',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0009_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarService',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='services.service')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar', to='services.service')),
+            ],
+            options={
+                'verbose_name': 'Похожая услуга',
+                'verbose_name_plural': 'Похожие услуги',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='similarservice',
+            constraint=models.UniqueConstraint(fields=('service', 'rank'), name='similarservice_service_rank_uniq'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0010_similarservice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('contacts', models.PositiveIntegerField(default=0)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='services.service')),
+            ],
+            options={
+                'verbose_name': 'Статистика услуги',
+                'verbose_name_plural': 'Статистика услуг',
+                'indexes': [models.Index(fields=['date'], name='servicestat_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='servicestat',
+            constraint=models.UniqueConstraint(fields=('service', 'date'), name='servicestat_service_date_uniq'),
+        ),
+    ]
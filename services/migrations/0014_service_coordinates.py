@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+def fill_coordinates(apps, schema_editor):
+    from services.geo import coordinates
+
+    Service = apps.get_model('services', 'Service')
+    services = Service.objects.filter(executor__location__isnull=False).values_list(
+        'pk', 'executor__location__latitude', 'executor__location__longitude',
+    )
+    changed = [Service(pk=pk, **coordinates(latitude, longitude)) for pk, latitude, longitude in services.iterator()]
+    Service.objects.bulk_update(changed, ['latitude', 'longitude', 'geo_cell'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0013_service_external_id'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['geo_cell'], name='service_geo_cell_idx'),
+        ),
+        migrations.RunPython(fill_coordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:55
+
+from django.db import migrations, models
+
+
+def fill_price_som(apps, schema_editor):
+    # Курсов ещё нет: нормализуются только цены в сомах, остальные — после update_exchange_rates.
+    Service = apps.get_model('services', 'Service')
+    Service.objects.filter(currency='SOM').update(price_som=models.F('price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0014_service_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('SOM', 'Сом'), ('RUB', 'Рубль'), ('USD', 'Доллар')], max_length=3, unique=True)),
+                ('rate', models.DecimalField(decimal_places=6, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Курс валюты',
+                'verbose_name_plural': 'Курсы валют',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='service',
+            name='service_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='service',
+            name='service_cat_price_idx',
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='price_som',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['price_som', 'id'], name='service_price_som_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['category', 'price_som', 'id'], name='service_cat_price_som_idx'),
+        ),
+        migrations.RunPython(fill_price_som, migrations.RunPython.noop),
+    ]
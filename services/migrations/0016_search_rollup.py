@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0015_exchange_rates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Отметка свёртки',
+                'verbose_name_plural': 'Отметки свёрток',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchQueryDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('query', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Поисковый запрос за день',
+                'verbose_name_plural': 'Поисковые запросы по дням',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchhistory',
+            index=models.Index(fields=['created_at'], name='searchhistory_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchquerydaily',
+            index=models.Index(fields=['query'], name='searchquerydaily_query_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchquerydaily',
+            constraint=models.UniqueConstraint(fields=('date', 'query'), name='searchquerydaily_date_query_uniq'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0016_search_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQueryHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('query', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Поисковый запрос за час',
+                'verbose_name_plural': 'Поисковые запросы по часам',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchqueryhourly',
+            constraint=models.UniqueConstraint(fields=('hour', 'query'), name='searchqueryhourly_hour_query_uniq'),
+        ),
+    ]
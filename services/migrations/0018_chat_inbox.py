@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_last_messages(apps, schema_editor):
+    Chat = apps.get_model('services', 'Chat')
+    ChatParticipant = apps.get_model('services', 'ChatParticipant')
+    Message = apps.get_model('services', 'Message')
+    Chat.objects.update(last_message=Subquery(
+        Message.objects.filter(chat=OuterRef('pk')).order_by('-id').values('pk')[:1]
+    ))
+    ChatParticipant.objects.update(last_message_at=Subquery(
+        Chat.objects.filter(pk=OuterRef('chat')).annotate(
+            activity=Max('messages__created_at', default=models.F('created_at')),
+        ).values('activity')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('services', '0017_searchqueryhourly'),
+    ]
+
+    operations = [
+        # Автоматическая промежуточная таблица participants становится моделью ChatParticipant
+        # без изменений в базе: имя таблицы, колонки и уникальность те же.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ChatParticipant',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='services.chat')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'services_chat_participants',
+                        'unique_together': {('chat', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='chat',
+                    name='participants',
+                    field=models.ManyToManyField(through='services.ChatParticipant', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chatparticipant',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='chatparticipant',
+            index=models.Index(fields=['user', '-last_message_at', '-id'], name='chatparticipant_inbox_idx'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='services.message'),
+        ),
+        migrations.RunPython(fill_last_messages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:15
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Стартовые курсы НБКР (сомов за единицу), чтобы у услуг в рублях и долларах
+# сразу была price_som; актуальные значения загружает update_exchange_rates.
+DEFAULT_RATES = {
+    'RUB': Decimal('0.950000'),
+    'USD': Decimal('87.450000'),
+}
+
+
+def seed_rates(apps, schema_editor):
+    ExchangeRate = apps.get_model('services', 'ExchangeRate')
+    Service = apps.get_model('services', 'Service')
+    for currency, rate in DEFAULT_RATES.items():
+        ExchangeRate.objects.get_or_create(currency=currency, defaults={'rate': rate})
+    for currency, rate in ExchangeRate.objects.values_list('currency', 'rate'):
+        Service.objects.filter(currency=currency, price_som__isnull=True).update(
+            price_som=models.ExpressionWrapper(
+                models.F('price') * models.Value(rate),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0020_searchhistory_created_at_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_rates, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -21,6 +22,7 @@ class SubCategory(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         verbose_name = 'Подкатегория'
         verbose_name_plural = 'Подкатегории'
@@ -47,6 +49,8 @@ class Service(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # или договорная
+    # price в сомах по курсу ExchangeRate — для фильтров и сортировки по цене (services/exchange.py).
+    price_som = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, editable=False)
     experience = models.CharField(max_length=5, choices=EXPERIENCE_CHOICES)
     phone_number = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -55,10 +59,33 @@ class Service(models.Model):
     currency = models.CharField(max_length=155, choices=CURRENCY_CHOICES, default='SOM')
     average_rating = models.FloatField(default=0)
     review_count = models.PositiveIntegerField(default=0)
+    # Гистограмма оценок: сколько отзывов с 1…5 звёздами (см. services/ratings.py).
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    # Идентификатор на площадке, откуда услуга перенесена импортом (services/importer.py).
+    external_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    # Копия координат исполнителя (users.Location) и ячейка сетки для поиска рядом (services/geo.py).
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geo_cell = models.IntegerField(null=True, blank=True)
 
     class Meta:
         verbose_name = 'Услуга'
         verbose_name_plural = 'Услуги'
+        # Под фильтры ServiceFilter и сортировки каталога; id в конце — для пагинации по ключу.
+        indexes = [
+            models.Index(fields=['popularity', 'id'], name='service_popularity_idx'),
+            models.Index(fields=['price_som', 'id'], name='service_price_som_idx'),
+            models.Index(fields=['created_at', 'id'], name='service_created_idx'),
+            models.Index(fields=['category', 'popularity', 'id'], name='service_cat_popularity_idx'),
+            models.Index(fields=['category', 'price_som', 'id'], name='service_cat_price_som_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='service_cat_created_idx'),
+            models.Index(fields=['experience', 'popularity', 'id'], name='service_exp_popularity_idx'),
+            models.Index(fields=['geo_cell'], name='service_geo_cell_idx'),
+        ]
     
     def __str__(self):
         return f'{self.title}'
@@ -76,10 +103,26 @@ class ServicePhoto(models.Model):
     def __str__(self):
         return f'Фото - {self.service.title}'
 
+
+class ServiceSearchDocument(models.Model):
+    # Нормализованный текст услуги для полнотекстового поиска (см. services/search.py).
+    service = models.OneToOneField(Service, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Поисковый документ услуги'
+        verbose_name_plural = 'Поисковые документы услуг'
+
+    def __str__(self):
+        return f'Документ - {self.service_id}'
+
 class SearchHistory(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='searches')
     query = models.CharField(max_length=255)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Время поиска, а не записи: строки пишутся из буфера пачками (см. search_log.py).
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f'{self.user.username} искал {self.query}'
@@ -87,6 +130,60 @@ class SearchHistory(models.Model):
     class Meta:
         verbose_name = 'История поиска'
         verbose_name_plural = 'Истории поисковой системы'
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='searchhistory_user_created_idx'),
+            models.Index(fields=['created_at'], name='searchhistory_created_idx'),
+        ]
+
+class SearchQueryDaily(models.Model):
+    # Свёртка SearchHistory: сколько раз за день искали нормализованный запрос (см. services/search_stats.py).
+    date = models.DateField()
+    query = models.CharField(max_length=255)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = 'Поисковый запрос за день'
+        verbose_name_plural = 'Поисковые запросы по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'query'], name='searchquerydaily_date_query_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['query'], name='searchquerydaily_query_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.query}: {self.count}'
+
+
+class SearchQueryHourly(models.Model):
+    # Свёртка SearchHistory по часам для популярных запросов; хранится за последнюю неделю.
+    hour = models.DateTimeField()
+    query = models.CharField(max_length=255)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = 'Поисковый запрос за час'
+        verbose_name_plural = 'Поисковые запросы по часам'
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'query'], name='searchqueryhourly_hour_query_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.hour} {self.query}: {self.count}'
+
+
+class RollupWatermark(models.Model):
+    # До какого момента журнал уже свёрнут, по имени свёртки (см. services/search_stats.py).
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Отметка свёртки'
+        verbose_name_plural = 'Отметки свёрток'
+
+    def __str__(self):
+        return f'{self.name}: {self.position}'
+
 
 class Review(models.Model):
     RATING_CHOICES = [
@@ -107,19 +204,130 @@ class Review(models.Model):
         verbose_name = 'Отзыв'
         verbose_name_plural = 'Отзывы'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['service', 'created_at', 'id'], name='review_service_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='review_created_idx'),
+        ]
 
     def __str__(self):
         return f'От {self.author.username} ({self.rating}★) к {self.service.title}'
 
 
+class ExchangeRate(models.Model):
+    # Сомов за единицу валюты; обновляется командой update_exchange_rates (services/exchange.py).
+    currency = models.CharField(max_length=3, choices=Service.CURRENCY_CHOICES, unique=True)
+    rate = models.DecimalField(max_digits=12, decimal_places=6)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Курс валюты'
+        verbose_name_plural = 'Курсы валют'
+
+    def __str__(self):
+        return f'{self.currency}: {self.rate}'
+
+
+class ServiceStat(models.Model):
+    # Просмотры и нажатия «связаться» за день; пишутся пачками из services/counters.py.
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='stats')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    contacts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Статистика услуги'
+        verbose_name_plural = 'Статистика услуг'
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'date'], name='servicestat_service_date_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='servicestat_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.service_id} {self.date}: {self.views}/{self.contacts}'
+
+
+class SimilarService(models.Model):
+    # Ближайшие соседи услуги по подкатегориям и тексту (см. services/similar.py).
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='similar')
+    neighbour = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='neighbour_of')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = 'Похожая услуга'
+        verbose_name_plural = 'Похожие услуги'
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'rank'], name='similarservice_service_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.service_id} ~ {self.neighbour_id} ({self.score:.3f})'
+
+
+class UserRecommendation(models.Model):
+    # Кандидаты для пользователя, считаются командой build_recommendations (см. services/recommendations.py).
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='recommendations')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = 'Рекомендация пользователю'
+        verbose_name_plural = 'Рекомендации пользователям'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'], name='userrecommendation_user_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} → {self.service_id} ({self.rank})'
+
+
+class ServiceRecommendation(models.Model):
+    # «С этой услугой также выбирают»: совместная встречаемость в избранном, отзывах и поиске.
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='recommendations')
+    candidate = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = 'Рекомендация к услуге'
+        verbose_name_plural = 'Рекомендации к услугам'
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'rank'], name='servicerecommendation_service_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.service_id} → {self.candidate_id} ({self.rank})'
+
+
 class ReviewPhoto(models.Model):
     review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='photos')
     photo = models.ImageField(upload_to='review_photos/')
 
 class Chat(models.Model):
-    participants = models.ManyToManyField(settings.AUTH_USER_MODEL)
+    participants = models.ManyToManyField(settings.AUTH_USER_MODEL, through='ChatParticipant')
     service = models.ForeignKey(Service, on_delete=models.CASCADE, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Последнее сообщение для превью во «Входящих»; поддерживается сигналами (services/chats.py).
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+
+class ChatParticipant(models.Model):
+    # Промежуточная таблица participants. last_message_at — копия времени последнего сообщения
+    # чата (или времени добавления участника), чтобы «Входящие» читались по индексу (user, last_message_at).
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    last_message_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # Таблица и уникальность остались от автоматической промежуточной модели.
+        db_table = 'services_chat_participants'
+        unique_together = [['chat', 'user']]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='chatparticipant_inbox_idx'),
+        ]
 
 class Message(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
@@ -128,6 +336,12 @@ class Message(models.Model):
     photo = models.ImageField(upload_to='chat_photos/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Страницы сообщений чата по after_id/before_id (ChatViewSet.messages).
+        indexes = [
+            models.Index(fields=['chat', 'id'], name='message_chat_id_idx'),
+        ]
+
 class UserSettings(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='settings')
     notifications = models.BooleanField(default=True)
@@ -1,6 +1,249 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from django.db.models.expressions import OrderBy
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+def model_field(model, name):
+    """Поле модели по пути вида category__name; None для аннотаций."""
+    field = None
+    for part in name.split('__'):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model or model
+    return field
+
+
+def order_expression(model, name, descending):
+    """
+    Сортировка по полю с NULL больше любого значения (как в PostgreSQL),
+    явно для обеих СУБД. Её же использует ServiceOrderingFilter, чтобы порядок
+    с курсором и без совпадал.
+    """
+    field = model_field(model, name)
+    if field is not None and not field.null:
+        # Без NULLS FIRST/LAST: иначе SQLite не может взять порядок из индекса.
+        return F(name).desc() if descending else F(name).asc()
+    if descending:
+        return F(name).desc(nulls_first=True)
+    return F(name).asc(nulls_last=True)
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 12
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (keyset): курсор хранит значения полей сортировки
+    последней строки, следующая страница — это WHERE (поля) > (значения)
+    с LIMIT, без COUNT(*) и OFFSET. К сортировке всегда добавляется id,
+    чтобы порядок был однозначным. NULL считается больше любого значения
+    (как в PostgreSQL), порядок NULL задаётся явно для обеих СУБД.
+
+    Клиент включает режим параметром ?pagination=cursor или передав ?cursor=;
+    без них работает обычная постраничная пагинация (fallback_class), а если
+    её нет — список отдаётся целиком, как раньше.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    fallback_class = StandardResultsSetPagination
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def __init__(self):
+        self.fallback = self.fallback_class() if self.fallback_class else None
+        self.keyset = False
+
+    def is_requested(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    # --- сортировка ---
+
+    def get_ordering(self, queryset):
+        ordering = []
+        for item in queryset.query.order_by or queryset.model._meta.ordering:
+            if isinstance(item, OrderBy) and isinstance(item.expression, F):
+                ordering.append((item.expression.name, item.descending))
+            elif isinstance(item, str) and item != '?':
+                ordering.append((item.lstrip('-'), item.startswith('-')))
+        ordering = [(('id' if name == 'pk' else name), desc) for name, desc in ordering]
+        if not any(name == 'id' for name, _ in ordering):
+            ordering.append(('id', ordering[0][1] if ordering else True))
+        return ordering
+
+    def _order_expression(self, model, name, descending):
+        return order_expression(model, name, descending)
+
+    def _field(self, model, name):
+        return model_field(model, name)
+
+    def _after(self, model, name, descending, value):
+        """Условие «строго после value» для одного поля."""
+        field = self._field(model, name)
+        nullable = field is None or field.null
+        if value is None:
+            return Q(**{f'{name}__isnull': False}) if descending else Q(pk__in=[])
+        condition = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+        if nullable and not descending:
+            condition |= Q(**{f'{name}__isnull': True})
+        return condition
+
+    @staticmethod
+    def _equal(name, value):
+        if value is None:
+            return Q(**{f'{name}__isnull': True})
+        return Q(**{name: value})
+
+    def keyset_filter(self, model, ordering, values):
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for (name, descending), value in zip(ordering, values):
+            condition |= prefix & self._after(model, name, descending, value)
+            prefix &= self._equal(name, value)
+        return condition
+
+    # --- курсор ---
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'v': values, 'r': reverse}, default=str, separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            values, reverse = payload['v'], bool(payload['r'])
+            if len(values) != len(ordering):
+                raise ValueError
+            parsed = []
+            for (name, _), value in zip(ordering, values):
+                field = self._field(model, name)
+                parsed.append(field.to_python(value) if field is not None and value is not None else value)
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return parsed, reverse
+
+    @staticmethod
+    def _row_values(obj, ordering):
+        values = []
+        for name, _ in ordering:
+            value = obj
+            for part in name.split('__'):
+                value = getattr(value, part, None)
+            values.append(getattr(value, 'pk', value))
+        return values
+
+    # --- BasePagination ---
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.is_requested(request)
+        if not self.keyset:
+            if self.fallback is None:
+                return None
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.mode_query_param)
+        page_size = self.get_page_size(request)
+        model = queryset.model
+        ordering = self.get_ordering(queryset)
+        values, reverse = self.decode_cursor(request, model, ordering)
+
+        direction = [(name, desc != reverse) for name, desc in ordering]
+        queryset = queryset.order_by(*(self._order_expression(model, name, desc) for name, desc in direction))
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(model, direction, values))
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_link = self.previous_link = None
+        if rows:
+            if has_more or reverse:
+                self.next_link = self.encode_cursor(self._row_values(rows[-1], ordering), False)
+            if values is not None and (has_more or not reverse):
+                self.previous_link = self.encode_cursor(self._row_values(rows[0], ordering), True)
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return self.fallback.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response_schema(schema)
+        return schema
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'cursor — включить пагинацию по курсору',
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Курсор страницы из ссылок next/previous',
+                'schema': {'type': 'string'},
+            },
+        ]
+        if self.fallback is not None:
+            parameters += self.fallback.get_schema_operation_parameters(view)
+        else:
+            parameters.append({
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Размер страницы',
+                'schema': {'type': 'integer'},
+            })
+        return parameters
+
+
+class OptionalKeysetPagination(KeysetPagination):
+    """Для списков, которые раньше отдавались без пагинации: курсор только по запросу."""
+    fallback_class = None
+
+
+class CursorOnlyPagination(KeysetPagination):
+    """Только по курсору, без номеров страниц и COUNT(*): для лент вроде «Входящих»."""
+    fallback_class = None
+
+    def is_requested(self, request):
+        return True
@@ -0,0 +1,89 @@
+"""
+Рейтинг услуги без пересчёта всех отзывов.
+
+У услуги хранится гистограмма оценок rating_1 … rating_5, review_count и
+average_rating. Создание, изменение и удаление отзыва меняют их одним
+UPDATE с F()-выражениями: счётчики сдвигаются на ±1, а среднее считается
+из гистограммы в том же запросе (в UPDATE справа видны значения строки до
+изменения, поэтому к ним прибавляются те же дельты).
+
+Если счётчики всё же разошлись с отзывами (массовые операции в обход
+сигналов, ручные правки), их выравнивает команда reconcile_ratings.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Service
+
+RATINGS = (1, 2, 3, 4, 5)
+HISTOGRAM_FIELDS = tuple(f'rating_{rating}' for rating in RATINGS)
+
+
+def apply_rating_deltas(service_id, deltas):
+    """deltas: {оценка: ±число отзывов} для одной услуги."""
+    deltas = {rating: delta for rating, delta in deltas.items() if delta and rating in RATINGS}
+    if not deltas:
+        return
+    count_delta = sum(deltas.values())
+    total = sum(rating * (F(f'rating_{rating}') + deltas.get(rating, 0)) for rating in RATINGS)
+    count = F('review_count') + count_delta
+    Service.objects.filter(pk=service_id).update(
+        **{f'rating_{rating}': F(f'rating_{rating}') + delta for rating, delta in deltas.items()},
+        review_count=count,
+        average_rating=Case(
+            When(review_count__lte=-count_delta, then=Value(0.0)),
+            default=Cast(total, FloatField()) / count,
+            output_field=FloatField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def histogram_values(histogram):
+    """{оценка: число} -> значения полей гистограммы, review_count и average_rating."""
+    count = sum(histogram.values())
+    total = sum(rating * number for rating, number in histogram.items())
+    values = {f'rating_{rating}': histogram.get(rating, 0) for rating in RATINGS}
+    values['review_count'] = count
+    values['average_rating'] = total / count if count else 0
+    return values
+
+
+def reconcile(service_model, review_model, fix=True, service_ids=None):
+    """
+    Пересчитывает рейтинги услуг (всех или service_ids) по отзывам одним GROUP BY
+    и сравнивает с сохранёнными. Возвращает список (id услуги, было, стало) для
+    разошедшихся; при fix=True исправляет их. Модели передаются, чтобы работать
+    и из миграции.
+    """
+    histograms = defaultdict(dict)
+    services = service_model.objects.all()
+    reviews = review_model.objects.all()
+    if service_ids is not None:
+        services = services.filter(pk__in=service_ids)
+        reviews = reviews.filter(service_id__in=service_ids)
+    rows = reviews.values('service_id', 'rating').annotate(number=Count('id')).order_by()
+    for row in rows:
+        histograms[row['service_id']][row['rating']] = row['number']
+
+    fields = (*HISTOGRAM_FIELDS, 'review_count', 'average_rating')
+    now = timezone.now()
+    drift, changed = [], []
+    for service in services.only('pk', 'updated_at', *fields).iterator():
+        expected = histogram_values(histograms.get(service.pk, {}))
+        stored = {name: getattr(service, name) for name in fields}
+        if any(
+            abs(stored[name] - expected[name]) > 1e-9 if name == 'average_rating' else stored[name] != expected[name]
+            for name in fields
+        ):
+            drift.append((service.pk, stored, expected))
+            for name, value in expected.items():
+                setattr(service, name, value)
+            service.updated_at = now
+            changed.append(service)
+    if fix and changed:
+        service_model.objects.bulk_update(changed, [*fields, 'updated_at'], batch_size=500)
+    return drift
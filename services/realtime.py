@@ -0,0 +1,193 @@
+"""
+События чатов и уведомлений для подключённых клиентов.
+
+Событие — словарь для конкретных пользователей: {'type': 'message', ...} при
+новом сообщении в их чате, {'type': 'notification', ...} при новом уведомлении.
+Сигналы публикуют его после коммита (publish), а WebSocket /ws/events/
+(см. websocket.py) и long-poll /api/events/poll/ (EventPollView) получают
+события своего пользователя через subscribe.
+
+Брокер задаётся настройкой REALTIME_BROKER. InMemoryBroker доставляет события
+только внутри процесса — для одного узла и тестов. RedisBroker рассылает их
+через Redis pub/sub, и событие из любого воркера доходит до соединений во всех.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from .models import ChatParticipant
+from .serializers import MessageSerializer
+
+QUEUE_SIZE = 100
+REDIS_CHANNEL = 'realtime:events'
+REDIS_RETRY_DELAY = 1
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд long-poll ждёт событие (меньше таймаутов прокси).
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_TIMEOUT_MAX = 55
+
+
+class Subscription:
+    """Очередь событий одного соединения; живёт в цикле событий, где создана."""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def put(self, event):
+        # Медленный клиент теряет самые старые события, а не тормозит остальных;
+        # пропущенное он догружает через /chats/updates/.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Следующее событие; None, если за timeout секунд ничего не пришло."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def pending(self):
+        """Уже пришедшие события без ожидания."""
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_ids, event):
+        self.deliver(user_ids, event)
+
+    def deliver(self, user_ids, event):
+        """Раздаёт событие подпискам этого процесса; вызывается из любого потока."""
+        with self._lock:
+            targets = [s for user_id in set(user_ids) for s in self._subscriptions.get(user_id, ())]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # Цикл соединения уже закрыт, отписка вот-вот случится.
+                pass
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Публикация — в общий канал Redis; в каждом процессе слушатель канала
+    раздаёт события своим подпискам. Слушатель запускается с первой подпиской.
+    """
+
+    def __init__(self, url, **options):
+        import redis
+
+        super().__init__(**options)
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        if self._listener is None or self._listener.done() or self._listener.get_loop() is not subscription.loop:
+            self._listener = subscription.loop.create_task(self._listen())
+        return subscription
+
+    def publish(self, user_ids, event):
+        self._client.publish(REDIS_CHANNEL, json.dumps({'users': list(user_ids), 'event': event}, cls=DjangoJSONEncoder))
+
+    def _receive(self, data):
+        try:
+            payload = json.loads(data)
+            user_ids, event = payload['users'], payload['event']
+        except (ValueError, TypeError, KeyError):
+            logger.warning('Некорректное сообщение в канале %s: %r', REDIS_CHANNEL, data)
+            return
+        self.deliver(user_ids, event)
+
+    async def _listen(self):
+        from redis import asyncio as aioredis
+        from redis.exceptions import ConnectionError as RedisConnectionError
+
+        # Слушатель не должен завершаться молча: без него подписчики процесса не получают ничего.
+        while True:
+            try:
+                async with aioredis.Redis.from_url(self.url).pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(REDIS_CHANNEL)
+                    async for message in pubsub.listen():
+                        self._receive(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except RedisConnectionError:
+                await asyncio.sleep(REDIS_RETRY_DELAY)
+            except Exception:
+                logger.exception('Слушатель канала %s упал, переподключаемся', REDIS_CHANNEL)
+                await asyncio.sleep(REDIS_RETRY_DELAY)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        config = getattr(settings, 'REALTIME_BROKER', {})
+        _broker = import_string(config.get('BACKEND', 'services.realtime.InMemoryBroker'))(**config.get('OPTIONS', {}))
+    return _broker
+
+
+# --- События ------------------------------------------------------------------
+
+def message_created(message):
+    recipients = ChatParticipant.objects.filter(chat_id=message.chat_id).values_list('user_id', flat=True)
+    event = {'type': 'message', 'chat': message.chat_id, 'message': MessageSerializer(message).data}
+    get_broker().publish(list(recipients), event)
+
+
+def notification_event(notification):
+    return {
+        'type': 'notification',
+        'notification': {
+            'id': notification.pk,
+            'type': notification.type,
+            'created_at': notification.created_at,
+            **notification.render_content(),
+        },
+    }
+
+
+def notification_created(notification):
+    get_broker().publish([notification.user_id], notification_event(notification))
@@ -0,0 +1,174 @@
+"""
+Рекомендации услуг по совместной встречаемости (item-item).
+
+Сигналы интереса пользователя к услуге:
+  * избранное (модель Favorite и user.favorites) — вес FAVORITE_WEIGHT;
+  * отзыв — вес по оценке (REVIEW_WEIGHTS), плохие оценки не считаются;
+  * поиск — первые SEARCH_RESULTS услуг по каждому из последних запросов.
+
+Две услуги похожи, если ими интересуются одни и те же люди:
+sim(i, j) = Σ w(u, i)·w(u, j) / √(Σ w(u, i)² · Σ w(u, j)²) — косинус по пользователям.
+Для пользователя кандидат набирает Σ w(u, i)·sim(i, c) по его услугам.
+
+Считается целиком командой build_recommendations и складывается в таблицы
+UserRecommendation и ServiceRecommendation; API только читает готовые строки.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import RECOMMENDATIONS_VERSION, bump_version, get_version
+from .models import Favorite, Review, SearchHistory, Service, ServiceRecommendation, UserRecommendation
+from .search import fold, order_by_rank, search_services
+
+FAVORITE_WEIGHT = 3.0
+REVIEW_WEIGHTS = {5: 2.0, 4: 1.5, 3: 0.5}
+SEARCH_WEIGHT = 1.0
+SEARCH_RESULTS = 5
+SEARCH_QUERIES_PER_USER = 20
+# У активных пользователей берём самые сильные сигналы, чтобы пары не росли квадратично.
+ITEMS_PER_USER = 50
+
+USER_TOP_N = 30
+SERVICE_TOP_N = 20
+
+RECOMMENDED_LIMIT = 12
+RECOMMENDED_CACHE_TIMEOUT = 10 * 60
+
+
+def collect_interactions():
+    """
+    ({user_id: {service_id: вес}}, {user_id: {service_id, ...}}) — веса сигналов
+    и услуги, которые пользователь уже выбрал (избранное, отзыв): их не советуем.
+    """
+    interactions = defaultdict(lambda: defaultdict(float))
+    chosen = defaultdict(set)
+
+    favorites = list(Favorite.objects.values_list('user_id', 'service_id'))
+    favorites += get_user_model().favorites.through.objects.values_list('user_id', 'service_id')
+    for user_id, service_id in favorites:
+        interactions[user_id][service_id] = max(interactions[user_id][service_id], FAVORITE_WEIGHT)
+        chosen[user_id].add(service_id)
+
+    for user_id, service_id, rating in Review.objects.values_list('author_id', 'service_id', 'rating'):
+        chosen[user_id].add(service_id)
+        weight = REVIEW_WEIGHTS.get(rating)
+        if weight:
+            interactions[user_id][service_id] += weight
+
+    results = {}
+    queries = defaultdict(list)
+    for user_id, query in SearchHistory.objects.order_by('user_id', '-created_at').values_list('user_id', 'query'):
+        query = ' '.join(fold(query).split())
+        if query and query not in queries[user_id] and len(queries[user_id]) < SEARCH_QUERIES_PER_USER:
+            queries[user_id].append(query)
+    for user_id, user_queries in queries.items():
+        for query in user_queries:
+            if query not in results:
+                found = order_by_rank(search_services(Service.objects.all(), query))
+                results[query] = list(found.values_list('pk', flat=True)[:SEARCH_RESULTS])
+            for service_id in results[query]:
+                interactions[user_id][service_id] += SEARCH_WEIGHT
+
+    interactions = {
+        user_id: dict(heapq.nlargest(ITEMS_PER_USER, items.items(), key=lambda item: item[1]))
+        for user_id, items in interactions.items()
+    }
+    return interactions, chosen
+
+
+def item_similarities(interactions):
+    """{service_id: {candidate_id: sim}} — косинус по пользователям."""
+    norms = defaultdict(float)
+    dots = defaultdict(lambda: defaultdict(float))
+    for items in interactions.values():
+        entries = list(items.items())
+        for index, (i, wi) in enumerate(entries):
+            norms[i] += wi * wi
+            for j, wj in entries[index + 1:]:
+                dots[i][j] += wi * wj
+                dots[j][i] += wi * wj
+    return {
+        i: {j: dot / math.sqrt(norms[i] * norms[j]) for j, dot in row.items()}
+        for i, row in dots.items()
+    }
+
+
+def top_candidates(scores, n):
+    return heapq.nlargest(n, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def user_scores(items, similarities, exclude):
+    scores = defaultdict(float)
+    for i, weight in items.items():
+        for candidate, sim in similarities.get(i, {}).items():
+            if candidate not in exclude:
+                scores[candidate] += weight * sim
+    return scores
+
+
+def build_recommendations(user_top_n=USER_TOP_N, service_top_n=SERVICE_TOP_N):
+    """Пересчитывает обе таблицы целиком; возвращает (строк для пользователей, строк для услуг)."""
+    interactions, chosen = collect_interactions()
+    similarities = item_similarities(interactions)
+    executors = defaultdict(set)
+    for service_id, executor_id in Service.objects.values_list('pk', 'executor_id'):
+        executors[executor_id].add(service_id)
+
+    service_rows = [
+        ServiceRecommendation(service_id=service_id, candidate_id=candidate, score=score, rank=rank)
+        for service_id, row in similarities.items()
+        for rank, (candidate, score) in enumerate(top_candidates(row, service_top_n))
+    ]
+    user_rows = []
+    for user_id, items in interactions.items():
+        # Уже выбранное и собственные услуги не советуем; найденное поиском — можно.
+        exclude = chosen.get(user_id, set()) | executors.get(user_id, set())
+        scores = user_scores(items, similarities, exclude)
+        user_rows += [
+            UserRecommendation(user_id=user_id, service_id=candidate, score=score, rank=rank)
+            for rank, (candidate, score) in enumerate(top_candidates(scores, user_top_n))
+        ]
+
+    with transaction.atomic():
+        UserRecommendation.objects.all().delete()
+        ServiceRecommendation.objects.all().delete()
+        UserRecommendation.objects.bulk_create(user_rows, batch_size=1000)
+        ServiceRecommendation.objects.bulk_create(service_rows, batch_size=1000)
+        transaction.on_commit(lambda: bump_version(RECOMMENDATIONS_VERSION))
+    return len(user_rows), len(service_rows)
+
+
+def recommended_ids(user=None, service=None, limit=RECOMMENDED_LIMIT):
+    """
+    id услуг для /services/recommended/: готовые строки для пользователя
+    (или к услуге), добитые популярными. Список кэшируется отдельно для каждого
+    пользователя и услуги до следующего пересчёта.
+    """
+    key = f'recommended:{get_version(RECOMMENDATIONS_VERSION)}:{user.pk if user else "-"}:{service or "-"}:{limit}'
+    ids = cache.get(key)
+    if ids is not None:
+        return ids
+    if service is not None:
+        ids = list(
+            ServiceRecommendation.objects.filter(service=service)
+            .order_by('rank').values_list('candidate_id', flat=True)[:limit]
+        )
+    elif user is not None:
+        ids = list(
+            UserRecommendation.objects.filter(user=user)
+            .order_by('rank').values_list('service_id', flat=True)[:limit]
+        )
+    else:
+        ids = []
+    if len(ids) < limit:
+        popular = Service.objects.exclude(pk__in=ids)
+        if service is not None:
+            popular = popular.exclude(pk=service)
+        ids += list(popular.order_by('-popularity', '-id').values_list('pk', flat=True)[:limit - len(ids)])
+    cache.set(key, ids, RECOMMENDED_CACHE_TIMEOUT)
+    return ids
@@ -0,0 +1,248 @@
+"""
+Полнотекстовый поиск по услугам.
+
+Для каждой услуги хранится нормализованный поисковый документ
+(ServiceSearchDocument): заголовок и тело (описание, категория, подкатегории),
+приведённые к нижнему регистру, с заменой ё→е и русским стеммингом.
+Поверх документа работает индекс конкретной СУБД: FTS5 на SQLite
+и tsvector + GIN на PostgreSQL.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Service, ServiceSearchDocument
+
+SQLITE_FTS_TABLE = 'services_servicesearch_fts'
+
+# Вес совпадения в заголовке относительно совпадения в теле документа.
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+INDEX_CHUNK_SIZE = 500
+
+_TOKEN_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'^[а-я]+$')
+
+
+# --- Нормализация -----------------------------------------------------------
+# Стеммер Портера для русского языка (Snowball).
+
+_PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_I = re.compile(r'и$')
+_SOFT_SIGN = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+
+
+def stem(word):
+    """Возвращает основу русского слова. Остальные слова не изменяются."""
+    if len(word) < 3 or not _CYRILLIC_RE.match(word):
+        return word
+    match = _RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+
+    rv = _I.sub('', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+
+    temp = _SOFT_SIGN.sub('', rv, 1)
+    if temp == rv:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        rv = _NN.sub('н', rv, 1)
+    else:
+        rv = temp
+    return prefix + rv
+
+
+def fold(text):
+    """Приводит текст к нижнему регистру с учётом Юникода и заменяет ё на е."""
+    return (text or '').casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text))
+
+
+def normalize(text):
+    """Текст → строка основ слов через пробел."""
+    return ' '.join(stem(token) for token in tokenize(text))
+
+
+def query_terms(query):
+    """Основы слов поискового запроса без повторов, в исходном порядке."""
+    return list(dict.fromkeys(stem(token) for token in tokenize(query)))
+
+
+# --- Бэкенды ----------------------------------------------------------------
+
+class BaseSearchBackend:
+    """
+    Бэкенд хранит индекс по ServiceSearchDocument и умеет фильтровать
+    queryset услуг по запросу. Аннотация search_rank: чем меньше, тем
+    релевантнее.
+    """
+
+    def index(self, documents):
+        pass
+
+    def remove(self, service_ids):
+        pass
+
+    def search(self, queryset, terms):
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    def index(self, documents):
+        rows = [(doc.service_id, doc.title, doc.body) for doc in documents]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {SQLITE_FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, service_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in service_ids])
+
+    def search(self, queryset, terms):
+        expression = ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        service_table = connection.ops.quote_name(Service._meta.db_table)
+        matched = RawSQL(f'SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s', [expression])
+        rank = RawSQL(
+            f'SELECT bm25({SQLITE_FTS_TABLE}, {TITLE_WEIGHT}, {BODY_WEIGHT}) FROM {SQLITE_FTS_TABLE} '
+            f'WHERE {SQLITE_FTS_TABLE} MATCH %s AND rowid = {service_table}.id',
+            [expression],
+        )
+        return queryset.filter(pk__in=matched).annotate(search_rank=rank)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    def index(self, documents):
+        table = ServiceSearchDocument._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET search_vector = "
+                f"setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B') "
+                f"WHERE service_id = ANY(%s)",
+                [[doc.service_id for doc in documents]],
+            )
+
+    def search(self, queryset, terms):
+        table = ServiceSearchDocument._meta.db_table
+        service_table = connection.ops.quote_name(Service._meta.db_table)
+        expression = ' & '.join("'%s':*" % term.replace("'", "''") for term in terms)
+        matched = RawSQL(
+            f"SELECT service_id FROM {table} WHERE search_vector @@ to_tsquery('simple', %s)", [expression]
+        )
+        rank = RawSQL(
+            f"SELECT -ts_rank_cd(search_vector, to_tsquery('simple', %s), 32) FROM {table} "
+            f"WHERE service_id = {service_table}.id",
+            [expression],
+        )
+        return queryset.filter(pk__in=matched).annotate(search_rank=rank)
+
+
+class FallbackSearchBackend(BaseSearchBackend):
+    """Для СУБД без полнотекстового индекса: подстрочный поиск по нормализованному документу."""
+
+    def search(self, queryset, terms):
+        condition = Q()
+        for term in terms:
+            condition &= Q(search_document__title__contains=term) | Q(search_document__body__contains=term)
+        return queryset.filter(condition).annotate(search_rank=Value(0.0))
+
+
+_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    return _BACKENDS.get(connection.vendor, FallbackSearchBackend)()
+
+
+# --- Индексация -------------------------------------------------------------
+
+def build_document(service):
+    body_parts = [service.description]
+    if service.category_id:
+        body_parts.append(service.category.name)
+    body_parts.extend(sub.name for sub in service.subcategories.all())
+    return ServiceSearchDocument(
+        service_id=service.pk,
+        title=normalize(service.title),
+        body=normalize(' '.join(body_parts)),
+        updated_at=timezone.now(),
+    )
+
+
+def index_services(service_ids):
+    """Пересобирает поисковые документы указанных услуг; удалённые услуги убирает из индекса."""
+    service_ids = list(service_ids)
+    backend = get_search_backend()
+    for start in range(0, len(service_ids), INDEX_CHUNK_SIZE):
+        chunk = service_ids[start:start + INDEX_CHUNK_SIZE]
+        services = (
+            Service.objects.filter(pk__in=chunk)
+            .select_related('category')
+            .prefetch_related('subcategories')
+        )
+        documents = [build_document(service) for service in services]
+        ServiceSearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['service'],
+            update_fields=['title', 'body', 'updated_at'],
+        )
+        backend.index(documents)
+        missing = set(chunk) - {doc.service_id for doc in documents}
+        if missing:
+            remove_services(missing)
+
+
+def remove_services(service_ids):
+    service_ids = list(service_ids)
+    ServiceSearchDocument.objects.filter(service_id__in=service_ids).delete()
+    get_search_backend().remove(service_ids)
+
+
+def search_services(queryset, query):
+    terms = query_terms(query)
+    if not terms:
+        return queryset
+    return get_search_backend().search(queryset, terms)
+
+
+def order_by_rank(queryset):
+    return queryset.order_by(F('search_rank').asc(), '-popularity', '-id')
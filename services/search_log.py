@@ -0,0 +1,54 @@
+"""
+Запись поисковых запросов в SearchHistory.
+
+Запрос списка только кладёт (пользователь, запрос) в буфер процесса
+(ProcessBuffer); фоновый поток раз в FLUSH_INTERVAL секунд или после
+FLUSH_SIZE запросов пишет их одним bulk_create. Повторы того же запроса
+тем же пользователем в пределах DEDUP_WINDOW не записываются: внутри буфера
+они сливаются, а с уже записанными сверяются одним запросом при сбросе.
+created_at — время поиска, запомненное при постановке в буфер, а не время
+сброса: иначе поздний сброс попал бы в свёртке не в тот час или день.
+Свёртка старых строк — в search_stats.py.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .buffers import ProcessBuffer
+from .models import SearchHistory
+from .search_stats import QUERY_MAX_LENGTH, normalize_query
+
+FLUSH_INTERVAL = 5
+FLUSH_SIZE = 200
+DEDUP_WINDOW = timedelta(minutes=10)
+
+
+def write_searches(items):
+    """items: {(user_id, нормализованный запрос): (запрос как введён, время поиска)}"""
+    since = min(searched_at for _, searched_at in items.values()) - DEDUP_WINDOW
+    recent = SearchHistory.objects.filter(
+        user_id__in={user_id for user_id, _ in items}, created_at__gte=since,
+    ).values_list('user_id', 'query', 'created_at')
+    logged = defaultdict(list)
+    for user_id, query, created_at in recent:
+        logged[user_id, normalize_query(query)].append(created_at)
+    rows = [
+        SearchHistory(user_id=user_id, query=query[:QUERY_MAX_LENGTH], created_at=searched_at)
+        for (user_id, key), (query, searched_at) in items.items()
+        if not any(abs(searched_at - created_at) < DEDUP_WINDOW for created_at in logged[user_id, key])
+    ]
+    SearchHistory.objects.bulk_create(rows)
+
+
+_buffer = ProcessBuffer(write_searches, FLUSH_INTERVAL, FLUSH_SIZE, merge=lambda first, repeated: first)
+
+
+def log_search(user_id, query):
+    key = normalize_query(query)
+    if key:
+        _buffer.add((user_id, key), (query.strip(), timezone.now()))
+
+
+def flush():
+    _buffer.flush()
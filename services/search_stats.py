@@ -0,0 +1,156 @@
+"""
+Свёртка журнала поисковых запросов.
+
+Сырые строки SearchHistory нужны за последние дни (история пользователя,
+рекомендации). Команда rollup_search_history сворачивает завершённые дни в
+SearchQueryDaily (нормализованный запрос, число поисков за день), запоминая
+в RollupWatermark, докуда свёрнуто, и удаляет сырые строки старше
+RAW_RETENTION_DAYS. Частые запросы для подсказок и словаря опечаток
+(top_queries) — суммы свёртки плюс GROUP BY только по ещё не свёрнутым сырым
+строкам (после отметки DAILY, а без неё — за RAW_RETENTION_DAYS дней).
+
+Для популярных запросов та же команда (её стоит запускать раз в несколько
+минут) дописывает новые строки журнала в почасовые счётчики SearchQueryHourly
+от отметки HOURLY до «сейчас минус ROLLUP_LAG». trending() суммирует часы
+окна и кэшируется до следующего шага свёртки (версия TRENDING_VERSION).
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Sum
+from django.utils import timezone
+
+from .cache import TRENDING_VERSION, bump_version, get_version
+from .models import RollupWatermark, SearchHistory, SearchQueryDaily, SearchQueryHourly
+from .search import fold
+
+RAW_RETENTION_DAYS = 30
+QUERY_MAX_LENGTH = 255
+
+# Строки пишутся из буфера с опозданием в несколько секунд (search_log.FLUSH_INTERVAL)
+# и со временем поиска, поэтому самые свежие секунды не сворачиваем, чтобы не пропустить их.
+ROLLUP_LAG = timedelta(seconds=30)
+TRENDING_WINDOWS = {'1h': timedelta(hours=1), '24h': timedelta(hours=24), '7d': timedelta(days=7)}
+TRENDING_LIMIT_MAX = 50
+TRENDING_CACHE_TIMEOUT = 15 * 60
+
+
+def normalize_query(query):
+    return ' '.join(fold(query).split())[:QUERY_MAX_LENGTH]
+
+
+DAILY = 'daily'
+HOURLY = 'hourly'
+
+
+def get_watermark(name):
+    return RollupWatermark.objects.filter(name=name).values_list('position', flat=True).first()
+
+
+def set_watermark(name, position):
+    RollupWatermark.objects.update_or_create(name=name, defaults={'position': position})
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rollup(retention_days=RAW_RETENTION_DAYS):
+    """
+    Сворачивает завершённые дни после отметки DAILY и удаляет сырые строки
+    старше retention_days (но не раньше, чем их день свёрнут). Возвращает число свёрнутых дней.
+    """
+    today = timezone.localdate()
+    watermark = get_watermark(DAILY)
+    if watermark is None:
+        watermark = SearchHistory.objects.aggregate(first=Min('created_at'))['first']
+    day = timezone.localdate(watermark) if watermark else today
+    rolled = 0
+    while day < today:
+        start, end = _day_start(day), _day_start(day + timedelta(days=1))
+        counts = Counter()
+        queries = SearchHistory.objects.filter(created_at__gte=start, created_at__lt=end).values_list('query', flat=True)
+        for query in queries.iterator():
+            key = normalize_query(query)
+            if key:
+                counts[key] += 1
+        with transaction.atomic():
+            SearchQueryDaily.objects.filter(date=day).delete()
+            SearchQueryDaily.objects.bulk_create(
+                [SearchQueryDaily(date=day, query=query, count=count) for query, count in counts.items()],
+                batch_size=1000,
+            )
+            set_watermark(DAILY, end)
+        day += timedelta(days=1)
+        rolled += 1
+    keep_from = _day_start(min(today - timedelta(days=retention_days), day))
+    SearchHistory.objects.filter(created_at__lt=keep_from).delete()
+    return rolled
+
+
+def top_queries(limit):
+    """[(нормализованный запрос, число поисков)] по свёртке и ещё не свёрнутым строкам."""
+    totals = Counter(dict(
+        SearchQueryDaily.objects.values('query').annotate(total=Sum('count')).order_by().values_list('query', 'total')
+    ))
+    since = get_watermark(DAILY) or timezone.now() - timedelta(days=RAW_RETENTION_DAYS)
+    recent = (
+        SearchHistory.objects.filter(created_at__gte=since)
+        .values('query').annotate(total=Count('id')).order_by().values_list('query', 'total')
+    )
+    for query, total in recent.iterator():
+        key = normalize_query(query)
+        if key:
+            totals[key] += total
+    return totals.most_common(limit)
+
+
+def _hour_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_hourly():
+    """Добавляет строки журнала после отметки HOURLY к почасовым счётчикам. Возвращает число строк."""
+    now = timezone.now()
+    until = now - ROLLUP_LAG
+    oldest = _hour_start(now - max(TRENDING_WINDOWS.values()))
+    since = get_watermark(HOURLY)
+    if since is None or since < oldest:
+        since = oldest
+    counts = Counter()
+    rows = SearchHistory.objects.filter(created_at__gte=since, created_at__lt=until).values_list('created_at', 'query')
+    for created_at, query in rows.iterator():
+        key = normalize_query(query)
+        if key:
+            counts[_hour_start(created_at), key] += 1
+    with transaction.atomic():
+        for (hour, query), count in counts.items():
+            if SearchQueryHourly.objects.filter(hour=hour, query=query).update(count=F('count') + count):
+                continue
+            try:
+                with transaction.atomic():
+                    SearchQueryHourly.objects.create(hour=hour, query=query, count=count)
+            except IntegrityError:
+                SearchQueryHourly.objects.filter(hour=hour, query=query).update(count=F('count') + count)
+        set_watermark(HOURLY, until)
+        SearchQueryHourly.objects.filter(hour__lt=oldest).delete()
+    bump_version(TRENDING_VERSION)
+    return sum(counts.values())
+
+
+def trending(window, limit):
+    """[{'query', 'count'}] — самые частые запросы за окно из TRENDING_WINDOWS."""
+    key = f'search:trending:{get_version(TRENDING_VERSION)}:{window}:{limit}'
+    result = cache.get(key)
+    if result is None:
+        since = _hour_start(timezone.now() - TRENDING_WINDOWS[window])
+        rows = (
+            SearchQueryHourly.objects.filter(hour__gte=since)
+            .values('query').annotate(count=Sum('count'))
+            .order_by('-count', 'query')[:limit]
+        )
+        result = [{'query': row['query'], 'count': row['count']} for row in rows]
+        cache.set(key, result, TRENDING_CACHE_TIMEOUT)
+    return result
@@ -1,10 +1,17 @@
+import hashlib
+
 from rest_framework import serializers
-from django.db import transaction
+from django.core.cache import cache
+from django.db import models, transaction
 from .models import (
     Category, Favorite, SubCategory, Service, ServicePhoto,
-    SearchHistory, Review, ReviewPhoto, Chat, Message, UserSettings
+    SearchHistory, Review, ReviewPhoto, Chat, ChatParticipant, Message, UserSettings
 )
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from .fast_serializers import RELATIONS, render_favorites, render_services, service_row
+from .fieldsets import DynamicFieldsMixin
+from .favorites import get_favorite_resolver
+from .chats import PREVIEW_LENGTH
 
 from django.contrib.auth import get_user_model
 User = get_user_model()
@@ -31,18 +38,125 @@ class ServicePhotoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class ServiceListSerializer(serializers.ModelSerializer):
+SERVICE_FRAGMENT_TIMEOUT = 24 * 60 * 60
+# Увеличить при изменении формата ServiceListSerializer, чтобы не отдавать старые фрагменты.
+SERVICE_FRAGMENT_VERSION = 1
+
+
+class ServiceFragmentListSerializer(serializers.ListSerializer):
+    """Одним get_many достаёт из кэша фрагменты всех услуг страницы."""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.prime_fragments(items)
+        try:
+            return super().to_representation(items)
+        finally:
+            self.child.flush_fragments()
+
+
+class ServiceListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Представление услуги кэшируется целиком по ключу (id, updated_at).
+    Вне кэша считаются только поля из live_fields, зависящие от запроса
+    (is_favorited — по одному запросу на страницу, см. favorites.py;
+    distance — расстояние до точки из ?lat=&lon=, см. geo.py),
+    и раскрытые через ?expand= связи.
+    Изменения фото, подкатегорий и профиля исполнителя сдвигают updated_at
+    услуги (см. signals.py), поэтому старые фрагменты просто перестают читаться.
+    Промахи кэша собираются быстрым путём fast_serializers.render_services;
+    если ?fields= исключает часть связей, промахи собираются без них и в кэш
+    не пишутся. Обычный to_representation DRF остаётся эталоном формата для тестов.
+    """
     photos = ServicePhotoSerializer(many=True, read_only=True)
     subcategories = SubCategorySerializer(many=True, read_only=True)
     executor = serializers.SerializerMethodField() 
+    is_favorited = serializers.SerializerMethodField()
+    distance = serializers.SerializerMethodField()
+
+    live_fields = ('is_favorited', 'distance')
+    expandable_fields = {'category': CategorySerializer}
 
     class Meta:
         model = Service
         fields = [
             'id', 'executor', 'title', 'category', 'subcategories',
             'price', 'experience', 'phone_number', 'popularity', 'created_at', 'photos', 'currency', 'average_rating', 'review_count',
+            'is_favorited', 'distance',
         ]
         ref_name = 'ServiceListSerializer'
+        list_serializer_class = ServiceFragmentListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fragments = None
+        self._pending = {}
+
+    def fragment_key(self, obj):
+        # Ссылки на фото абсолютные, поэтому фрагмент зависит и от адреса, по которому пришёл запрос.
+        request = self.context.get('request')
+        origin = request.build_absolute_uri('/') if request else ''
+        origin = hashlib.md5(origin.encode()).hexdigest()[:8]
+        return f'service:list:{SERVICE_FRAGMENT_VERSION}:{obj.pk}:{obj.updated_at.timestamp()}:{origin}'
+
+    @property
+    def relations(self):
+        return tuple(name for name in RELATIONS if name in self.fields)
+
+    def render_fragments(self, services):
+        """Быстрый путь без полей DRF: пакетные запросы за связанными объектами на все услуги сразу."""
+        rendered = render_services([service_row(obj) for obj in services], self.context.get('request'), self.relations)
+        for fragment in rendered:
+            for name in self.live_fields:
+                fragment.pop(name, None)
+        return {self.fragment_key(obj): fragment for obj, fragment in zip(services, rendered)}
+
+    def prime_fragments(self, services):
+        resolver = get_favorite_resolver(self.context.get('request'))
+        if resolver is not None and 'is_favorited' in self.fields:
+            resolver.prime([obj.pk for obj in services])
+        keys = [self.fragment_key(obj) for obj in services]
+        self._fragments = cache.get_many(keys)
+        missing = [obj for obj, key in zip(services, keys) if key not in self._fragments]
+        if missing:
+            rendered = self.render_fragments(missing)
+            self._fragments.update(rendered)
+            if self.relations == RELATIONS:
+                self._pending = rendered
+
+    def flush_fragments(self):
+        if self._pending:
+            cache.set_many(self._pending, SERVICE_FRAGMENT_TIMEOUT)
+        self._fragments = None
+        self._pending = {}
+
+    def to_representation(self, instance):
+        key = self.fragment_key(instance)
+        fragment = self._fragments.get(key) if self._fragments is not None else cache.get(key)
+        if fragment is None:
+            fragment = self.render_fragments([instance])[key]
+            if self.relations == RELATIONS:
+                cache.set(key, fragment, SERVICE_FRAGMENT_TIMEOUT)
+        live = set(self.live_fields) | self.expanded
+        if not live and not self.restricted:
+            return dict(fragment)
+        return {
+            name: self.live_value(name, instance) if name in live else fragment[name]
+            for name in self.fields
+        }
+
+    def live_value(self, name, instance):
+        field = self.fields[name]
+        attribute = field.get_attribute(instance)
+        return None if attribute is None else field.to_representation(attribute)
+
+    def get_is_favorited(self, obj):
+        resolver = get_favorite_resolver(self.context.get('request'))
+        return resolver.is_favorited(obj.pk) if resolver else False
+
+    def get_distance(self, obj):
+        distance = getattr(obj, 'distance', None)
+        return None if distance is None else round(distance, 2)
 
     def get_executor(self, obj):
         
@@ -63,15 +177,24 @@ class ServiceListSerializer(serializers.ModelSerializer):
         }
 
 
-class ServiceDetailSerializer(serializers.ModelSerializer):
+class ServiceDetailSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     photos = ServicePhotoSerializer(many=True, read_only=True)
     subcategories = SubCategorySerializer(many=True, read_only=True)
     executor = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
 
+    expandable_fields = {'category': CategorySerializer}
+
     class Meta:
         model = Service
-        fields = '__all__'
+        # Явный список: служебные колонки (external_id, координаты исполнителя для
+        # поиска рядом, ячейка сетки) в публичную карточку не попадают.
+        fields = [
+            'id', 'executor', 'category', 'subcategories', 'photos', 'title', 'description',
+            'price', 'currency', 'price_som', 'experience', 'phone_number',
+            'average_rating', 'review_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+            'popularity', 'is_favorited', 'created_at', 'updated_at',
+        ]
         read_only_fields = ['executor', 'created_at', 'updated_at', 'popularity']
         ref_name = 'ServiceDetailSerializer'
 
@@ -91,10 +214,8 @@ class ServiceDetailSerializer(serializers.ModelSerializer):
         }
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return obj in user.favorites.all()
+        resolver = get_favorite_resolver(self.context.get('request'))
+        return resolver.is_favorited(obj.pk) if resolver else False
 
 
 class ServiceCreateUpdateSerializer(serializers.ModelSerializer):
@@ -168,15 +289,33 @@ class ReviewPhotoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
         ref_name = 'ReviewPhotoSerializer'
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewListSerializer(serializers.ListSerializer):
+    """Если услуга раскрыта через ?expand=service, её фрагменты достаются из кэша одним get_many."""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        service_serializer = self.child.fields.get('service')
+        if not isinstance(service_serializer, ServiceListSerializer):
+            return super().to_representation(items)
+        service_serializer.prime_fragments([item.service for item in items])
+        try:
+            return super().to_representation(items)
+        finally:
+            service_serializer.flush_fragments()
+
+
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     photos = ReviewPhotoSerializer(many=True, read_only=True)
     author = serializers.SerializerMethodField()
 
+    expandable_fields = {'service': ServiceListSerializer}
+
     class Meta:
         model = Review
         fields = ['id', 'service', 'author', 'rating', 'text', 'created_at', 'photos']  # ← rating добавлен
         read_only_fields = ['author', 'created_at']
         ref_name = 'ReviewSerializerCustom'
+        list_serializer_class = ReviewListSerializer
 
     def get_author(self, obj):
         a = obj.author
@@ -232,15 +371,32 @@ class MessageSerializer(serializers.ModelSerializer):
         s = obj.sender
         return {'id': s.id, 'username': s.username}
 
+class LastMessageSerializer(serializers.ModelSerializer):
+    """Превью сообщения в списке чатов: без данных отправителя и с обрезанным текстом."""
+    text = serializers.SerializerMethodField()
+    has_photo = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Message
+        fields = ['id', 'sender', 'text', 'has_photo', 'created_at']
+
+    def get_text(self, obj):
+        return obj.text[:PREVIEW_LENGTH]
+
+    def get_has_photo(self, obj):
+        return bool(obj.photo)
+
+
 class ChatSerializer(serializers.ModelSerializer):
-    messages = MessageSerializer(many=True, read_only=True)
+    # Сообщения в чат не вкладываются: они отдаются страницами отдельно.
+    last_message = LastMessageSerializer(read_only=True)
     participants = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(),
         many=True
     )
     class Meta:
         model = Chat
-        fields = ['id', 'participants', 'service', 'created_at', 'messages']
+        fields = ['id', 'participants', 'service', 'created_at', 'last_message']
         read_only_fields = ['created_at']
         ref_name = 'ChatSerializerCustom'
 
@@ -251,6 +407,21 @@ class ChatSerializer(serializers.ModelSerializer):
 
 
 
+class InboxSerializer(serializers.ModelSerializer):
+    """Строка «Входящих» — участие пользователя в чате (ChatParticipant)."""
+    id = serializers.IntegerField(source='chat_id', read_only=True)
+    service = serializers.IntegerField(source='chat.service_id', read_only=True)
+    participants = serializers.SerializerMethodField()
+    last_message = LastMessageSerializer(source='chat.last_message', read_only=True)
+
+    class Meta:
+        model = ChatParticipant
+        fields = ['id', 'service', 'participants', 'last_message', 'last_message_at']
+
+    def get_participants(self, obj):
+        return [participant.user_id for participant in obj.chat.chatparticipant_set.all()]
+
+
 class UserSettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserSettings
@@ -267,11 +438,32 @@ class FavoriteCreateSerializer(serializers.ModelSerializer):
         model = Favorite
         fields = ['service']
 
-class FavoriteListSerializer(serializers.ModelSerializer):
+class FavoriteFragmentListSerializer(serializers.ListSerializer):
+    """Достаёт фрагменты всех услуг из избранного одним обращением к кэшу."""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        fields = self.child.fields
+        services = [None] * len(items)
+        if 'service' in fields:
+            service_serializer = fields['service']
+            service_serializer.prime_fragments([item.service for item in items])
+            try:
+                services = [service_serializer.to_representation(item.service) for item in items]
+            finally:
+                service_serializer.flush_fragments()
+        favorites = render_favorites(items, services)
+        if not self.child.restricted:
+            return favorites
+        return [{name: favorite[name] for name in fields} for favorite in favorites]
+
+
+class FavoriteListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     service = ServiceListSerializer(read_only=True)
 
     class Meta:
         model = Favorite
         fields = ['id', 'service', 'created_at']
+        list_serializer_class = FavoriteFragmentListSerializer
 
 
@@ -1,22 +1,325 @@
+from functools import partial
+
 from django.dispatch import receiver
-from django.db.models.signals import post_save, post_delete
-from services.models import Review, Service, SearchHistory
-from django.db.models import Avg, Count 
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from services.models import (
+    Review, Service, ServicePhoto, Category, SubCategory, SimilarService, ExchangeRate, Message,
+    Notification,
+)
+from services import chats, exchange, geo, ratings, realtime, search, similar, suggest
+from users.models import Location
+from services.cache import CATALOG_VERSION, TAXONOMY_VERSION, bump_version
+
+
+# --- Рейтинг услуги ---------------------------------------------------------
+# Гистограмма и среднее меняются на ±1 отзыв одним UPDATE (см. ratings.py).
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields and not {'rating', 'service'} & set(update_fields)):
+        instance._rating_before = None
+        return
+    instance._rating_before = Review.objects.filter(pk=instance.pk).values_list('service_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_service_rating(sender, instance, created, **kwargs):
+    if created:
+        ratings.apply_rating_deltas(instance.service_id, {instance.rating: 1})
+        return
+    before = getattr(instance, '_rating_before', None)
+    after = (instance.service_id, instance.rating)
+    if before is None or before == after:
+        return
+    if before[0] == after[0]:
+        ratings.apply_rating_deltas(instance.service_id, {before[1]: -1, after[1]: 1})
+    else:
+        ratings.apply_rating_deltas(before[0], {before[1]: -1})
+        ratings.apply_rating_deltas(after[0], {after[1]: 1})
+
+
+@receiver(post_delete, sender=Review)
+def update_service_rating_on_delete(sender, instance, **kwargs):
+    ratings.apply_rating_deltas(instance.service_id, {instance.rating: -1})
+
+
+# --- Поисковый индекс -------------------------------------------------------
+
+def _reindex_on_commit(service_ids):
+    service_ids = list(service_ids)
+    if service_ids:
+        transaction.on_commit(partial(search.index_services, service_ids))
+
+
+@receiver(post_save, sender=Service)
+def index_service(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'title', 'description', 'category'} & set(update_fields):
+        return
+    _reindex_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Service)
+def unindex_service(sender, instance, **kwargs):
+    transaction.on_commit(partial(search.remove_services, [instance.pk]))
+
+
+def _m2m_service_ids(instance, action, reverse, pk_set):
+    """Услуги, чьи подкатегории меняются в этом m2m_changed (None — событие не интересно)."""
+    if action in ('post_add', 'post_remove'):
+        return list(pk_set) if reverse else [instance.pk]
+    if action == 'post_clear' and not reverse:
+        return [instance.pk]
+    if action == 'pre_clear' and reverse:
+        # После очистки связи уже не найти, поэтому запоминаем услуги заранее.
+        return list(instance.services.values_list('pk', flat=True))
+    return None
+
+
+@receiver(m2m_changed, sender=Service.subcategories.through)
+def index_service_subcategories(sender, instance, action, reverse, pk_set, **kwargs):
+    service_ids = _m2m_service_ids(instance, action, reverse, pk_set)
+    if service_ids:
+        _reindex_on_commit(service_ids)
+
+
+@receiver(post_save, sender=Category)
+def index_category_services(sender, instance, created, **kwargs):
+    if not created:
+        _reindex_on_commit(Service.objects.filter(category=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=SubCategory)
+def index_subcategory_services(sender, instance, created, **kwargs):
+    if not created:
+        _reindex_on_commit(instance.services.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def index_deleted_category_services(sender, instance, **kwargs):
+    # SET_NULL обнуляет category услуг одним UPDATE без post_save, а после удаления
+    # их уже не найти по категории, поэтому запоминаем их заранее.
+    _reindex_on_commit(Service.objects.filter(category=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=SubCategory)
+def index_deleted_subcategory_services(sender, instance, **kwargs):
+    _reindex_on_commit(instance.services.values_list('pk', flat=True))
+
+
+# --- Похожие услуги ---------------------------------------------------------
+
+def _update_similar_on_commit(service_ids):
+    # Одна отложенная задача на транзакцию: post_save и m2m_changed одной правки
+    # дописывают id в уже поставленный набор. Сам пересчёт — в фоне (similar.py).
+    service_ids = set(service_ids)
+    if not service_ids:
+        return
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'similar_pending', None)
+    if (
+        pending is not None and connection.in_atomic_block
+        and any(callback is pending for _, callback, _ in connection.run_on_commit)
+    ):
+        pending.keywords['service_ids'] |= service_ids
+        return
+    connection.similar_pending = partial(similar.schedule_update, service_ids=service_ids)
+    transaction.on_commit(connection.similar_pending)
+
+
+@receiver(post_save, sender=Service)
+@receiver(m2m_changed, sender=Service.subcategories.through)
+def similar_service_changed(sender, instance, update_fields=None, action=None, reverse=False, pk_set=None, **kwargs):
+    if sender is Service:
+        if update_fields and not {'title', 'description', 'category'} & set(update_fields):
+            return
+        _update_similar_on_commit([instance.pk])
+    else:
+        _update_similar_on_commit(_m2m_service_ids(instance, action, reverse, pk_set) or ())
+
+
+@receiver(pre_delete, sender=Service)
+def similar_service_deleted(sender, instance, **kwargs):
+    # Строки с удаляемой услугой уйдут каскадом, поэтому заранее запоминаем, чьи списки пересчитать.
+    _update_similar_on_commit(
+        SimilarService.objects.filter(neighbour=instance).values_list('service_id', flat=True)
+    )
+
+
+@receiver(pre_delete, sender=SubCategory)
+def similar_subcategory_deleted(sender, instance, **kwargs):
+    _update_similar_on_commit(instance.services.values_list('pk', flat=True))
+
+
+# --- Подсказки поиска -------------------------------------------------------
 
 @receiver(post_save, sender=Service)
-def save_search_history(sender, instance, created, **kwargs):
-    request = kwargs.get('request', None)
-    if request and 'search' in request.GET:
-        SearchHistory.objects.create(
-            user=request.user,
-            query=request.GET['search']
-        )
-
-@receiver([post_save, post_delete], sender=Review)
-def update_service_rating(sender, instance, **kwargs):
-    service = instance.service
-    agg = service.reviews.aggregate(avg=Avg('rating'), count=Count('id'))
-    service.average_rating = agg['avg'] or 0
-    service.review_count = agg['count'] or 0
-    service.save(update_fields=['average_rating', 'review_count'])
+def suggest_service_title(sender, instance, **kwargs):
+    transaction.on_commit(partial(suggest.service_changed, instance.pk, instance.title))
+
+
+@receiver(post_delete, sender=Service)
+def suggest_remove_service_title(sender, instance, **kwargs):
+    transaction.on_commit(partial(suggest.service_changed, instance.pk, None))
+
+
+@receiver(post_save, sender=SubCategory)
+def suggest_subcategory_name(sender, instance, **kwargs):
+    transaction.on_commit(partial(suggest.subcategory_changed, instance.pk, instance.name))
+
+
+@receiver(post_delete, sender=SubCategory)
+def suggest_remove_subcategory_name(sender, instance, **kwargs):
+    transaction.on_commit(partial(suggest.subcategory_changed, instance.pk, None))
+
+
+# --- Версия каталога ---------------------------------------------------------
+
+@receiver([post_save, post_delete], sender=Service)
+def bump_catalog_version(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, CATALOG_VERSION))
+
+
+@receiver(m2m_changed, sender=Service.subcategories.through)
+def bump_catalog_version_on_subcategories(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(partial(bump_version, CATALOG_VERSION))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+def bump_catalog_version_on_taxonomy(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, CATALOG_VERSION))
+
+
+# --- Дерево категорий --------------------------------------------------------
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+def bump_taxonomy_version(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, TAXONOMY_VERSION))
+
+
+# --- Кэш фрагментов услуг ---------------------------------------------------
+# Ключ фрагмента — (id, updated_at), поэтому изменения связанных объектов
+# сдвигают updated_at услуги.
+
+# Поля пользователя, которые попадают в представление услуги (executor).
+EXECUTOR_FIELDS = {'username', 'first_name', 'last_name', 'role', 'phone_number', 'email'}
+
+
+def _touch_services(**lookup):
+    Service.objects.filter(**lookup).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=ServicePhoto)
+def touch_service_on_photo(sender, instance, **kwargs):
+    _touch_services(pk=instance.service_id)
+
+
+@receiver(m2m_changed, sender=Service.subcategories.through)
+def touch_service_on_subcategories(sender, instance, action, reverse, pk_set, **kwargs):
+    service_ids = _m2m_service_ids(instance, action, reverse, pk_set)
+    if service_ids:
+        _touch_services(pk__in=service_ids)
+
+
+@receiver(post_save, sender=SubCategory)
+def touch_services_on_subcategory(sender, instance, created, **kwargs):
+    if not created:
+        _touch_services(subcategories=instance)
+
+
+@receiver(pre_delete, sender=SubCategory)
+def touch_services_on_subcategory_delete(sender, instance, **kwargs):
+    _touch_services(subcategories=instance)
+
+
+@receiver(post_save, sender=get_user_model())
+def touch_services_on_executor(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and not EXECUTOR_FIELDS & set(update_fields)):
+        return
+    _touch_services(executor=instance)
+
+
+# --- Координаты услуги -------------------------------------------------------
+# Услуга хранит копию координат исполнителя и ячейку сетки (см. geo.py).
+
+def _relocate_services(services, latitude, longitude):
+    values = geo.coordinates(latitude, longitude)
+    if values['latitude'] is None:
+        stale = services.filter(latitude__isnull=False)
+    else:
+        stale = services.exclude(latitude=values['latitude'], longitude=values['longitude'])
+    stale.update(**values, updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Service)
+def locate_service(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'executor' in update_fields:
+        for name, value in geo.executor_coordinates([instance.executor_id])[instance.executor_id].items():
+            setattr(instance, name, value)
+
+
+@receiver(post_save, sender=get_user_model())
+def relocate_executor_services(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and 'location' not in update_fields):
+        return
+    point = Location.objects.filter(pk=instance.location_id).values_list('latitude', 'longitude').first()
+    _relocate_services(Service.objects.filter(executor=instance), *(point or (None, None)))
+
+
+@receiver(post_save, sender=Location)
+def relocate_location_services(sender, instance, created, **kwargs):
+    if not created:
+        _relocate_services(Service.objects.filter(executor__location=instance), instance.latitude, instance.longitude)
+
+
+@receiver(pre_delete, sender=Location)
+def relocate_deleted_location_services(sender, instance, **kwargs):
+    _relocate_services(Service.objects.filter(executor__location=instance), None, None)
+
+
+# --- Цена в сомах ------------------------------------------------------------
+# price_som для фильтров и сортировки; при смене курса — пакетный пересчёт (см. exchange.py).
+
+@receiver(pre_save, sender=Service)
+def normalize_service_price(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'price', 'currency'} & set(update_fields):
+        instance.price_som = exchange.to_som(instance.price, instance.currency, exchange.get_rates())
+
+
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def renormalize_prices(sender, instance, **kwargs):
+    transaction.on_commit(partial(exchange.renormalize, [instance.currency]))
+
+
+# --- Входящие чатов -----------------------------------------------------------
+# Последнее сообщение и время активности чата у участников (см. chats.py).
+
+@receiver(post_save, sender=Message)
+def chat_message_posted(sender, instance, created, **kwargs):
+    if created:
+        chats.message_posted(instance)
+
+
+@receiver(post_delete, sender=Message)
+def chat_message_removed(sender, instance, **kwargs):
+    chats.message_removed(instance.chat_id)
+
+
+# --- События в реальном времени -----------------------------------------------
+# Новые сообщения и уведомления уходят подключённым клиентам после коммита (см. realtime.py).
+
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(realtime.message_created, instance))
+
 
+@receiver(post_save, sender=Notification)
+def publish_notification(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(realtime.notification_created, instance))
@@ -0,0 +1,221 @@
+"""
+Похожие услуги: top-k соседей каждой услуги в таблице SimilarService.
+
+score(a, b) = SUBCATEGORY_WEIGHT · Jaccard(подкатегории a, подкатегории b)
+            + TEXT_WEIGHT · cos(TF-IDF заголовка и описания)
+            + CATEGORY_WEIGHT, если категория совпадает.
+
+Текст нормализуется так же, как для поиска (search.normalize), слова
+заголовка считаются TITLE_REPEAT раз. Кандидатов ищем по обратным спискам
+(общее слово или подкатегория), а не перебором всех пар; слишком частые
+слова (больше MAX_DF_RATIO услуг) в кандидаты не ведут — их вес всё равно мал.
+
+Полный пересчёт — команда build_similar_services. При изменении услуги
+(signals.py) её id после коммита попадает в буфер процесса (ProcessBuffer),
+и фоновый поток раз в FLUSH_INTERVAL секунд одним update_similar пересчитывает
+соседей всех накопленных услуг и списки тех, куда они могли войти или где
+их оценка устарела. Корпус живёт в памяти процесса (ProcessIndex): update_similar
+читает из базы и пересчитывает векторы только изменённых услуг, а целиком
+корпус пересобирается в фоне раз в CORPUS_REBUILD_INTERVAL секунд (тогда же
+обновляется IDF).
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Min
+
+from .buffers import ProcessBuffer
+from .indexes import ProcessIndex
+from .models import Service, SimilarService
+from .search import tokenize, stem
+
+TOP_K = 10
+SUBCATEGORY_WEIGHT = 0.5
+TEXT_WEIGHT = 0.4
+CATEGORY_WEIGHT = 0.1
+TITLE_REPEAT = 2
+MAX_DF_RATIO = 0.5
+
+FLUSH_INTERVAL = 30
+FLUSH_SIZE = 500
+CORPUS_REBUILD_INTERVAL = 60 * 60
+
+
+def _terms(title, description):
+    terms = Counter()
+    for token in tokenize(title):
+        terms[stem(token)] += TITLE_REPEAT
+    for token in tokenize(description):
+        terms[stem(token)] += 1
+    return terms
+
+
+class Corpus:
+    """
+    Векторы TF-IDF, подкатегории и категории всех услуг с обратными списками.
+    IDF и список слишком частых слов считаются при полной сборке; apply()
+    пересчитывает по ним только изменённые услуги.
+    """
+
+    def __init__(self, rows, subcategories):
+        self.category = {}
+        self.subcategories = defaultdict(frozenset)
+        self.vectors = {}
+        self.term_postings = defaultdict(dict)
+        self.subcategory_postings = defaultdict(set)
+        terms = {row['id']: (row['category_id'], _terms(row['title'], row['description'])) for row in rows}
+        self.total = len(terms)
+        df = Counter(term for _, counts in terms.values() for term in counts)
+        self.idf = {term: math.log((1 + self.total) / (1 + count)) + 1 for term, count in df.items()}
+        self.frequent = {term for term, count in df.items() if count > max(1, self.total * MAX_DF_RATIO)}
+        for service_id, (category_id, counts) in terms.items():
+            self._add(service_id, category_id, counts, subcategories.get(service_id, ()))
+
+    @classmethod
+    def load(cls):
+        return cls(*_load(None))
+
+    def _add(self, service_id, category_id, counts, subcategories):
+        # Слово, которого не было при сборке, считается самым редким.
+        rare = math.log(1 + self.total) + 1
+        vector = {term: (1 + math.log(count)) * self.idf.get(term, rare) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vector = {term: weight / norm for term, weight in vector.items()}
+        self.category[service_id] = category_id
+        self.vectors[service_id] = vector
+        for term, weight in vector.items():
+            if term not in self.frequent:
+                self.term_postings[term][service_id] = weight
+        if subcategories:
+            self.subcategories[service_id] = frozenset(subcategories)
+            for subcategory_id in subcategories:
+                self.subcategory_postings[subcategory_id].add(service_id)
+
+    def _remove(self, service_id):
+        for term in self.vectors.pop(service_id, ()):
+            self.term_postings.get(term, {}).pop(service_id, None)
+        for subcategory_id in self.subcategories.pop(service_id, ()):
+            self.subcategory_postings[subcategory_id].discard(service_id)
+        self.category.pop(service_id, None)
+
+    def apply(self, service_ids, rows, subcategories):
+        """Заменяет данные услуг service_ids текущими строками rows; услуг без строки больше нет."""
+        for service_id in service_ids:
+            self._remove(service_id)
+        for row in rows:
+            self._add(row['id'], row['category_id'], _terms(row['title'], row['description']),
+                      subcategories.get(row['id'], ()))
+
+    def __contains__(self, service_id):
+        return service_id in self.vectors
+
+    def scores(self, service_id):
+        """{кандидат: score} для всех услуг, у которых есть общее слово или подкатегория."""
+        dots = defaultdict(float)
+        for term, weight in self.vectors[service_id].items():
+            for other, other_weight in self.term_postings.get(term, {}).items():
+                dots[other] += weight * other_weight
+        own = self.subcategories[service_id]
+        for subcategory_id in own:
+            for other in self.subcategory_postings[subcategory_id]:
+                dots.setdefault(other, 0.0)
+        dots.pop(service_id, None)
+
+        category = self.category[service_id]
+        scores = {}
+        for other, dot in dots.items():
+            theirs = self.subcategories[other]
+            union = len(own | theirs)
+            jaccard = len(own & theirs) / union if union else 0.0
+            score = SUBCATEGORY_WEIGHT * jaccard + TEXT_WEIGHT * dot
+            if category is not None and category == self.category[other]:
+                score += CATEGORY_WEIGHT
+            if score > 0:
+                scores[other] = score
+        return scores
+
+    def neighbours(self, service_id, k=TOP_K):
+        return heapq.nlargest(k, self.scores(service_id).items(), key=lambda item: (item[1], -item[0]))
+
+
+def _load(service_ids):
+    """(строки услуг, {услуга: подкатегории}) — всех или только service_ids."""
+    rows = Service.objects.values('id', 'title', 'description', 'category_id')
+    links = Service.subcategories.through.objects.values_list('service_id', 'subcategory_id')
+    if service_ids is not None:
+        rows = rows.filter(pk__in=service_ids)
+        links = links.filter(service_id__in=service_ids)
+    subcategories = defaultdict(set)
+    for service_id, subcategory_id in links:
+        subcategories[service_id].add(subcategory_id)
+    return list(rows), subcategories
+
+
+def _rows(corpus, service_ids, k):
+    return [
+        SimilarService(service_id=service_id, neighbour_id=neighbour, score=score, rank=rank)
+        for service_id in service_ids if service_id in corpus
+        for rank, (neighbour, score) in enumerate(corpus.neighbours(service_id, k))
+    ]
+
+
+def build_similar(k=TOP_K):
+    """Полный пересчёт таблицы; возвращает число строк."""
+    corpus = Corpus.load()
+    rows = _rows(corpus, list(corpus.vectors), k)
+    with transaction.atomic():
+        SimilarService.objects.all().delete()
+        SimilarService.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def update_similar(service_ids, k=TOP_K):
+    """
+    Пересчитывает соседей изменённых услуг и списки, которые от них зависят:
+    где изменённая услуга уже была (оценка устарела) и куда она теперь проходит
+    по оценке (лучше k-го соседа или список короче k).
+    """
+    service_ids = set(service_ids)
+    if not service_ids:
+        return
+    changed, subcategories = _load(service_ids)
+    _corpus.get()
+    _corpus.update(lambda corpus: corpus.apply(service_ids, changed, subcategories))
+    corpus = _corpus.current
+    affected = set(
+        SimilarService.objects.filter(neighbour__in=service_ids).values_list('service_id', flat=True)
+    )
+    candidates = defaultdict(float)
+    for service_id in service_ids:
+        if service_id in corpus:
+            for other, score in corpus.scores(service_id).items():
+                candidates[other] = max(candidates[other], score)
+    thresholds = {
+        row['service']: (row['size'], row['lowest'])
+        for row in SimilarService.objects.filter(service__in=list(candidates))
+        .values('service').annotate(size=Count('id'), lowest=Min('score'))
+    }
+    for other, score in candidates.items():
+        size, lowest = thresholds.get(other, (0, 0.0))
+        if size < k or score > lowest:
+            affected.add(other)
+    affected |= service_ids
+    rows = _rows(corpus, affected, k)
+    with transaction.atomic():
+        SimilarService.objects.filter(service__in=affected).delete()
+        SimilarService.objects.bulk_create(rows, batch_size=1000)
+
+
+_corpus = ProcessIndex(Corpus.load, CORPUS_REBUILD_INTERVAL)
+_buffer = ProcessBuffer(update_similar, FLUSH_INTERVAL, FLUSH_SIZE, merge=lambda first, repeated: first)
+
+
+def schedule_update(service_ids):
+    for service_id in service_ids:
+        _buffer.add(service_id, True)
+
+
+def flush():
+    _buffer.flush()
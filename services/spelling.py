@@ -0,0 +1,115 @@
+"""
+Исправление опечаток в поисковых запросах ("возможно, вы имели в виду").
+
+Словарь собирается из слов в названиях услуг, подкатегорий и частых поисковых
+запросов. Кандидаты ищутся методом symmetric delete: для каждого слова словаря
+заранее построены все варианты с удалением до MAX_EDIT_DISTANCE букв из первых
+PREFIX_LENGTH символов, поэтому поиск — несколько обращений к словарю и проверка
+расстояния Дамерау–Левенштейна у найденных кандидатов. Размер словаря ограничен
+VOCABULARY_MAX_WORDS самыми частыми словами.
+"""
+from collections import Counter
+
+from .indexes import ProcessIndex
+from .models import Service, SubCategory
+from .search import fold, tokenize
+from .search_stats import top_queries
+
+VOCABULARY_MAX_WORDS = 10000
+VOCABULARY_MAX_QUERIES = 5000
+VOCABULARY_REBUILD_INTERVAL = 10 * 60
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 6
+MIN_WORD_LENGTH = 3
+
+
+def _edits(word, distance):
+    """Все строки, получаемые из word удалением не более distance символов."""
+    result = {word}
+    layer = {word}
+    for _ in range(distance):
+        layer = {item[:i] + item[i + 1:] for item in layer if len(item) > 1 for i in range(len(item))}
+        result |= layer
+    return result
+
+
+def _max_distance(word):
+    return 1 if len(word) <= 4 else MAX_EDIT_DISTANCE
+
+
+def edit_distance(a, b, limit):
+    """Расстояние Дамерау–Левенштейна (OSA); при превышении limit возвращает limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SpellingIndex:
+    def __init__(self, frequencies):
+        self.frequencies = frequencies
+        self.deletes = {}
+        for word in frequencies:
+            for variant in _edits(word[:PREFIX_LENGTH], _max_distance(word)):
+                self.deletes.setdefault(variant, []).append(word)
+
+    def correct_word(self, word):
+        if word in self.frequencies or len(word) < MIN_WORD_LENGTH or not word.isalpha():
+            return word
+        limit = _max_distance(word)
+        candidates = set()
+        for variant in _edits(word[:PREFIX_LENGTH], limit):
+            candidates.update(self.deletes.get(variant, ()))
+        best, best_key = word, None
+        for candidate in candidates:
+            distance = edit_distance(word, candidate, limit)
+            if distance > limit:
+                continue
+            key = (distance, -self.frequencies[candidate])
+            if best_key is None or key < best_key:
+                best, best_key = candidate, key
+        return best
+
+    def correct(self, query):
+        words = tokenize(query)
+        corrected = [self.correct_word(word) for word in words]
+        if corrected == words:
+            return None
+        return ' '.join(corrected)
+
+
+def build_index():
+    counter = Counter()
+    for title in Service.objects.values_list('title', flat=True).iterator():
+        counter.update(tokenize(title))
+    for name in SubCategory.objects.values_list('name', flat=True):
+        counter.update(tokenize(name))
+    for query, total in top_queries(VOCABULARY_MAX_QUERIES):
+        for word in tokenize(query):
+            counter[word] += total
+    frequencies = {
+        word: total for word, total in counter.most_common(VOCABULARY_MAX_WORDS)
+        if len(word) >= MIN_WORD_LENGTH and word.isalpha()
+    }
+    return SpellingIndex(frequencies)
+
+
+_index = ProcessIndex(build_index, VOCABULARY_REBUILD_INTERVAL)
+
+
+def correct_query(query):
+    """Исправленный запрос или None, если исправлять нечего."""
+    if not fold(query).strip():
+        return None
+    return _index.get().correct(query)
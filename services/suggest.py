@@ -0,0 +1,169 @@
+"""
+Подсказки для поиска по мере ввода.
+
+Индекс живёт в памяти процесса: отсортированный массив ключей (каждая фраза
+индексируется с начала каждого своего слова) и частоты фраз. Фразы берутся
+из названий услуг, подкатегорий и SUGGEST_MAX_QUERIES самых частых поисковых
+запросов (не реже SUGGEST_MIN_QUERY_COUNT раз). Названия обновляются сигналами, а запросы попадают в индекс только
+при пересборке (top_queries) — чужие опечатки и редкие личные запросы всем
+не показываются. Раз в SUGGEST_REBUILD_INTERVAL секунд индекс полностью
+пересобирается в фоне: так процессы подхватывают чужие изменения и новые
+частые запросы. Изменения, пришедшие во время пересборки, ProcessIndex
+повторяет на новой версии перед подменой.
+"""
+import heapq
+import threading
+from bisect import bisect_left, insort
+from itertools import chain
+
+from .indexes import ProcessIndex
+from .models import Service, SubCategory
+from .search import fold
+from .search_stats import top_queries
+
+SUGGEST_REBUILD_INTERVAL = 10 * 60
+SUGGEST_MAX_QUERIES = 5000
+# Реже встречающиеся запросы в подсказки не попадают.
+SUGGEST_MIN_QUERY_COUNT = 3
+SUGGEST_LIMIT_MAX = 20
+# Для коротких префиксов диапазон в массиве большой, поэтому их ответы запоминаем.
+MEMO_PREFIX_LENGTH = 3
+
+
+def _phrase_key(text):
+    return ' '.join(fold(text).split())
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._keys = []        # отсортированные пары (ключ, фраза)
+        self._phrases = {}     # фраза -> [текст для показа, частота]
+        self._memo = {}
+        self._lock = threading.Lock()
+        self.service_titles = {}
+        self.subcategory_names = {}
+
+    def __len__(self):
+        return len(self._phrases)
+
+    @classmethod
+    def from_phrases(cls, items):
+        """Индекс из пар (текст, вес) для полной сборки: ключи сортируются один раз."""
+        index = cls()
+        for text, weight in items:
+            phrase = _phrase_key(text)
+            if not phrase:
+                continue
+            item = index._phrases.get(phrase)
+            if item is None:
+                index._phrases[phrase] = [text.strip(), weight]
+            else:
+                item[1] += weight
+        index._keys = sorted(entry for phrase in index._phrases for entry in cls._entries(phrase))
+        return index
+
+    @staticmethod
+    def _entries(phrase):
+        entries = [(phrase, phrase)]
+        for position, char in enumerate(phrase):
+            if char == ' ':
+                entries.append((phrase[position + 1:], phrase))
+        return entries
+
+    def _forget_memo(self, entries):
+        for key, _ in entries:
+            for length in range(1, min(len(key), MEMO_PREFIX_LENGTH) + 1):
+                self._memo.pop(key[:length], None)
+
+    def add(self, text, weight=1):
+        phrase = _phrase_key(text)
+        if not phrase:
+            return
+        with self._lock:
+            item = self._phrases.get(phrase)
+            if item is None:
+                self._phrases[phrase] = [text.strip(), weight]
+                for entry in self._entries(phrase):
+                    insort(self._keys, entry)
+            else:
+                item[1] += weight
+            self._forget_memo(self._entries(phrase))
+
+    def discard(self, text, weight=1):
+        phrase = _phrase_key(text)
+        with self._lock:
+            item = self._phrases.get(phrase)
+            if item is None:
+                return
+            item[1] -= weight
+            entries = self._entries(phrase)
+            if item[1] <= 0:
+                del self._phrases[phrase]
+                for entry in entries:
+                    position = bisect_left(self._keys, entry)
+                    if position < len(self._keys) and self._keys[position] == entry:
+                        del self._keys[position]
+            self._forget_memo(entries)
+
+    def top(self, prefix, limit=10):
+        prefix = _phrase_key(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            cached = self._memo.get(prefix)
+            if cached is None:
+                matched = set()
+                position = bisect_left(self._keys, (prefix,))
+                while position < len(self._keys) and self._keys[position][0].startswith(prefix):
+                    matched.add(self._keys[position][1])
+                    position += 1
+                cached = heapq.nlargest(
+                    SUGGEST_LIMIT_MAX, matched, key=lambda phrase: (self._phrases[phrase][1], phrase)
+                )
+                if len(prefix) <= MEMO_PREFIX_LENGTH:
+                    self._memo[prefix] = cached
+            return [self._phrases[phrase][0] for phrase in cached[:limit]]
+
+
+def build_index():
+    service_titles = dict(Service.objects.values_list('pk', 'title').iterator())
+    subcategory_names = dict(SubCategory.objects.values_list('pk', 'name'))
+    queries = [(query, total) for query, total in top_queries(SUGGEST_MAX_QUERIES) if total >= SUGGEST_MIN_QUERY_COUNT]
+    index = PrefixIndex.from_phrases(chain(
+        ((title, 1) for title in service_titles.values()),
+        ((name, 1) for name in subcategory_names.values()),
+        queries,
+    ))
+    index.service_titles = service_titles
+    index.subcategory_names = subcategory_names
+    return index
+
+
+_index = ProcessIndex(build_index, SUGGEST_REBUILD_INTERVAL)
+
+
+def suggest(prefix, limit=10):
+    return _index.get().top(prefix, min(limit, SUGGEST_LIMIT_MAX))
+
+
+# --- Инкрементальные обновления (вызываются из signals.py) -------------------
+
+def _replace(index, names, pk, text):
+    old = names.get(pk)
+    if old == text:
+        return
+    if old is not None:
+        index.discard(old)
+    if text is None:
+        names.pop(pk, None)
+    else:
+        names[pk] = text
+        index.add(text)
+
+
+def service_changed(pk, title):
+    _index.update(lambda index: _replace(index, index.service_titles, pk, title))
+
+
+def subcategory_changed(pk, name):
+    _index.update(lambda index: _replace(index, index.subcategory_names, pk, name))
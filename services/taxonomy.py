@@ -0,0 +1,45 @@
+"""
+Дерево категорий с подкатегориями для /api/categories/tree/.
+
+Готовый JSON хранится в памяти процесса вместе с версией TAXONOMY_VERSION,
+при которой он собран. На каждый запрос читается только версия из общего
+кэша; сигналы Category/SubCategory увеличивают её после коммита, и любой
+воркер пересобирает дерево на первом же запросе после изменения.
+"""
+import threading
+
+from rest_framework.renderers import JSONRenderer
+
+from .cache import TAXONOMY_VERSION, get_version
+from .models import Category, SubCategory
+from .serializers import CategorySerializer, SubCategorySerializer
+
+_lock = threading.Lock()
+# адрес сайта (ссылки на фото абсолютные) -> (версия, JSON)
+_trees = {}
+
+
+def render_tree(request):
+    context = {'request': request}
+    subcategories = {}
+    for subcategory in SubCategorySerializer(SubCategory.objects.order_by('id'), many=True, context=context).data:
+        subcategories.setdefault(subcategory['category'], []).append(subcategory)
+    tree = []
+    for category in CategorySerializer(Category.objects.order_by('id'), many=True, context=context).data:
+        category['subcategories'] = subcategories.get(category['id'], [])
+        tree.append(category)
+    return JSONRenderer().render(tree)
+
+
+def get_tree(request):
+    """(версия, JSON дерева); версия читается до сборки, чтобы изменение во время сборки не потерялось."""
+    origin = request.build_absolute_uri('/')
+    version = get_version(TAXONOMY_VERSION)
+    cached = _trees.get(origin)
+    if cached is not None and cached[0] == version:
+        return cached
+    with _lock:
+        cached = _trees.get(origin)
+        if cached is None or cached[0] != version:
+            cached = _trees[origin] = (version, render_tree(request))
+    return cached
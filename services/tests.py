@@ -1,3 +1,1093 @@
-from django.test import TestCase
+import asyncio
+import io
+import itertools
+import json
+import re
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    Category, SubCategory, Service, ServicePhoto, Review, SearchHistory, SearchQueryDaily, Favorite, ExchangeRate,
+    Chat, Message, Notification, SimilarService, UserRecommendation,
+)
+from .serializers import ServiceListSerializer, FavoriteListSerializer
+from . import (
+    counters, importer, ratings, realtime, recommendations, search_log, search_stats, similar, spelling, suggest,
+    taxonomy, views,
+)
+from .indexes import ProcessIndex
+from .websocket import CLOSE_UNAUTHORIZED, websocket_application
+from .search import index_services, search_services
+from .spelling import correct_query
+from .views import ServiceViewSet
+from users.models import Location
+
+User = get_user_model()
+
+# Строка плана SQLite вида "SCAN services_service" без "USING ... INDEX" — полный проход по таблице.
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+# Доступ к таблице: SEARCH — поиск по ключу индекса, SCAN — проход по всей таблице или всему индексу.
+TABLE_ACCESS_RE = re.compile(r'^(SCAN|SEARCH) (\w+)')
+
+
+def make_catalog():
+    executor = User.objects.create_user(email='executor@example.com', password='x', role='executor')
+    client = User.objects.create_user(email='client@example.com', password='x', role='client')
+    categories = [Category.objects.create(name=f'Категория {i}', photo='category_photos/x.png') for i in range(3)]
+    subcategories = [SubCategory.objects.create(category=c, name=f'Подкатегория {c.pk}') for c in categories]
+    experiences = [choice for choice, _ in Service.EXPERIENCE_CHOICES]
+    for i in range(30):
+        service = Service.objects.create(
+            executor=executor,
+            category=categories[i % 3],
+            title=f'Ремонт {i}',
+            description='Описание',
+            price=Decimal(100 * (i % 7)) if i % 5 else None,
+            experience=experiences[i % 4],
+            phone_number='+996700000000',
+            popularity=i % 4,
+        )
+        service.subcategories.set([subcategories[i % 3]])
+        Review.objects.create(service=service, author=client, rating=1 + i % 5, text='Отзыв')
+    SearchHistory.objects.create(user=client, query='ремонт')
+    index_services(Service.objects.values_list('pk', flat=True))
+    return categories, subcategories, client
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Планы запросов проверяются на SQLite')
+class QueryPlanTests(TestCase):
+    """
+    Прогоняет через EXPLAIN QUERY PLAN все запросы, которые делают списки API
+    при каждом сочетании фильтров и сортировок, и падает, если какая-то таблица
+    читается полным проходом вместо индекса. Таблицы из seek при фильтре должны
+    читаться поиском по индексу (SEARCH), а не проходом по всему индексу.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.subcategories, cls.client_user = make_catalog()
+        # Словарь опечаток строится один раз на процесс полным чтением таблиц — это не запрос API.
+        correct_query('ремонт')
+
+    def assertNoFullScans(self, url, params, seek=()):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        searched = set()
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            scans = [line for line in plan if FULL_SCAN_RE.match(line)]
+            self.assertFalse(scans, f'{url} {params}: полный проход {scans}\n{sql}\n' + '\n'.join(plan))
+            access = [TABLE_ACCESS_RE.match(line) for line in plan]
+            index_scans = [m.string for m in access if m and m[1] == 'SCAN' and m[2] in seek]
+            self.assertFalse(index_scans, f'{url} {params}: проход без поиска {index_scans}\n{sql}\n' + '\n'.join(plan))
+            searched |= {m[2] for m in access if m and m[1] == 'SEARCH'}
+        self.assertLessEqual(set(seek), searched, f'{url} {params}: нет поиска по индексу')
+
+    def test_service_list_filters_and_orderings(self):
+        filters = [
+            {},
+            {'category': self.categories[0].pk},
+            {'subcategory': self.subcategories[1].pk},
+            {'experience': '3-5'},
+            {'min_price': 100},
+            {'max_price': 400},
+            {'min_price': 100, 'max_price': 400},
+            {'category': self.categories[1].pk, 'min_price': 100, 'max_price': 400},
+            {'category': self.categories[2].pk, 'experience': '0-1'},
+            {'search': 'ремонт'},
+            {'lat': 42.87, 'lon': 74.59, 'radius_km': 10},
+            {'lat': 42.87, 'lon': 74.59, 'category': self.categories[0].pk},
+        ]
+        orderings = [{}, {'ordering': 'price'}, {'ordering': '-price'}, {'ordering': 'popularity'},
+                     {'ordering': '-popularity'}, {'ordering': 'created_at'}, {'ordering': '-created_at'},
+                     {'ordering': 'distance'}]
+        paginations = [{}, {'pagination': 'cursor'}]
+        # Одна граница цены пропускает большую часть каталога, и при другой сортировке SQLite
+        # идёт по индексу сортировки до LIMIT; поиск по индексу цены нужен только при сортировке по цене.
+        one_sided = [{'min_price': 100}, {'max_price': 400}]
+        for filter_params, ordering, pagination in itertools.product(filters, orderings, paginations):
+            params = {**filter_params, **ordering, **pagination}
+            by_price = ordering.get('ordering', '').lstrip('-') == 'price'
+            seek = ['services_service'] if filter_params and (filter_params not in one_sided or by_price) else []
+            with self.subTest(**params):
+                self.assertNoFullScans('/api/services/', params, seek=seek)
+
+    def test_review_list(self):
+        service = Service.objects.first()
+        for params in [{}, {'service': service.pk}, {'pagination': 'cursor'},
+                       {'service': service.pk, 'pagination': 'cursor'}]:
+            with self.subTest(**params):
+                self.assertNoFullScans('/api/reviews/', params, seek=['services_review'] if 'service' in params else [])
+
+    def test_chat_inbox(self):
+        executor = User.objects.get(email='executor@example.com')
+        for service in Service.objects.all()[:3]:
+            chat = Chat.objects.create(service=service)
+            chat.participants.set([self.client_user, executor])
+            Message.objects.create(chat=chat, sender=executor, text='Здравствуйте')
+        self.client.force_login(self.client_user)
+        for params in [{}, {'page_size': 2}]:
+            with self.subTest(**params):
+                self.assertNoFullScans('/api/chats/inbox/', params)
+        # Страница берётся из индекса (user, -last_message_at, -id) без сортировки.
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/chats/inbox/', {'page_size': 2})
+        sql = next(q['sql'] for q in ctx.captured_queries if 'ORDER BY' in q['sql'] and 'chat_participants' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_chat_sync(self):
+        executor = User.objects.get(email='executor@example.com')
+        chat = Chat.objects.create(service=Service.objects.first())
+        chat.participants.set([self.client_user, executor])
+        ids = [Message.objects.create(chat=chat, sender=executor, text=f'#{n}').pk for n in range(5)]
+        self.client.force_login(self.client_user)
+        url = f'/api/chats/{chat.pk}/messages/'
+        self.assertNoFullScans(url, {'after_id': ids[1], 'limit': 2}, seek=['services_message'])
+        data = self.client.get(url, {'after_id': ids[1], 'limit': 2}).json()
+        self.assertEqual([m['id'] for m in data['results']], ids[2:4])
+        self.assertTrue(data['has_more'])
+        data = self.client.get(url, {'before_id': ids[2]}).json()
+        self.assertEqual([m['id'] for m in data['results']], ids[:2])
+        self.assertFalse(data['has_more'])
+
+        since = self.client.get('/api/chats/updates/', {'since': '2000-01-01T00:00:00Z'}).json()
+        self.assertEqual([c['id'] for c in since['chats']], [chat.pk])
+        self.assertEqual(since['chats'][0]['last_message_id'], ids[-1])
+        data = self.client.get('/api/chats/updates/', {'since': since['server_time']}).json()
+        self.assertEqual(data['chats'], [])
+        self.assertNoFullScans('/api/chats/updates/', {'since': since['server_time']})
+
+        self.client.force_login(User.objects.create_user(email='other@example.com', password='x'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_search_history_by_user(self):
+        queryset = SearchHistory.objects.filter(user=self.client_user).order_by('-created_at')
+        plan = queryset.explain()
+        self.assertNotRegex(plan, r'(?m)SCAN \w+$', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ServicePaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog()
+        executor = User.objects.get(email='executor@example.com')
+        executor.location = Location.objects.create(name='Бишкек', latitude=42.8746, longitude=74.5698)
+        executor.save()
+
+    def test_cursor_pages_match_full_list(self):
+        near = {'lat': 42.87, 'lon': 74.59}
+        for field in ServiceViewSet.ordering_fields:
+            for ordering in [field, f'-{field}']:
+                params = {'ordering': ordering, **(near if field == 'distance' else {})}
+                with self.subTest(ordering=ordering):
+                    full = self.client.get('/api/services/', {**params, 'page_size': 100}).json()['results']
+                    walked = []
+                    url, query = '/api/services/', {**params, 'pagination': 'cursor', 'page_size': 7}
+                    while url:
+                        page = self.client.get(url, query).json()
+                        walked += page['results']
+                        url, query = page['next'], None
+                    self.assertEqual(len(full), Service.objects.count())
+                    self.assertEqual([item['id'] for item in walked], [item['id'] for item in full])
+
+
+class ReferenceServiceListSerializer(ServiceListSerializer):
+    """ServiceListSerializer без кэша фрагментов и быстрого пути — обычный обход полей DRF."""
+
+    class Meta(ServiceListSerializer.Meta):
+        list_serializer_class = serializers.ListSerializer
+
+    def to_representation(self, instance):
+        return serializers.ModelSerializer.to_representation(self, instance)
+
+    def get_is_favorited(self, obj):
+        user = getattr(self.context.get('request'), 'user', None)
+        if user is None or user.is_anonymous:
+            return False
+        return obj in user.favorites.all() or Favorite.objects.filter(user=user, service=obj).exists()
+
+
+class ReferenceFavoriteListSerializer(FavoriteListSerializer):
+    service = ReferenceServiceListSerializer(read_only=True)
+
+    class Meta(FavoriteListSerializer.Meta):
+        list_serializer_class = serializers.ListSerializer
+
+
+class FastSerializerParityTests(TestCase):
+    """Быстрый путь и кэш фрагментов должны отдавать тот же JSON, что и DRF, байт в байт."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.subcategories, cls.client_user = make_catalog()
+        executor = Service.objects.first().executor
+        executor.first_name, executor.last_name = 'Айбек', 'Исаков'
+        executor.save()
+        for index, service in enumerate(Service.objects.order_by('id')):
+            for number in range(index % 3):
+                ServicePhoto.objects.create(service=service, photo=f'service_photos/{service.pk}_{number}.jpg')
+            if index % 4 == 0:
+                service.subcategories.add(*cls.subcategories)
+            if index % 6 == 0:
+                service.category = None
+                service.save()
+            if index % 2:
+                Favorite.objects.create(user=cls.client_user, service=service)
+            if index % 5 == 0:
+                cls.client_user.favorites.add(service)
+
+    def setUp(self):
+        cache.clear()
+        self.context = {'request': RequestFactory().get('/api/services/')}
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def services(self):
+        return Service.objects.select_related('executor').prefetch_related('photos', 'subcategories').order_by('-popularity', 'id')
+
+    def test_service_list(self):
+        expected = self.render(ReferenceServiceListSerializer(self.services(), many=True, context=self.context).data)
+        for attempt in ('miss', 'hit'):
+            with self.subTest(cache=attempt):
+                actual = self.render(ServiceListSerializer(self.services(), many=True, context=self.context).data)
+                self.assertEqual(actual, expected)
+
+    def test_service_list_without_request(self):
+        expected = self.render(ReferenceServiceListSerializer(self.services(), many=True).data)
+        self.assertEqual(self.render(ServiceListSerializer(self.services(), many=True).data), expected)
+
+    def test_single_service(self):
+        for service in self.services()[:5]:
+            expected = self.render(ReferenceServiceListSerializer(service, context=self.context).data)
+            self.assertEqual(self.render(ServiceListSerializer(service, context=self.context).data), expected)
+
+    def test_favorite_list(self):
+        favorites = Favorite.objects.filter(user=self.client_user).select_related('service', 'service__category')
+        expected = self.render(ReferenceFavoriteListSerializer(favorites, many=True, context=self.context).data)
+        for attempt in ('miss', 'hit'):
+            with self.subTest(cache=attempt):
+                actual = self.render(FavoriteListSerializer(favorites, many=True, context=self.context).data)
+                self.assertEqual(actual, expected)
+
+    def test_api_page_matches_reference(self):
+        response = self.client.get('/api/services/', {'page_size': 100, 'ordering': 'created_at'})
+        services = self.services().order_by('created_at')
+        expected = ReferenceServiceListSerializer(services, many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(self.render(response.json()['results']), self.render(expected))
+
+    def test_is_favorited_one_query_per_page(self):
+        request = RequestFactory().get('/api/services/')
+        request.user = self.client_user
+        context = {'request': request}
+        expected = self.render(ReferenceServiceListSerializer(self.services(), many=True, context=context).data)
+        self.assertIn(b'"is_favorited":true', expected)
+        for attempt in ('miss', 'hit'):
+            with self.subTest(cache=attempt):
+                request._favorite_resolver = None
+                services = list(self.services())
+                with CaptureQueriesContext(connection) as ctx:
+                    actual = self.render(ServiceListSerializer(services, many=True, context=context).data)
+                self.assertEqual(actual, expected)
+                favorite_queries = [q for q in ctx.captured_queries if 'services_favorite' in q['sql']]
+                self.assertEqual(len(favorite_queries), 1)
+
+    def test_fragment_changes_with_photos(self):
+        service = self.services()[0]
+        ServiceListSerializer(service, context=self.context).data
+        ServicePhoto.objects.create(service=service, photo='service_photos/new.jpg')
+        service = self.services().get(pk=service.pk)
+        expected = self.render(ReferenceServiceListSerializer(service, context=self.context).data)
+        self.assertEqual(self.render(ServiceListSerializer(service, context=self.context).data), expected)
+
+
+class FullTextSearchTests(TestCase):
+
+    def setUp(self):
+        executor = User.objects.create_user(email='executor@example.com', password='x', role='executor')
+        self.plumber, self.electrician, self.painter = [
+            Service.objects.create(
+                executor=executor, title=title, description=description, experience='0-1',
+                phone_number='+996700000000', popularity=popularity,
+            )
+            for title, description, popularity in [
+                ('Сантехник', 'Замена труб и смесителей', 0),
+                ('Электрик', 'Проводка, розетки. Вызов сантехников тоже можно', 5),
+                ('Маляр', 'Покраска стен', 9),
+            ]
+        ]
+        index_services(Service.objects.values_list('pk', flat=True))
+
+    def search(self, query):
+        response = self.client.get('/api/services/', {'search': query})
+        return [item['id'] for item in response.json()['results']]
+
+    def test_stemming_and_title_ranking(self):
+        # Другая форма слова находит обе услуги; совпадение в заголовке выше популярности.
+        self.assertEqual(self.search('сантехники'), [self.plumber.pk, self.electrician.pk])
+        self.assertEqual(self.search('САНТЕХ'), [self.plumber.pk, self.electrician.pk])
+        self.assertEqual(self.search('труба смеситель'), [self.plumber.pk])
+        self.assertEqual(self.search('покраска труб'), [])
+
+    def test_explicit_ordering_and_removal(self):
+        response = self.client.get('/api/services/', {'search': 'сантехник', 'ordering': '-popularity'})
+        self.assertEqual([item['id'] for item in response.json()['results']], [self.electrician.pk, self.plumber.pk])
+        self.plumber.title = 'Плотник'
+        self.plumber.description = 'Мебель'
+        self.plumber.save()
+        index_services([self.plumber.pk])
+        self.painter.delete()
+        index_services([self.painter.pk])
+        self.assertEqual(self.search('сантехник'), [self.electrician.pk])
+        self.assertEqual(self.search('маляр'), [])
+
+
+class SuggestTests(TestCase):
+
+    def setUp(self):
+        make_catalog()
+        patcher = mock.patch.object(suggest, '_index', ProcessIndex(suggest.build_index, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prefix_from_any_word(self):
+        names = set(SubCategory.objects.values_list('name', flat=True))
+        response = self.client.get('/api/services/suggest/', {'q': 'подкат', 'limit': 2})
+        suggestions = response.json()['suggestions']
+        self.assertEqual(len(suggestions), 2)
+        self.assertLessEqual(set(suggestions), names)
+        self.assertEqual(suggest.suggest('5'), ['Ремонт 5'])
+        # Единственный поиск «ремонт» из журнала в подсказки не попадает.
+        self.assertNotIn('ремонт', suggest.suggest('рем', 20))
+
+    def test_bulk_build_matches_incremental(self):
+        items = [('Ремонт  квартир', 1), ('ремонт квартир', 2), ('Сантехник на дом', 1), ('  ', 1), ('Ёлка', 4)]
+        incremental = suggest.PrefixIndex()
+        for text, weight in items:
+            incremental.add(text, weight)
+        bulk = suggest.PrefixIndex.from_phrases(items)
+        self.assertEqual(bulk._keys, incremental._keys)
+        self.assertEqual(bulk._phrases, incremental._phrases)
+        self.assertEqual(bulk.top('дом'), ['Сантехник на дом'])
+
+    def test_only_frequent_queries_after_rebuild(self):
+        client = User.objects.get(email='client@example.com')
+        SearchHistory.objects.create(user=client, query='Ремонт')
+        suggest.suggest('рем')
+        # Новые запросы ждут пересборки и попадают в подсказки, только если они частые.
+        SearchHistory.objects.create(user=client, query='Ремонт')
+        SearchHistory.objects.create(user=client, query='ремонт квартир')
+        self.assertNotIn('ремонт', suggest.suggest('рем', 30))
+        suggest._index.current = None
+        self.assertEqual(suggest.suggest('рем', 1), ['ремонт'])
+        self.assertEqual(suggest.suggest('ремонт кв'), [])
+
+    def test_changes_during_rebuild_are_replayed(self):
+        suggest.suggest('рем')
+        service = Service.objects.get(title='Ремонт 7')
+
+        def build():
+            index = suggest.build_index()
+            # Пока сборка идёт, приходят изменения, которых в прочитанных данных нет.
+            with self.captureOnCommitCallbacks(execute=True):
+                service.title = 'Плиточник'
+                service.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                SubCategory.objects.create(category=Category.objects.first(), name='Электрика')
+            return index
+
+        suggest._index._build = build
+        suggest._index._rebuilding.acquire()
+        suggest._index._rebuild()
+        self.assertEqual(suggest.suggest('пли'), ['Плиточник'])
+        self.assertEqual(suggest.suggest('ремонт 7'), [])
+        self.assertEqual(suggest.suggest('элек'), ['Электрика'])
+
+
+class SpellingSuggestionTests(TestCase):
+
+    def setUp(self):
+        make_catalog()
+        SubCategory.objects.create(category=Category.objects.first(), name='Сантехника')
+        patcher = mock.patch.object(spelling, '_index', ProcessIndex(spelling.build_index, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_corrected_query_with_results(self):
+        data = self.client.get('/api/services/', {'search': 'ремнот', 'page_size': 100}).json()
+        self.assertEqual(data['suggestion'], 'ремонт')
+        self.assertEqual(len(data['results']), 30)
+
+    def test_no_suggestion_without_results(self):
+        # «сантехника» есть в словаре (подкатегория), но услуг с этим словом нет.
+        self.assertEqual(correct_query('сантехнико'), 'сантехника')
+        data = self.client.get('/api/services/', {'search': 'сантехнико'}).json()
+        self.assertIsNone(data['suggestion'])
+        self.assertEqual(data['results'], [])
+
+        data = self.client.get('/api/services/', {'search': 'ремонт'}).json()
+        self.assertIsNone(data['suggestion'])
+
+
+class GeoSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog()
+        executor = User.objects.get(email='executor@example.com')
+        executor.location = Location.objects.create(name='Бишкек', latitude=42.8746, longitude=74.5698)
+        executor.save()
+        far = User.objects.create_user(email='osh@example.com', password='x', role='executor')
+        far.location = Location.objects.create(name='Ош', latitude=40.5283, longitude=72.7985)
+        far.save()
+        cls.far_service = Service.objects.create(
+            executor=far, title='Ремонт в Оше', description='Описание', experience='0-1', phone_number='+996700000001',
+        )
+
+    def test_radius_and_distance_ordering(self):
+        response = self.client.get('/api/services/', {'lat': 42.87, 'lon': 74.59, 'radius_km': 5, 'page_size': 100})
+        results = response.json()['results']
+        self.assertEqual(len(results), 30)
+        self.assertTrue(all(0 < item['distance'] < 5 for item in results))
+
+        response = self.client.get(
+            '/api/services/', {'lat': 41.5, 'lon': 73.5, 'radius_km': 300, 'ordering': 'distance', 'page_size': 100},
+        )
+        results = response.json()['results']
+        distances = [item['distance'] for item in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(results[0]['id'], self.far_service.pk)
+
+    def test_executor_coordinates_are_not_published(self):
+        detail = self.client.get(f'/api/services/{self.far_service.pk}/').json()
+        self.assertFalse({'latitude', 'longitude', 'geo_cell', 'external_id'} & set(detail))
+        listed = self.client.get('/api/services/', {'page_size': 100}).json()['results']
+        self.assertFalse({'latitude', 'longitude', 'geo_cell'} & set(listed[0]))
+
+    def test_location_change_moves_services(self):
+        location = Location.objects.get(name='Ош')
+        location.latitude, location.longitude = 42.87, 74.59
+        location.save()
+        response = self.client.get('/api/services/', {'lat': 42.87, 'lon': 74.59, 'radius_km': 1, 'page_size': 100})
+        self.assertIn(self.far_service.pk, [item['id'] for item in response.json()['results']])
+
+
+class RatingAggregationTests(TestCase):
+
+    def assertRating(self, service, average, histogram):
+        service.refresh_from_db()
+        self.assertAlmostEqual(service.average_rating, average)
+        self.assertEqual(service.review_count, sum(histogram.values()))
+        self.assertEqual(
+            {rating: getattr(service, f'rating_{rating}') for rating in ratings.RATINGS},
+            {rating: histogram.get(rating, 0) for rating in ratings.RATINGS},
+        )
+
+    def test_review_create_update_move_delete(self):
+        make_catalog()
+        author = User.objects.get(email='client@example.com')
+        first, second = [
+            Service.objects.create(
+                executor=User.objects.get(email='executor@example.com'), title=f'Без отзывов {n}',
+                description='Описание', experience='0-1', phone_number='+996700000000',
+            )
+            for n in range(2)
+        ]
+        high = Review.objects.create(service=first, author=author, rating=5, text='Отлично')
+        Review.objects.create(service=first, author=author, rating=2, text='Так себе')
+        self.assertRating(first, 3.5, {5: 1, 2: 1})
+
+        high.rating = 1
+        high.save()
+        self.assertRating(first, 1.5, {1: 1, 2: 1})
+
+        high.service = second
+        high.save()
+        self.assertRating(first, 2.0, {2: 1})
+        self.assertRating(second, 1.0, {1: 1})
+
+        Review.objects.filter(service=first).get().delete()
+        self.assertRating(first, 0.0, {})
+        self.assertEqual(ratings.reconcile(Service, Review), [])
+
+    def test_reconcile_fixes_drift(self):
+        make_catalog()
+        service = Service.objects.first()
+        # Массовое обновление в обход сигналов.
+        Review.objects.filter(service=service).update(rating=5)
+        drift = ratings.reconcile(Service, Review)
+        self.assertEqual([service_id for service_id, _, _ in drift], [service.pk])
+        self.assertRating(service, 5.0, {5: service.review_count})
+        self.assertEqual(ratings.reconcile(Service, Review), [])
+
+
+class ImporterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, cls.subcategories, _ = make_catalog()
+
+    def setUp(self):
+        patcher = mock.patch.object(similar, '_corpus', ProcessIndex(similar.Corpus.load, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ndjson(self, *records):
+        return io.BytesIO('\n'.join(r if isinstance(r, str) else json.dumps(r) for r in records).encode())
+
+    def service(self, external_id, **fields):
+        return {
+            'type': 'service', 'external_id': external_id, 'executor_email': 'executor@example.com',
+            'title': f'Плиточник {external_id}', 'description': 'Укладка плитки', 'category': self.categories[0].pk,
+            'subcategories': [self.subcategories[0].pk], 'price': '500', 'experience': '1-2',
+            'phone_number': '+996700000000', **fields,
+        }
+
+    def test_ndjson_import_with_errors_and_dates(self):
+        report = importer.import_stream(self.ndjson(
+            self.service('a1', created_at='2020-05-01T10:00:00+06:00'),
+            self.service('a2', experience='бесконечность'),
+            '{не json',
+            {'type': 'review', 'service_external_id': 'a1', 'author_email': 'client@example.com',
+             'rating': 4, 'text': 'Хорошо', 'created_at': '2021-01-02T03:04:05Z'},
+            {'type': 'review', 'service_external_id': 'нет-такой', 'author_email': 'client@example.com', 'rating': 5},
+        ), chunk_size=2)
+        self.assertEqual((report['services'], report['reviews'], report['error_count']), (1, 1, 3))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3, 5])
+
+        service = Service.objects.get(external_id='a1')
+        self.assertEqual(service.created_at, datetime(2020, 5, 1, 4, tzinfo=dt_timezone.utc))
+        review = service.reviews.get()
+        self.assertEqual(review.created_at, datetime(2021, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc))
+        self.assertEqual((service.review_count, service.average_rating), (1, 4.0))
+        self.assertEqual(list(service.subcategories.all()), [self.subcategories[0]])
+        self.assertIn(service, search_services(Service.objects.all(), 'плиточник'))
+
+    def test_csv_import(self):
+        stream = io.BytesIO(
+            'external_id,executor_email,title,experience,phone_number,subcategories,price,currency\n'
+            f'c1,executor@example.com,Сварщик,0-1,+996700000000,{self.subcategories[1].pk},10,USD\n'
+            'c2,nobody@example.com,Сварщик,0-1,+996700000000,,,\n'.encode()
+        )
+        report = importer.import_stream(stream, 'csv', 'service')
+        self.assertEqual((report['services'], report['error_count']), (1, 1))
+        self.assertEqual(report['errors'][0]['line'], 3)
+        self.assertEqual(Service.objects.get(external_id='c1').currency, 'USD')
+
+    def test_failure_midway_refreshes_committed_chunks(self):
+        def records():
+            for n in range(3):
+                yield n + 1, self.service(f'f{n}')
+            raise RuntimeError('обрыв загрузки')
+
+        with self.assertRaises(RuntimeError):
+            importer.Importer(chunk_size=2).run(records())
+        committed = Service.objects.filter(external_id__in=['f0', 'f1'])
+        self.assertEqual(committed.count(), 2)
+        self.assertFalse(Service.objects.filter(external_id='f2').exists())
+        imported = Service.objects.filter(external_id__isnull=False)
+        self.assertEqual(set(search_services(imported, 'плиточник')), set(committed))
+
+
+class PriceNormalizationTests(TestCase):
+
+    def test_price_filter_and_rate_change(self):
+        make_catalog()
+        executor = User.objects.get(email='executor@example.com')
+        service = Service.objects.create(
+            executor=executor, title='Консультация', description='Описание', experience='0-1',
+            phone_number='+996700000000', price=Decimal(10), currency='USD',
+        )
+        # Стартовый курс из миграции: без update_exchange_rates цена уже в сомах.
+        self.assertEqual(service.price_som, Decimal('874.50'))
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.update_or_create(currency='USD', defaults={'rate': Decimal(80)})
+        service.refresh_from_db()
+        self.assertEqual(service.price_som, Decimal(800))
+
+        def found(params):
+            response = self.client.get('/api/services/', {**params, 'page_size': 100})
+            return {item['id'] for item in response.json()['results']}
+
+        self.assertIn(service.pk, found({'min_price': 700, 'max_price': 900}))
+        detail = self.client.get(f'/api/services/{service.pk}/')
+        rate = ExchangeRate.objects.get(currency='USD')
+        rate.rate = Decimal(100)
+        with self.captureOnCommitCallbacks(execute=True):
+            rate.save()
+        # Новая цена в сомах меняет ETag карточки: клиент не получит 304 со старой ценой.
+        response = self.client.get(f'/api/services/{service.pk}/', HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(service.pk, found({'min_price': 700, 'max_price': 900}))
+        self.assertIn(service.pk, found({'min_price': 1000, 'max_price': 1000}))
+
+    def test_malformed_rates_response(self):
+        with mock.patch('services.exchange.urlopen', mock.mock_open(read_data=b'<CurrencyRates>')):
+            with self.assertRaisesMessage(CommandError, 'Не удалось получить курсы'):
+                call_command('update_exchange_rates')
+
+
+class FacetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.categories, self.subcategories, _ = make_catalog()
+
+    def facets(self, **params):
+        response = self.client.get('/api/services/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_exclude_own_filter(self):
+        first = self.categories[0]
+        data = self.facets(category=first.pk, search='ремонт')
+        self.assertEqual(data['total'], 10)
+        # Фасет категорий не учитывает фильтр по категории, остальные — учитывают.
+        self.assertEqual([row['count'] for row in data['categories']], [10, 10, 10])
+        self.assertEqual([(row['id'], row['count']) for row in data['subcategories']], [(self.subcategories[0].pk, 10)])
+        experiences = [choice for choice, _ in Service.EXPERIENCE_CHOICES]
+        self.assertEqual(
+            [(row['value'], row['count']) for row in data['experience']],
+            sorted(zip(experiences, [3, 2, 2, 3])),
+        )
+        self.assertEqual([row['count'] for row in data['price_ranges']], [5, 3, 0, 0, 0, 2])
+
+        data = self.facets(category=first.pk, min_price=500)
+        self.assertEqual(data['total'], 3)
+        self.assertEqual([row['count'] for row in data['price_ranges']], [5, 3, 0, 0, 0, 2])
+        self.assertEqual(self.client.get('/api/services/facets/', {'category': 'abc'}).status_code, 400)
+
+    def test_match_list_with_geo_and_corrected_search(self):
+        executor = User.objects.get(email='executor@example.com')
+        executor.location = Location.objects.create(name='Бишкек', latitude=42.8746, longitude=74.5698)
+        executor.save()
+        far = User.objects.create_user(email='osh@example.com', password='x', role='executor')
+        far.location = Location.objects.create(name='Ош', latitude=40.5283, longitude=72.7985)
+        far.save()
+        Service.objects.create(
+            executor=far, category=self.categories[0], title='Ремонт в Оше', description='Описание',
+            experience='0-1', phone_number='+996700000001',
+        )
+        index_services(Service.objects.values_list('pk', flat=True))
+        patcher = mock.patch.object(spelling, '_index', ProcessIndex(spelling.build_index, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        for params in [{'lat': 42.87, 'lon': 74.59, 'radius_km': 5}, {'search': 'ремнот'}, {'search': 'ремнот в оше'}]:
+            listed = self.client.get('/api/services/', {**params, 'page_size': 100}).json()['results']
+            data = self.facets(**params)
+            self.assertEqual(data['total'], len(listed), params)
+            self.assertEqual(sum(row['count'] for row in data['categories']), len(listed), params)
+        self.assertEqual(self.facets(lat=42.87, lon=74.59, radius_km=5)['total'], 30)
+
+    def test_catalog_change_invalidates_cache(self):
+        self.assertEqual(self.facets(category=self.categories[0].pk)['total'], 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(
+                executor=User.objects.get(email='executor@example.com'), category=self.categories[0],
+                title='Новая', description='Описание', experience='0-1', phone_number='+996700000000',
+            )
+        self.assertEqual(self.facets(category=self.categories[0].pk)['total'], 11)
+
+
+class CategoryTreeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.categories, self.subcategories, _ = make_catalog()
+        patcher = mock.patch.object(taxonomy, '_trees', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tree_served_from_memory_until_change(self):
+        response = self.client.get('/api/categories/tree/')
+        tree = response.json()
+        self.assertEqual([item['id'] for item in tree], [category.pk for category in self.categories])
+        self.assertEqual(
+            [[sub['id'] for sub in item['subcategories']] for item in tree],
+            [[subcategory.pk] for subcategory in self.subcategories],
+        )
+        self.assertEqual(self.client.get('/api/categories/tree/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/categories/tree/').content, response.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SubCategory.objects.create(category=self.categories[0], name='Новая')
+        changed = self.client.get('/api/categories/tree/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([sub['name'] for sub in changed.json()[0]['subcategories']][-1], 'Новая')
+
+
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        executor = User.objects.create_user(email='executor@example.com', password='x', role='executor')
+        self.services = [
+            Service.objects.create(
+                executor=executor, title=f'Услуга {i}', description='Описание', experience='0-1',
+                phone_number='+996700000000', popularity=10 if i == 4 else 0,
+            )
+            for i in range(5)
+        ]
+        s1, s2, s3 = self.services[:3]
+        self.users = [
+            User.objects.create_user(email=f'client{i}@example.com', password='x', role='client') for i in range(3)
+        ]
+        for user, chosen in zip(self.users, [[s1, s2], [s1, s2, s3], [s1]]):
+            for service in chosen:
+                Favorite.objects.create(user=user, service=service)
+
+    def recommended(self, **params):
+        return [item['id'] for item in self.client.get('/api/services/recommended/', params).json()]
+
+    def test_co_occurrence_after_rebuild(self):
+        s1, s2, s3, s4, popular = self.services
+        self.client.force_login(self.users[2])
+        # До пересчёта — только популярные.
+        self.assertEqual(self.recommended()[0], popular.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recommendations.build_recommendations()
+        # s2 выбирали вместе с s1 двое, s3 — один; уже выбранную s1 не советуем.
+        self.assertEqual(self.recommended()[:3], [s2.pk, s3.pk, popular.pk])
+        self.assertEqual(self.recommended(service=s1.pk)[:3], [s2.pk, s3.pk, popular.pk])
+        self.assertEqual(self.recommended(service=s4.pk)[0], popular.pk)
+        self.assertFalse(UserRecommendation.objects.filter(user=self.users[2], service=s1).exists())
+
+
+class SimilarServicesTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(similar, '_corpus', ProcessIndex(similar.Corpus.load, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def neighbours(self, service):
+        rows = SimilarService.objects.filter(service=service).order_by('rank')
+        return list(rows.values_list('neighbour_id', flat=True))
+
+    def test_edit_schedules_one_background_update(self):
+        with mock.patch.object(similar._buffer, '_start'):
+            with self.captureOnCommitCallbacks() as callbacks, transaction.atomic():
+                categories, subcategories, _ = make_catalog()
+                service = Service.objects.first()
+                service.title = 'Ремонт квартир'
+                service.save()
+                service.subcategories.set([subcategories[1]])
+            scheduled = [c for c in callbacks if getattr(c, 'func', None) is similar.schedule_update]
+            self.assertEqual(len(scheduled), 1)
+            self.assertIn(service.pk, scheduled[0].keywords['service_ids'])
+            scheduled[0]()
+            self.assertFalse(SimilarService.objects.exists())
+            similar.flush()
+        neighbours = SimilarService.objects.filter(service=service).values_list('neighbour_id', flat=True)
+        self.assertEqual(len(neighbours), similar.TOP_K)
+        same_subcategory = Service.objects.filter(subcategories=subcategories[1]).values_list('pk', flat=True)
+        self.assertTrue(set(same_subcategory) & set(neighbours))
+
+    def test_updates_patch_cached_corpus(self):
+        make_catalog()
+        plumber, painter, removed = Service.objects.order_by('pk')[:3]
+        shared = set(plumber.subcategories.values_list('pk', flat=True))
+        plumber.title, plumber.description = 'Сантехник', 'Замена труб и смесителей'
+        plumber.save()
+        similar.update_similar([plumber.pk])
+        with mock.patch.object(similar.Corpus, 'load') as load:
+            painter.title, painter.description = 'Сантехник на дом', 'Замена смесителей'
+            painter.save()
+            painter.subcategories.set(shared)
+            removed.delete()
+            similar.update_similar([painter.pk, removed.pk])
+        load.assert_not_called()
+        self.assertEqual(self.neighbours(plumber)[0], painter.pk)
+        self.assertEqual(self.neighbours(painter)[0], plumber.pk)
+        self.assertNotIn(removed.pk, self.neighbours(plumber) + self.neighbours(painter))
+        corpus = similar._corpus.current
+        self.assertNotIn(removed.pk, corpus)
+        self.assertNotIn(removed.pk, {pk for postings in corpus.term_postings.values() for pk in postings})
+        self.assertEqual(corpus.subcategories[painter.pk], shared)
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories, _, cls.client_user = make_catalog()
+        cls.service = Service.objects.first()
+
+    def revalidate(self, url, etag, **extra):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag, **extra).status_code
+
+    def test_service_detail_etag(self):
+        url = f'/api/services/{self.service.pk}/'
+        anonymous = self.client.get(url)
+        self.assertEqual(self.revalidate(url, anonymous['ETag']), 304)
+        self.assertIn('no-cache', anonymous['Cache-Control'])
+
+        # У вошедшего пользователя свой ETag (в ответе is_favorited), ответ только в его кэш.
+        self.client.force_login(self.client_user)
+        personal = self.client.get(url)
+        self.assertNotEqual(personal['ETag'], anonymous['ETag'])
+        self.assertIn('private', personal['Cache-Control'])
+        self.assertEqual(self.revalidate(url, anonymous['ETag']), 200)
+        self.assertEqual(self.revalidate(url, personal['ETag']), 304)
+
+        self.client.post(f'/api/services/{self.service.pk}/add_favorite/')
+        self.assertEqual(self.revalidate(url, personal['ETag']), 200)
+
+    def test_related_change_invalidates(self):
+        url = f'/api/services/{self.service.pk}/'
+        etag = self.client.get(url)['ETag']
+        ServicePhoto.objects.create(service=self.service, photo='service_photos/x.png')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['photos']), 1)
+
+        etag = response['ETag']
+        category = self.service.category
+        category.name = 'Переименована'
+        category.save()
+        self.assertEqual(self.revalidate(url, etag), 200)
+
+    def test_list_etag(self):
+        url = '/api/categories/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag), 304)
+        self.assertEqual(self.revalidate(url + '?page=1', etag), 200)
+        Category.objects.create(name='Новая', photo='category_photos/x.png')
+        self.assertEqual(self.revalidate(url, etag), 200)
+
+
+class SparseFieldsetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog()
+
+    def test_fields_and_expand(self):
+        results = self.client.get('/api/services/', {'fields': 'id,title'}).json()['results']
+        self.assertTrue(results)
+        self.assertTrue(all(set(item) == {'id', 'title'} for item in results))
+
+        item = self.client.get('/api/services/', {'fields': 'id,category', 'expand': 'category'}).json()['results'][0]
+        self.assertEqual(set(item), {'id', 'category'})
+        self.assertEqual(item['category']['name'], Service.objects.get(pk=item['id']).category.name)
+
+        review = self.client.get(
+            '/api/reviews/', {'fields': 'id,service.title', 'expand': 'service'},
+        ).json()['results'][0]
+        self.assertEqual(set(review), {'id', 'service'})
+        self.assertEqual(set(review['service']), {'title'})
+
+    def test_unknown_fields_rejected(self):
+        for url, params, invalid in [
+            ('/api/services/', {'fields': 'id,nonexistent'}, ['nonexistent']),
+            ('/api/services/', {'fields': 'id,category.bogus', 'expand': 'category'}, ['category.bogus']),
+            ('/api/reviews/', {'fields': 'id,service.nope,rating.x', 'expand': 'service'}, ['service.nope', 'rating.x']),
+        ]:
+            with self.subTest(url=url, **params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                message = response.json()['fields'][0]
+                self.assertTrue(all(name in message for name in invalid), message)
+
+
+class ServiceCounterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_catalog()
+        self.service = Service.objects.first()
+
+    def test_views_not_counted_on_revalidation(self):
+        url = f'/api/services/{self.service.pk}/'
+        with mock.patch.object(counters, 'record') as record:
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        record.assert_called_once_with(self.service.pk, counters.VIEWS)
+
+    def test_contact_counted_once_per_visitor(self):
+        url = f'/api/services/{self.service.pk}/contact/'
+        with mock.patch.object(counters, 'record') as record:
+            statuses = [self.client.post(url).json()['status'] for _ in range(3)]
+            self.client.post(url, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(statuses, ['counted', 'already_counted', 'already_counted'])
+        self.assertEqual(record.call_count, 2)
+
+
+class SearchLogTests(TestCase):
+
+    def test_dedup_and_daily_rollup(self):
+        user = User.objects.create_user(email='client@example.com', password='x', role='client')
+        search_log.log_search(user.pk, 'Ремонт  квартир')
+        search_log.log_search(user.pk, 'ремонт квартир')
+        search_log.flush()
+        search_log.log_search(user.pk, 'РЕМОНТ квартир')
+        search_log.flush()
+        self.assertEqual(SearchHistory.objects.filter(user=user).count(), 1)
+
+        SearchHistory.objects.update(created_at=timezone.now() - timedelta(days=2))
+        SearchHistory.objects.create(user=user, query='Сантехник')
+        self.assertEqual(search_stats.rollup(retention_days=1), 2)
+        self.assertEqual(list(SearchQueryDaily.objects.values_list('query', 'count')), [('ремонт квартир', 1)])
+        self.assertEqual(list(SearchHistory.objects.values_list('query', flat=True)), ['Сантехник'])
+        self.assertEqual(search_stats.rollup(), 0)
+        self.assertEqual(dict(search_stats.top_queries(10)), {'ремонт квартир': 1, 'сантехник': 1})
+
+    def test_top_queries_merge_rollup_and_raw(self):
+        user = User.objects.create_user(email='client@example.com', password='x', role='client')
+        day = timezone.localdate() - timedelta(days=3)
+        SearchQueryDaily.objects.create(date=day, query='электрик', count=5)
+        SearchQueryDaily.objects.create(date=day, query='сантехник', count=4)
+        for query in ['Сантехник', 'сантехник ', 'САНТЕХНИК']:
+            SearchHistory.objects.create(user=user, query=query)
+        # Без отметки свёртки сырые строки читаются только за RAW_RETENTION_DAYS.
+        old = SearchHistory.objects.create(user=user, query='Электрик')
+        SearchHistory.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timedelta(days=search_stats.RAW_RETENTION_DAYS + 1),
+        )
+        with self.assertNumQueries(3):
+            self.assertEqual(search_stats.top_queries(1), [('сантехник', 7)])
+        self.assertEqual(dict(search_stats.top_queries(10)), {'сантехник': 7, 'электрик': 5})
+
+    def test_rows_keep_search_time(self):
+        user = User.objects.create_user(email='client@example.com', password='x', role='client')
+        searched_at = timezone.now() - timedelta(hours=2)
+        with mock.patch.object(search_log, 'timezone', mock.Mock(now=mock.Mock(return_value=searched_at))):
+            search_log.log_search(user.pk, 'Электрик')
+        search_log.flush()
+        self.assertEqual(SearchHistory.objects.get(user=user).created_at, searched_at)
+        # Повтор через два часа — вне DEDUP_WINDOW от первого поиска, это новая строка.
+        search_log.log_search(user.pk, 'электрик')
+        search_log.flush()
+        self.assertEqual(SearchHistory.objects.filter(user=user).count(), 2)
+
+    def test_trending_from_hourly_rollup(self):
+        user = User.objects.create_user(email='client@example.com', password='x', role='client')
+        for query, minutes_ago in [('Ремонт', 5), ('ремонт', 50), ('Сантехник', 3 * 60), ('Электрик', 3 * 24 * 60)]:
+            row = SearchHistory.objects.create(user=user, query=query)
+            SearchHistory.objects.filter(pk=row.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        self.assertEqual(search_stats.rollup_hourly(), 4)
+        self.assertEqual(search_stats.rollup_hourly(), 0)
+
+        def trending(window):
+            response = self.client.get('/api/search/trending/', {'window': window})
+            return [(item['query'], item['count']) for item in response.json()['results']]
+
+        self.assertEqual(trending('24h'), [('ремонт', 2), ('сантехник', 1)])
+        self.assertEqual(trending('7d'), [('ремонт', 2), ('сантехник', 1), ('электрик', 1)])
+        SearchHistory.objects.create(user=user, query='Электрик')
+        self.assertEqual(trending('7d')[-1], ('электрик', 1))
+        with mock.patch.object(search_stats, 'ROLLUP_LAG', timedelta(0)):
+            search_stats.rollup_hourly()
+        self.assertEqual(trending('7d'), [('ремонт', 2), ('электрик', 2), ('сантехник', 1)])
+
+
+class RealtimeTests(TestCase):
+
+    def setUp(self):
+        self.executor = User.objects.create_user(email='executor@example.com', password='x', role='executor')
+        self.client_user = User.objects.create_user(email='client@example.com', password='x', role='client')
+        self.chat = Chat.objects.create()
+        self.chat.participants.set([self.client_user, self.executor])
+
+    async def connect(self, query_string):
+        incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+        scope = {'type': 'websocket', 'path': '/ws/events/', 'query_string': query_string.encode(), 'headers': []}
+        task = asyncio.create_task(websocket_application(scope, incoming.get, outgoing.put))
+        await incoming.put({'type': 'websocket.connect'})
+        return task, incoming, outgoing
+
+    @sync_to_async
+    def post(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            message = Message.objects.create(chat=self.chat, sender=self.executor, text='Здравствуйте')
+            Notification.objects.create(user=self.client_user, type='info', message='Проверка')
+        return message
+
+    async def test_redis_listener_skips_malformed_messages(self):
+        # Без пакета redis и слушателя проверяем только разбор сообщений канала.
+        broker = realtime.RedisBroker.__new__(realtime.RedisBroker)
+        realtime.InMemoryBroker.__init__(broker)
+        async with realtime.InMemoryBroker.subscribe(broker, self.client_user.pk) as subscription:
+            with self.assertLogs('services.realtime', 'WARNING'):
+                broker._receive(b'{not json')
+                broker._receive(json.dumps({'event': {}}))
+            broker._receive(json.dumps({'users': [self.client_user.pk], 'event': {'type': 'ping'}}))
+            self.assertEqual(await subscription.get(1), {'type': 'ping'})
+
+    async def test_events_socket(self):
+        task, incoming, outgoing = await self.connect('token=invalid')
+        self.assertEqual(await outgoing.get(), {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        await task
+
+        task, incoming, outgoing = await self.connect(f'token={AccessToken.for_user(self.client_user)}')
+        self.assertEqual(await outgoing.get(), {'type': 'websocket.accept'})
+        message = await self.post()
+        events = [json.loads((await asyncio.wait_for(outgoing.get(), 1))['text']) for _ in range(2)]
+        self.assertEqual([event['type'] for event in events], ['message', 'notification'])
+        self.assertEqual(events[0]['message']['id'], message.pk)
+        self.assertEqual(events[1]['notification']['message'], 'Проверка')
+        await incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(task, 1)
+
+    async def test_long_poll(self):
+        headers = {'authorization': f'Bearer {AccessToken.for_user(self.client_user)}'}
+        response = await self.async_client.get('/api/events/poll/', {'timeout': 0.05}, headers=headers)
+        self.assertEqual(response.json()['events'], [])
+        since = response.json()['server_time']
+        self.assertEqual((await self.async_client.get('/api/events/poll/')).status_code, 401)
+
+        waiter = asyncio.create_task(self.async_client.get('/api/events/poll/', {'timeout': 5}, headers=headers))
+        await asyncio.sleep(0.1)
+        message = await self.post()
+        events = (await asyncio.wait_for(waiter, 1)).json()['events']
+        self.assertEqual(events[0], {'type': 'message', 'chat': self.chat.pk, 'message': mock.ANY})
+        self.assertEqual(events[0]['message']['id'], message.pk)
+
+        # Пропущенное между опросами отдаётся сразу, по since.
+        response = await self.async_client.get('/api/events/poll/', {'since': since, 'timeout': 5}, headers=headers)
+        self.assertEqual([event['type'] for event in response.json()['events']], ['chat', 'notification'])
+        self.assertEqual(response.json()['events'][0]['last_message_id'], message.pk)
+
+        # Событие после подписки, но до чтения базы, отдаётся один раз.
+        missed_events = views._missed_events
+
+        async def post_then_read(user, since):
+            posted.append(await self.post())
+            return await missed_events(user, since)
+
+        posted = []
+        since = response.json()['server_time']
+        with mock.patch.object(views, '_missed_events', post_then_read):
+            response = await self.async_client.get('/api/events/poll/', {'since': since}, headers=headers)
+        events = response.json()['events']
+        self.assertEqual([event['type'] for event in events], ['chat', 'notification'])
+        self.assertEqual(events[0]['last_message_id'], posted[0].pk)
@@ -1,9 +1,9 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
 from .views import (
-    CategoryViewSet, FavoriteViewSet, SimilarServicesView, SubCategoryViewSet,
+    CategoryViewSet, FavoriteViewSet, ImportView, SimilarServicesView, TrendingSearchesView, SubCategoryViewSet,
     ServiceViewSet, ReviewViewSet,
-    ChatViewSet, MessageViewSet,
+    ChatViewSet, EventPollView, MessageViewSet,
     UserSettingsViewSet
 )
 
@@ -20,4 +20,7 @@ router.register(r'favorites', FavoriteViewSet, basename='favorite')
 urlpatterns = [
     path('', include(router.urls)),
     path('similar/<int:service_id>/', SimilarServicesView.as_view(), name='similar-services'),
+    path('import/', ImportView.as_view(), name='import'),
+    path('search/trending/', TrendingSearchesView.as_view(), name='trending-searches'),
+    path('events/poll/', EventPollView.as_view(), name='events-poll'),
 ]
@@ -1,36 +1,76 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters as drf_filters, generics
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-
-from .models import Category, SubCategory, Service, SearchHistory, Review, Chat, Message, UserSettings, Favorite
+from rest_framework import generics
+from rest_framework.parsers import MultiPartParser
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.views import APIView
+from django.db.models import Prefetch
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views import View
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .models import (
+    Category, SubCategory, Service, Review, Chat, ChatParticipant, Message, Notification, UserSettings, Favorite,
+)
 from .serializers import (
     CategorySerializer, FavoriteCreateSerializer, FavoriteListSerializer, SubCategorySerializer,
     ServiceListSerializer, ServiceDetailSerializer, ServiceCreateUpdateSerializer,
     ReviewSerializer, ReviewCreateSerializer,
-    ChatSerializer, MessageSerializer, UserSettingsSerializer
+    ChatSerializer, InboxSerializer, MessageSerializer, UserSettingsSerializer
 )
 from .permissions import IsOwnerOrReadOnly
-from .pagination import StandardResultsSetPagination
-from .filters import ServiceFilter
-from django.db.models import Q
-
-class CategoryViewSet(viewsets.ModelViewSet):
+from .pagination import CursorOnlyPagination, KeysetPagination, OptionalKeysetPagination
+from .filters import ServiceFilter, ServiceGeoFilter, ServiceSearchFilter, ServiceOrderingFilter
+from .suggest import suggest as suggest_phrases, SUGGEST_LIMIT_MAX
+from .facets import get_facets
+from .fieldsets import SparseFieldsetMixin
+from .conditional import ConditionalGetMixin, make_etag
+from .taxonomy import get_tree
+from .recommendations import recommended_ids
+from .favorites import get_favorite_resolver
+from .chats import MESSAGES_PAGE_SIZE, MESSAGES_PAGE_SIZE_MAX, changed_chats, message_page
+from .realtime import LONG_POLL_TIMEOUT, LONG_POLL_TIMEOUT_MAX, get_broker, notification_event
+from .importer import FORMATS, TYPES, import_stream
+from .search_stats import TRENDING_LIMIT_MAX, TRENDING_WINDOWS, trending
+from . import counters, search_log
+
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:  # GET /categories/ и /categories/{id}/
+        if self.action in ['list', 'retrieve', 'tree']:  # GET /categories/, /categories/{id}/ и /categories/tree/
             permission_classes = [permissions.AllowAny]
         else:  # create, update, partial_update, destroy
             permission_classes = [permissions.IsAdminUser]
         return [permission() for permission in permission_classes]
 
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Все категории с вложенными подкатегориями одним ответом.
+        Отдаётся готовый JSON из памяти процесса (см. taxonomy.py), без запросов к базе.
+        """
+        version, body = get_tree(request)
+        etag = make_etag(request.build_absolute_uri('/'), version)
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
 
-class SubCategoryViewSet(viewsets.ModelViewSet):
+class SubCategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = SubCategory.objects.select_related('category').all()
     serializer_class = SubCategorySerializer
 
@@ -43,15 +83,37 @@ class SubCategoryViewSet(viewsets.ModelViewSet):
 
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
-    queryset = Service.objects.select_related('category', 'executor').prefetch_related('subcategories', 'photos')
-    filter_backends = [DjangoFilterBackend, drf_filters.SearchFilter, drf_filters.OrderingFilter]
+class ServiceViewSet(ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    # Исполнителя, фото и подкатегории для списков подгружает ServiceListSerializer — только для услуг не из кэша.
+    queryset = Service.objects.all()
+    filter_backends = [DjangoFilterBackend, ServiceGeoFilter, ServiceSearchFilter, ServiceOrderingFilter]
     filterset_class = ServiceFilter
-    search_fields = ['title', 'description']
-    ordering_fields = ['price', 'popularity', 'created_at']
+    ordering_fields = ['price', 'popularity', 'created_at', 'distance']
     ordering = ['-popularity']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    # Фото, подкатегории и профиль исполнителя сдвигают updated_at услуги (см. signals.py).
+    conditional_actions = ('retrieve',)
+    conditional_fields = ('updated_at', 'category__updated_at', 'average_rating', 'review_count', 'popularity')
+    conditional_per_user = True
+    # Задаётся для отдельных действий (contact); без него ScopedRateThrottle не ограничивает.
+    throttle_scope = None
+
+    def get_etag_extra(self, request):
+        if request.user.is_anonymous:
+            return ()
+        # Тот же резолвер потом использует сериализатор, повторного запроса не будет.
+        service_id = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        return (get_favorite_resolver(request).is_favorited(service_id),)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        related = []
+        if self.is_expanded('category'):
+            related.append('category')
+        if self.action != 'list' and self.is_requested('executor'):
+            related.append('executor')
+        return queryset.select_related(*related) if related else queryset
 
     def get_serializer_class(self):
         if self.action in ['list']:
@@ -65,11 +127,20 @@ class ServiceViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save() 
 
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        # 304 — это перепроверка кэша клиентом, а не новый просмотр.
+        if response.status_code == 200:
+            counters.record(int(kwargs['pk']), counters.VIEWS)
+        return response
+
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
         search_query = request.GET.get('search')
+        if search_query and isinstance(response.data, dict):
+            response.data['suggestion'] = getattr(request, 'search_suggestion', None)
         if search_query and request.user.is_authenticated and getattr(request.user, 'role', None) == 'client':
-            SearchHistory.objects.create(user=request.user, query=search_query)
+            search_log.log_search(request.user.pk, search_query)
         return response
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
@@ -82,31 +153,64 @@ class ServiceViewSet(viewsets.ModelViewSet):
         serializer = ServiceListSerializer(qs, many=True, context={'request': request})
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], authentication_classes=[], permission_classes=[permissions.AllowAny])
+    def suggest(self, request):
+        """
+        Подсказки по мере ввода: /services/suggest/?q=ремо&limit=10.
+        Отвечает из индекса в памяти процесса, без запросов к базе.
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 10
+        limit = max(1, min(limit, SUGGEST_LIMIT_MAX))
+        return Response({'query': query, 'suggestions': suggest_phrases(query, limit)})
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def facets(self, request):
+        """
+        Счётчики для экрана фильтров: принимает те же параметры, что и список
+        (category, subcategory, experience, min_price, max_price, lat, lon, radius_km, search).
+        """
+        return Response(get_facets(request, self))
+
     @action(detail=False, methods=['get'])
-    @method_decorator(cache_page(30)) 
     def recommended(self, request):
         """
-        Рекомендации: сначала по истории поиска, потом топ популярные, если их нет — последние 1-5 созданных.
+        Рекомендации: готовые строки из build_recommendations для пользователя
+        (или ?service=<id> — «с этой услугой также выбирают»), добитые популярными.
         """
+        try:
+            service = int(request.query_params['service'])
+        except (KeyError, ValueError):
+            service = None
         user = request.user if request.user.is_authenticated else None
-
-        if user:
-            last_search = SearchHistory.objects.filter(user=user).order_by('-created_at').first()
-            if last_search:
-                qs = self.queryset.filter(title__icontains=last_search.query)[:12]
-                if qs.exists():
-                    serializer = ServiceListSerializer(qs, many=True, context={'request': request})
-                    return Response(serializer.data)
-
-        popular_qs = self.queryset.order_by('-popularity')[:12]
-        if popular_qs.exists():
-            serializer = ServiceListSerializer(popular_qs, many=True, context={'request': request})
-            return Response(serializer.data)
-
-        last_created_qs = self.queryset.order_by('-created_at')[:5]
-        serializer = ServiceListSerializer(last_created_qs, many=True, context={'request': request})
+        ids = recommended_ids(user=user, service=service)
+        services = {obj.pk: obj for obj in self.queryset.filter(pk__in=ids)}
+        services = [services[pk] for pk in ids if pk in services]
+        serializer = ServiceListSerializer(services, many=True, context={'request': request})
         return Response(serializer.data)
-    
+
+    @action(
+        detail=True, methods=['post'], permission_classes=[permissions.AllowAny],
+        throttle_classes=[ScopedRateThrottle], throttle_scope='service_contact',
+    )
+    def contact(self, request, pk=None):
+        """
+        Нажатие «связаться» на карточке: учитывается в популярности, в базу пишется пачками.
+        Один посетитель (пользователь или IP) засчитывается раз в counters.CONTACT_WINDOW.
+        """
+        service_id = int(pk) if pk.isdigit() else None
+        if service_id is None or not Service.objects.filter(pk=service_id).exists():
+            return Response({'detail': 'Услуга не найдена.'}, status=status.HTTP_404_NOT_FOUND)
+        if request.user.is_authenticated:
+            visitor = f'user:{request.user.pk}'
+        else:
+            visitor = f'ip:{ScopedRateThrottle().get_ident(request)}'
+        counted = counters.record_once(service_id, counters.CONTACTS, visitor)
+        return Response({'status': 'counted' if counted else 'already_counted'}, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def add_favorite(self, request, pk=None):
         service = self.get_object()
@@ -126,13 +230,28 @@ class ServiceViewSet(viewsets.ModelViewSet):
 # views.py
 from django_filters.rest_framework import DjangoFilterBackend
 
-class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.select_related('author', 'service').prefetch_related('photos')
+class ReviewViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = Review.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['service']  # фильтрация по service ID
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        related = []
+        if self.is_requested('author'):
+            related.append('author')
+        if self.is_expanded('service'):
+            related.append('service')
+            if self.is_expanded('service.category'):
+                related.append('service__category')
+        if related:
+            queryset = queryset.select_related(*related)
+        if self.is_requested('photos'):
+            queryset = queryset.prefetch_related('photos')
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'create':
             return ReviewCreateSerializer
@@ -141,15 +260,102 @@ class ReviewViewSet(viewsets.ModelViewSet):
 
 
 
+SINCE_ERROR = 'Ожидается дата и время в формате ISO 8601'
+
+
+def parse_since(value):
+    # «+» часового пояса в неэкранированном query string приходит пробелом.
+    since = parse_datetime(value.replace(' ', '+'))
+    if since is not None and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
 class ChatViewSet(viewsets.ModelViewSet):
-    queryset = Chat.objects.prefetch_related('participants', 'messages')
+    # Только чаты текущего пользователя; сообщения не подгружаются (см. chats.py).
+    queryset = Chat.objects.all()
     serializer_class = ChatSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return (
+            super().get_queryset().filter(participants=self.request.user)
+            .select_related('last_message').prefetch_related('participants')
+        )
+
+    def perform_create(self, serializer):
+        chat = serializer.save()
+        chat.participants.add(self.request.user)
+
+    @action(detail=False, methods=['get'], pagination_class=CursorOnlyPagination)
+    def inbox(self, request):
+        """
+        Входящие: чаты пользователя от последней активности, с превью последнего
+        сообщения. Страницы по курсору (?cursor= из next), читаются по индексу
+        (user, -last_message_at, -id).
+        """
+        participations = (
+            ChatParticipant.objects.filter(user=request.user)
+            .select_related('chat__last_message')
+            .prefetch_related(
+                Prefetch('chat__chatparticipant_set', queryset=ChatParticipant.objects.only('chat', 'user')),
+            )
+            .order_by('-last_message_at', '-id')
+        )
+        page = self.paginate_queryset(participations)
+        return self.get_paginated_response(InboxSerializer(page, many=True, context={'request': request}).data)
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        Сообщения чата страницами по id, по возрастанию: ?after_id= — новее
+        известного, ?before_id= — старее (история), без них — последние.
+        ?limit= до MESSAGES_PAGE_SIZE_MAX; has_more — есть ли ещё в ту же сторону.
+        """
+        params = {}
+        for name in ('after_id', 'before_id', 'limit'):
+            value = request.query_params.get(name)
+            if value is not None:
+                if not value.isdigit():
+                    return Response({name: 'Ожидается целое число'}, status=status.HTTP_400_BAD_REQUEST)
+                params[name] = int(value)
+        limit = max(1, min(params.pop('limit', MESSAGES_PAGE_SIZE), MESSAGES_PAGE_SIZE_MAX))
+        if not ChatParticipant.objects.filter(chat_id=pk, user=request.user).exists():
+            raise Http404
+        messages, has_more = message_page(pk, limit=limit, **params)
+        return Response({
+            'results': MessageSerializer(messages, many=True, context={'request': request}).data,
+            'has_more': has_more,
+        })
+
+    @action(detail=False, methods=['get'])
+    def updates(self, request):
+        """
+        Что изменилось с момента ?since= (ISO-время, например server_time прошлого
+        ответа): чаты с новыми сообщениями, одним запросом по индексу «Входящих».
+        """
+        since = parse_since(request.query_params.get('since', ''))
+        if since is None:
+            return Response({'since': SINCE_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+        server_time = timezone.now()
+        chats, has_more = changed_chats(request.user, since)
+        return Response({'server_time': server_time, 'chats': chats, 'has_more': has_more})
+
 class MessageViewSet(viewsets.ModelViewSet):
-    queryset = Message.objects.select_related('sender', 'chat')
+    # Только сообщения чатов пользователя; список — по курсору с ?pagination=cursor,
+    # для синхронизации чата есть /chats/{id}/messages/.
+    queryset = Message.objects.select_related('sender')
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OptionalKeysetPagination
+
+    def get_queryset(self):
+        return super().get_queryset().filter(chat__chatparticipant__user=self.request.user)
+
+    def perform_create(self, serializer):
+        if not ChatParticipant.objects.filter(chat=serializer.validated_data['chat'], user=self.request.user).exists():
+            raise PermissionDenied('Вы не участник этого чата')
+        serializer.save(sender=self.request.user)
 
 
 class UserSettingsViewSet(viewsets.ModelViewSet):
@@ -162,13 +368,17 @@ class UserSettingsViewSet(viewsets.ModelViewSet):
 
 
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OptionalKeysetPagination
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user).select_related(
-            'service', 'service__category'
-        )
+        queryset = Favorite.objects.filter(user=self.request.user)
+        if not self.is_requested('service'):
+            return queryset
+        if self.is_expanded('service.category'):
+            return queryset.select_related('service', 'service__category')
+        return queryset.select_related('service')
 
     def get_serializer_class(self):
         if self.action in ['create']:
@@ -196,25 +406,127 @@ class FavoriteViewSet(viewsets.ModelViewSet):
 
 
 class SimilarServicesView(generics.ListAPIView):
-    serializer_class = ServiceDetailSerializer
+    """Похожие услуги из таблицы SimilarService (см. similar.py) — один запрос по индексу (service, rank)."""
+    serializer_class = ServiceListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    def get_queryset(self):
-        service_id = self.kwargs.get('service_id')
 
-        try:
-            service = Service.objects.get(id=service_id)
-        except Service.DoesNotExist:
-            return Service.objects.none()
-
-        subcategory_ids = service.subcategories.values_list('id', flat=True)
-
-        queryset = (
-            Service.objects.filter(category=service.category)
-            .filter(Q(subcategories__in=subcategory_ids))
-            .exclude(id=service.id)
-            .exclude(executor__isnull=True)
-            .distinct()
-            .order_by('-popularity', '-created_at')
+    def get_queryset(self):
+        return (
+            Service.objects.filter(neighbour_of__service=self.kwargs.get('service_id'))
+            .order_by('neighbour_of__rank')
         )
 
-        return queryset
\ No newline at end of file
+
+class ImportView(APIView):
+    """
+    Массовый импорт (см. importer.py): multipart с файлом file, format=ndjson|csv
+    и type (обязателен для CSV). Отвечает отчётом с числом записей и ошибками.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': 'Не передан файл file'}, status=status.HTTP_400_BAD_REQUEST)
+        format = request.data.get('format', 'ndjson')
+        record_type = request.data.get('type') or None
+        if format not in FORMATS or (record_type is not None and record_type not in TYPES):
+            return Response({'detail': 'Недопустимый format или type'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = import_stream(upload.file, format, record_type)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class TrendingSearchesView(APIView):
+    """
+    Популярные запросы: /search/trending/?window=1h|24h|7d&limit=10.
+    Считаются по почасовой свёртке (search_stats.py) и кэшируются до следующего её шага.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        window = request.query_params.get('window', '24h')
+        if window not in TRENDING_WINDOWS:
+            return Response(
+                {'detail': f'window: одно из {", ".join(TRENDING_WINDOWS)}'}, status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 10
+        limit = max(1, min(limit, TRENDING_LIMIT_MAX))
+        return Response({'window': window, 'results': trending(window, limit)})
+
+
+class EventPollView(View):
+    """
+    Long-poll для клиентов без WebSocket: /events/poll/?since=&timeout=.
+    Ждёт событие пользователя (как в /ws/events/) не дольше timeout секунд и
+    отдаёт его вместе с накопившимися. Ожидание — очередь подписки брокера
+    (realtime.py), без запросов к базе; сама база читается один раз в начале:
+    если с since (server_time прошлого ответа) что-то изменилось, ответ сразу.
+    Рассчитан на ASGI-сервер: там ожидающий запрос не держит поток.
+    """
+
+    async def get(self, request):
+        user = await _poll_user(request)
+        if user is None:
+            return JsonResponse({'detail': 'Учетные данные не были предоставлены.'}, status=401)
+        since = None
+        if request.GET.get('since'):
+            since = parse_since(request.GET['since'])
+            if since is None:
+                return JsonResponse({'since': SINCE_ERROR}, status=400)
+        try:
+            timeout = min(max(float(request.GET.get('timeout', LONG_POLL_TIMEOUT)), 0), LONG_POLL_TIMEOUT_MAX)
+        except ValueError:
+            return JsonResponse({'timeout': f'Ожидается число секунд до {LONG_POLL_TIMEOUT_MAX}'}, status=400)
+
+        server_time = timezone.now()
+        # Подписка до чтения базы: событие между ними не потеряется.
+        async with get_broker().subscribe(user.pk) as subscription:
+            events = await _missed_events(user, since) if since is not None else []
+            if not events:
+                event = await subscription.get(timeout)
+                events = [] if event is None else [event]
+            events += subscription.pending()
+        # Событие, пришедшее между подпиской и чтением базы, есть и там, и в очереди.
+        unique = {}
+        for event in events:
+            unique.setdefault(_event_key(event), event)
+        return JsonResponse({'server_time': server_time, 'events': list(unique.values())}, encoder=DjangoJSONEncoder)
+
+
+def _event_key(event):
+    if event['type'] == 'chat':
+        # Изменённый чат из базы покрывает событие о его последнем сообщении.
+        if event['last_message_id'] is None:
+            return ('chat', event['id'])
+        return ('message', event['last_message_id'])
+    if event['type'] == 'message':
+        return ('message', event['message']['id'])
+    return (event['type'], event[event['type']]['id'])
+
+
+@sync_to_async
+def _poll_user(request):
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    user = authenticated[0] if authenticated else request.user
+    return user if user.is_authenticated else None
+
+
+@sync_to_async
+def _missed_events(user, since):
+    chats, _ = changed_chats(user, since)
+    events = [{'type': 'chat', **chat} for chat in chats]
+    notifications = Notification.objects.filter(user=user, created_at__gt=since).select_related(
+        'related_user', 'related_chat',
+    )
+    return events + [notification_event(notification) for notification in notifications]
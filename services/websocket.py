@@ -0,0 +1,83 @@
+"""
+WebSocket /ws/events/ — события чатов и уведомлений пользователя (см. realtime.py).
+
+Клиент передаёт access-токен JWT в ?token= (браузер не умеет задавать заголовки
+WebSocket) или в заголовке Authorization: Bearer. Без валидного токена соединение
+закрывается с кодом CLOSE_UNAUTHORIZED. Сообщения от клиента игнорируются:
+отправка сообщений по-прежнему идёт через REST.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .realtime import get_broker
+
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+
+
+def _raw_token(scope):
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    if token:
+        return token[0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            scheme, _, token = value.decode().partition(' ')
+            if scheme.lower() == 'bearer' and token:
+                return token
+    return None
+
+
+@sync_to_async
+def authenticate(scope):
+    raw = _raw_token(scope)
+    if raw is None:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def _forward(subscription, send):
+    while True:
+        event = await subscription.get()
+        await send({'type': 'websocket.send', 'text': json.dumps(event, cls=DjangoJSONEncoder)})
+
+
+async def events_socket(scope, receive, send):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    user = await authenticate(scope)
+    if user is None or not user.is_active:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    await send({'type': 'websocket.accept'})
+    async with get_broker().subscribe(user.pk) as subscription:
+        forward = asyncio.create_task(_forward(subscription, send))
+        try:
+            while (await receive())['type'] != 'websocket.disconnect':
+                pass
+        finally:
+            forward.cancel()
+
+
+ROUTES = {
+    '/ws/events/': events_socket,
+}
+
+
+async def websocket_application(scope, receive, send):
+    handler = ROUTES.get(scope['path'])
+    if handler is None:
+        await receive()
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    await handler(scope, receive, send)